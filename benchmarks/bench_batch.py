@@ -0,0 +1,76 @@
+"""
+Batch throughput benchmark: runs smartplate.batch over a folder of generated meal photos against
+the offline Gemini stand-in at several concurrency levels, and reports photos per second and the
+speedup over one at a time. Each level uses fresh photos, so no estimate comes from the cache.
+
+Run from the repository root:
+    python benchmarks/bench_batch.py [--photos N] [--latency-ms MS] [--concurrency 1 4 8 16]
+
+The mock answers in parallel without a quota, so throughput here is bounded by latency and the
+concurrency flag; against the real API the rate limiter (GEMINI_RATE_LIMIT_RPM) caps it.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_photos(folder, count, seed):
+    """count distinct small JPEGs (PNG without Pillow) named meal_<i>."""
+    os.makedirs(folder)
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    for i in range(count):
+        if Image is None:
+            with open(os.path.join(folder, f"meal_{i}.png"), "wb") as f:
+                f.write(bytes.fromhex("89504e470d0a1a0a") + f"{seed}-{i}".encode()) # Distinct bytes; preprocessing passes them through
+            continue
+        out = io.BytesIO()
+        Image.new("RGB", (320, 240), ((seed * 37 + i) % 256, (i * 7) % 256, (i // 256 * 13) % 256)).save(out, format="JPEG")
+        with open(os.path.join(folder, f"meal_{i}.jpg"), "wb") as f:
+            f.write(out.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--photos", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Mock time to first byte")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    os.environ["SMARTPLATE_STORAGE"] = "memory"
+    os.environ["SMARTPLATE_CACHE_DIR"] = tempfile.mkdtemp(prefix="smartplate-bench-cache-")
+    from smartplate.batch import run_batch, scan_directory
+    from smartplate.gemini_client import GeminiClient
+    from smartplate.mock_gemini import start_mock_server
+
+    server = start_mock_server(latency_ms=args.latency_ms, seed=0)
+    client = GeminiClient(server.api_url())
+    workdir = tempfile.mkdtemp(prefix="smartplate-bench-batch-")
+    print(f"{'concurrency':>11} {'photos/s':>9} {'wall s':>8} {'speedup':>8} {'failed':>7}")
+    baseline = None
+    for run, concurrency in enumerate(args.concurrency):
+        folder = os.path.join(workdir, f"run{run}")
+        write_photos(folder, args.photos, seed=run)
+        items = scan_directory(folder, "meal", f"bench-{run}", "2026-01-01")
+        options = SimpleNamespace(concurrency=concurrency, force_refresh=False, no_log=False, plan_days=0)
+        started = time.perf_counter()
+        counts = run_batch(client, items, os.path.join(workdir, f"run{run}.jsonl"), options, log=lambda message: None)
+        wall = time.perf_counter() - started
+        rate = args.photos / wall
+        baseline = baseline or rate
+        print(f"{concurrency:>11} {rate:>9.1f} {wall:>8.2f} {rate / baseline:>7.1f}x {counts['error']:>7}")
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Shared-context caching benchmark: generates a week of per-day plans against the offline Gemini
+stand-in, once sending the full prompt for every day and once holding the shared prefix (profile,
+meal types, grocery list) as a cached context, and compares input tokens and wall time.
+
+Run from the repository root:
+    python benchmarks/bench_context_cache.py [--groceries N] [--prefill-ms-per-1k MS] [--workers N]
+
+Uncached input tokens are what each day re-sends at the full rate; the mock's prefill delay is
+charged per uncached token, so wall time shows the time-to-first-token side of the saving.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def grocery_list(n):
+    base = ("apples", "bananas", "chicken breast", "broccoli", "milk", "eggs", "spinach", "oats", "greek yogurt",
+            "salmon", "lentils", "tomatoes", "rice", "carrots", "quinoa", "feta", "chickpeas", "zucchini")
+    return ", ".join(f"{base[i % len(base)]} (pack {i // len(base) + 1})" for i in range(n))
+
+
+def run_week(client, day_strs, profile, groceries, workers, use_context):
+    from concurrent.futures import ThreadPoolExecutor
+    from smartplate.context_cache import SharedContextCache
+    from smartplate.meal_plans import build_daily_meal_plan_context, request_daily_meal_plan
+
+    meal_types = ["Breakfast", "Lunch", "Dinner", "Snack"]
+    started = time.perf_counter()
+    cached_context = None
+    if use_context:
+        cached_context = SharedContextCache(mode="on").acquire(
+            client, build_daily_meal_plan_context(profile, meal_types, groceries), uses=len(day_strs)
+        )
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(
+            lambda day_str: request_daily_meal_plan(client, day_str, profile, meal_types, groceries, True, None, cached_context),
+            day_strs
+        ))
+    elapsed = time.perf_counter() - started
+    prompt_tokens = sum(o["usage"][0] for o in outcomes)
+    cached_tokens = sum(o["cached_tokens"] for o in outcomes)
+    return {
+        "mode": "cached context" if cached_context else "full prompts",
+        "failed_days": sum(1 for o in outcomes if o["plan"] is None),
+        "prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens,
+        "uncached_tokens": prompt_tokens - cached_tokens, "wall_ms": round(elapsed * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--groceries", type=int, default=400, help="Items in the grocery list")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=7)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mock time to first byte")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40.0, help="Mock delay per 1k uncached prompt tokens")
+    args = parser.parse_args()
+
+    from smartplate.mock_gemini import start_mock_server
+    server = start_mock_server(latency_ms=args.latency_ms, prefill_ms_per_1k_tokens=args.prefill_ms_per_1k, seed=0)
+    os.environ["SMARTPLATE_STORAGE"] = "memory"
+    os.environ["SMARTPLATE_CACHE_DIR"] = tempfile.mkdtemp(prefix="smartplate-bench-cache-")
+
+    from smartplate.gemini_client import GeminiClient
+    client = GeminiClient(server.api_url())
+    profile = {"calorie_goal": 2000, "health_conditions": "type 2 diabetes", "dietary_preferences": "vegetarian", "fasting_type": "None"}
+    day_strs = [(date.today() + timedelta(days=i)).isoformat() for i in range(args.days)]
+    groceries = grocery_list(args.groceries)
+
+    rows = [run_week(client, day_strs, profile, groceries, args.workers, use_context) for use_context in (False, True)]
+    server.shutdown()
+    server.server_close()
+    print(f"{'mode':<16} {'prompt tok':>11} {'cached tok':>11} {'uncached tok':>13} {'wall ms':>9} {'failed':>7}")
+    for row in rows:
+        print(f"{row['mode']:<16} {row['prompt_tokens']:>11} {row['cached_tokens']:>11} {row['uncached_tokens']:>13} {row['wall_ms']:>9} {row['failed_days']:>7}")
+    full, cached = rows
+    if full["uncached_tokens"]:
+        print(f"input tokens re-sent at the full rate: {1 - cached['uncached_tokens'] / full['uncached_tokens']:.1%} fewer")
+
+
+if __name__ == "__main__":
+    main()
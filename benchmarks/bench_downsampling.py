@@ -0,0 +1,83 @@
+"""
+Chart downsampling benchmark: builds the trend page's line and bar figures from synthetic series
+of 1k, 10k and 100k points, with every point and capped by smartplate/downsampling.py, and reports
+the figure JSON sent to the browser, the time to build and serialize it, and whether the line
+still shows the series' highest and lowest values.
+
+Run from the repository root:
+    python benchmarks/bench_downsampling.py [--sizes 1000 10000 100000] [--max-points N]
+
+Browser render time is not measured here (it needs a browser); Plotly's drawing cost grows with
+the points per trace, so the payload and point counts are the proxy.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def series(size, seed=0):
+    """A daily-looking frame: a slow drift with noise plus a few one-day spikes and dips."""
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    sugar = 110 + np.cumsum(rng.normal(0, 0.5, size)) * 0.2 + rng.normal(0, 8, size)
+    spikes = rng.choice(size, size=max(2, size // 2000), replace=False)
+    sugar[spikes] += rng.choice([-60, 90], size=len(spikes))
+    return pd.DataFrame({
+        "Date": pd.date_range("2000-01-01", periods=size, freq="D"),
+        "Logged Sugar": sugar,
+        "Logged Carbs": rng.integers(120, 320, size).astype(float),
+    })
+
+def build(frame, max_points):
+    """(line figure JSON, bar figure JSON, line y values) as the trends page builds them; max_points None keeps every point."""
+    import plotly.express as px
+    from smartplate.downsampling import downsample_bars, downsample_line
+    line_df, bar_df = frame, frame
+    if max_points is not None:
+        line_df = downsample_line(frame, "Logged Sugar", max_points)
+        bar_df, _ = downsample_bars(frame, max_points)
+    line = px.line(line_df, x="Date", y="Logged Sugar", markers=True)
+    bars = px.bar(bar_df, x="Date", y="Logged Carbs")
+    return line.to_json(), bars.to_json(), line_df["Logged Sugar"].to_numpy()
+
+def timed(frame, max_points, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = build(frame, max_points)
+        timings.append(time.perf_counter() - started)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--max-points", type=int, default=None, help="Defaults to SMARTPLATE_CHART_MAX_POINTS")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from smartplate.downsampling import CHART_MAX_POINTS, lttb_indices
+    max_points = args.max_points or CHART_MAX_POINTS
+    build(series(100), max_points) # Warm plotly's imports and templates
+    print(f"{'points':>7} {'variant':>8} {'line KB':>8} {'bar KB':>7} {'build ms':>9} {'min/max kept':>13}")
+    for size in args.sizes:
+        frame = series(size)
+        for variant, cap in (("full", None), (f"{max_points}", max_points)):
+            (line_json, bar_json, values), seconds = timed(frame, cap, args.repeat)
+            sugar = frame["Logged Sugar"].to_numpy()
+            kept = values.max() == sugar.max() and values.min() == sugar.min()
+            print(f"{size:>7} {variant:>8} {len(line_json) / 1024:>8.1f} {len(bar_json) / 1024:>7.1f} {seconds * 1000:>9.1f} {'yes' if kept else 'no':>13}")
+        started = time.perf_counter()
+        lttb_indices(frame["Date"].to_numpy(), frame["Logged Sugar"].to_numpy(), max_points)
+        print(f"{'':>7} {'lttb':>8} {'':>8} {'':>7} {(time.perf_counter() - started) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
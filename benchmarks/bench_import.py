@@ -0,0 +1,86 @@
+"""
+Cold-start benchmark: times the first script run of SmartPlate_AI.py in a fresh interpreter, as a
+new server process serves its first session, for a page without charts and for the trends page.
+"eager" pre-imports pandas, plotly.express and smartplate.metrics_store before the run, as the app
+header used to; "lazy" is the app as it is, where only the pages that chart load them. Also
+reports the import time of those modules alone.
+
+Run from the repository root:
+    python benchmarks/bench_import.py [--repeat N]
+
+Every sample is a new subprocess with in-memory storage, so nothing is shared through sys.modules
+or the render cache; the numbers are medians. The trends page loads the same modules either way, so
+it should come out even.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "SmartPlate_AI.py")
+HEAVY_MODULES = ("pandas", "plotly.express", "smartplate.metrics_store")
+PAGES = ("Profile & Goals", "Data Visualization & Trends")
+
+# Runs in the child interpreter: argv is page, "eager"/"lazy"
+_CHILD = r"""
+import importlib, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+if sys.argv[2] == "eager":
+    for name in {modules!r}:
+        importlib.import_module(name)
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.session_state["current_page"] = sys.argv[1]
+at.run()
+assert not at.exception, [e.value for e in at.exception]
+print(json.dumps({{"ms": (time.perf_counter() - started) * 1000, "pandas": "pandas" in sys.modules}}))
+"""
+
+_IMPORT_ONLY = r"""
+import importlib, json, sys, time
+sys.path.insert(0, {root!r})
+import streamlit
+started = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+print(json.dumps({{"ms": (time.perf_counter() - started) * 1000}}))
+"""
+
+
+def _child_env():
+    env = dict(os.environ)
+    env.update(SMARTPLATE_STORAGE="memory", SMARTPLATE_JOBS_DB=":memory:",
+               SMARTPLATE_CACHE_DIR=tempfile.mkdtemp(prefix="smartplate-bench-cache-"))
+    return env
+
+def _run(code, *args):
+    out = subprocess.run([sys.executable, "-c", code, *args], capture_output=True, text=True, env=_child_env(), cwd=ROOT, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per measurement")
+    args = parser.parse_args()
+
+    child = _CHILD.format(root=ROOT, modules=HEAVY_MODULES, app=APP_PATH)
+    imports = [_run(_IMPORT_ONLY.format(root=ROOT, modules=HEAVY_MODULES))["ms"] for _ in range(args.repeat)]
+    print(f"importing {', '.join(HEAVY_MODULES)} after streamlit: {statistics.median(imports):.0f} ms")
+    print(f"{'page':<30} {'eager ms':>9} {'lazy ms':>9} {'saved':>7} {'pandas loaded (lazy)':>21}")
+    for page in PAGES:
+        eager, lazy_runs = [], []
+        for _ in range(args.repeat): # Interleaved, so drift in machine load hits both modes alike
+            eager.append(_run(child, page, "eager")["ms"])
+            lazy_runs.append(_run(child, page, "lazy"))
+        lazy = [run["ms"] for run in lazy_runs]
+        print(f"{page:<30} {statistics.median(eager):>9.0f} {statistics.median(lazy):>9.0f} "
+              f"{1 - statistics.median(lazy) / statistics.median(eager):>7.0%} {str(lazy_runs[0]['pandas']):>21}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Micro-benchmark: smartplate.json_extract.extract_json_from_string vs. the previous
+regex + find/rfind + whole-string implementation, over clean, large, fenced, truncated
+and adversarial model outputs. "scan" is the same extraction without its instrumentation
+span; "chunked" feeds the text to a JsonObjectScanner in streaming-sized chunks, as a
+streamed response would be (the legacy function can only run once the whole text is in).
+
+Run from the repository root:
+    python benchmarks/bench_json_extract.py [--repeat N] [--chunk-chars N]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartplate.json_extract import JsonObjectScanner, _extract_first, extract_json_from_string
+
+
+def legacy_extract_json_from_string(text):
+    # The implementation that used to live in SmartPlate_AI.py, kept verbatim for comparison
+    match = re.search(r'```json\s*(\{.*\})\s*```', text, re.DOTALL)
+    if match:
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError:
+            pass
+    brace_start = text.find('{')
+    brace_end = text.rfind('}')
+    if brace_start != -1 and brace_end != -1 and brace_end > brace_start:
+        json_candidate = text[brace_start : brace_end + 1]
+        try:
+            return json.loads(json_candidate)
+        except json.JSONDecodeError:
+            pass
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def make_day_plan(day, meals=4):
+    return {
+        "date": f"2025-01-{day:02d}",
+        "daily_total_calories": "1800 kcal",
+        "meal_plan": [
+            {
+                "meal_type": f"Meal {i}",
+                "dish_name": "Spiced {lentil} \"stew\" with greens",
+                "estimated_calories": "450 kcal",
+                "ingredients": ["1 cup lentils", "2 cups spinach", "1 tbsp olive oil", "1/2 onion"],
+                "instructions": "Rinse the lentils. Simmer 20 minutes; stir in spinach. Season {to taste}."
+            }
+            for i in range(meals)
+        ],
+        "daily_notes": "Drink water; keep snacks {light}."
+    }
+
+def build_cases():
+    day = json.dumps(make_day_plan(1), indent=2)
+    big = json.dumps({"days": [make_day_plan(d % 28 + 1, meals=6) for d in range(400)]})
+    return {
+        "small clean": day,
+        "large clean (~%d KB)" % (len(big) // 1024): big,
+        "fenced + prose": "Here is your plan:\n```json\n" + day + "\n```\nEnjoy your week!",
+        "trailing prose with braces": day + "\n\nTip: swap {spinach} for kale if you like } :)",
+        "leading stray brace": "Use { as you wish: " + day,
+        "truncated large": big[: len(big) // 2],
+        "adversarial unclosed fences": ("```json {\"a\": " + "x" * 50 + "\n") * 2000,
+        "adversarial stray braces": "{ " * 20000 + day,
+    }
+
+def chunked_extract(text, chunk_chars):
+    scanner = JsonObjectScanner()
+    for start in range(0, len(text), chunk_chars):
+        objects = scanner.feed(text[start:start + chunk_chars])
+        if objects:
+            return objects[0]
+    return None
+
+def best_time(func, text, repeat):
+    timer = timeit.Timer(lambda: func(text))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="timing repeats per case (best is reported)")
+    parser.add_argument("--chunk-chars", type=int, default=256, help="chunk size for the chunked scan")
+    args = parser.parse_args()
+
+    def chunked(text):
+        return chunked_extract(text, args.chunk_chars)
+
+    print(f"{'case':<32} {'legacy':>12} {'new':>12} {'scan':>12} {'chunked':>12} {'speedup':>8}  found (legacy/new/chunked)")
+    for name, text in build_cases().items():
+        legacy = best_time(legacy_extract_json_from_string, text, args.repeat)
+        new = best_time(extract_json_from_string, text, args.repeat)
+        scan = best_time(_extract_first, text, args.repeat)
+        streamed = best_time(chunked, text, args.repeat)
+        found = "/".join(str(f(text) is not None) for f in (legacy_extract_json_from_string, extract_json_from_string, chunked))
+        print(f"{name:<32} {legacy * 1e6:>10.1f}us {new * 1e6:>10.1f}us {scan * 1e6:>10.1f}us {streamed * 1e6:>10.1f}us"
+              f" {legacy / scan:>7.1f}x  {found}")
+
+if __name__ == "__main__":
+    main()
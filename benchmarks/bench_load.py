@@ -0,0 +1,400 @@
+"""
+Multi-session load test: starts SmartPlate_AI.py under `streamlit run` against the offline Gemini
+stand-in (smartplate/mock_gemini.py) and drives concurrent scripted users over the same websocket
+protocol the browser uses. Each journey opens the app, saves the profile, uploads a grocery photo
+and generates a weekly plan, logs a meal photo and the day's metrics, changes the trends range and
+asks for guidance, navigating through the sidebar; every widget change reruns the script, as in
+the browser. Each journey is a separate user (its own ?uid= in the page URL) with a year of seeded
+history, so concurrent users generate their own plans rather than sharing one.
+
+For each concurrency level it reports journeys (sessions) per second, p50/p99 latency of each
+timed step and the server's resident memory. The saturation point is the last level before adding
+users raises throughput by less than 10% or pushes a step's p99 over --p99-budget-ms. A separate
+phase keeps --hold-sessions finished sessions connected and reports the memory each one adds.
+
+Run from the repository root:
+    python benchmarks/bench_load.py [--levels 1 2 4 8 16] [--journeys 3] [--latency-ms 200] [--hold-sessions 40]
+
+The server runs with XSRF protection off so the harness can upload without a browser cookie, and
+with storage, caches and jobs in a throwaway directory. Step latency is measured at the client up
+to the end of the script run (including any st.rerun it triggers), so browser rendering is not
+included. Plans run on the server's job workers (SMARTPLATE_JOB_WORKERS).
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date
+import zlib
+from urllib.parse import urljoin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+APP_PATH = os.path.join(ROOT, "SmartPlate_AI.py")
+
+from bench_pages import percentile, sample_image_bytes, seed_history # noqa: E402
+
+STEPS = (
+    "open", "profile: save", "plan: generate", "photo: open", "photo: estimate",
+    "tracking: save", "trends: range", "guidance: open", "guidance: ask"
+)
+WIDGET_KINDS = {"button", "checkbox", "file_uploader", "number_input", "radio", "selectbox", "text_area", "text_input"}
+
+
+class Session:
+    """One browser tab: a websocket to the app, the widgets its last run rendered and the values sent back on every rerun."""
+
+    def __init__(self, base_url, user_id):
+        self.base_url = base_url
+        self.query_string = f"uid={user_id}" # The app keeps each session's user id in the URL
+        self.ws = None
+        self.session_id = None
+        self.widgets = {} # Label or user key -> widget id
+        self.disabled = set() # Ids of widgets the last run rendered disabled
+        self.states = {} # Widget id -> WidgetState, resent with every rerun like the browser does
+        self.fragments = {} # Fragment id -> auto-rerun interval in seconds (st.fragment(run_every=...))
+        self.texts = [] # Headings, markdown and alerts of the last run
+        self.errors = [] # Exceptions and st.error messages of the last run
+
+    async def connect(self):
+        import websockets
+        self.ws = await websockets.connect(self.base_url.replace("http", "ws", 1) + "/_stcore/stream", subprotocols=["streamlit"], max_size=None)
+        return await self.rerun()
+
+    async def close(self):
+        await self.ws.close()
+
+    async def _receive(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        msg = ForwardMsg()
+        msg.ParseFromString(await self.ws.recv())
+        return msg
+
+    def _element(self, element, seen):
+        from streamlit.proto.Alert_pb2 import Alert
+        kind = element.WhichOneof("type")
+        if kind in ("heading", "markdown", "alert"):
+            self.texts.append(getattr(element, kind).body)
+            if kind == "alert" and element.alert.format == Alert.ERROR:
+                self.errors.append(element.alert.body)
+        elif kind == "exception":
+            self.errors.append(element.exception.message)
+        elif kind in WIDGET_KINDS:
+            widget = getattr(element, kind)
+            seen.add(widget.id)
+            if widget.disabled:
+                self.disabled.add(widget.id)
+            self.widgets[widget.label] = widget.id
+            key = widget.id.split("-", 2)[2] # "$$ID-<hash>-<user key or None>"
+            if key != "None":
+                self.widgets[key] = widget.id
+
+    async def rerun(self, trigger=None, fragment_id=""):
+        """Sends the widget states (and a one-shot trigger) and waits for the run, and any st.rerun it causes, to finish."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        back = BackMsg()
+        back.rerun_script.query_string = self.query_string
+        back.rerun_script.widget_states.widgets.extend(self.states.values())
+        if trigger is not None:
+            back.rerun_script.widget_states.widgets.append(trigger)
+        if fragment_id:
+            back.rerun_script.fragment_id = fragment_id
+            back.rerun_script.is_auto_rerun = True
+        await self.ws.send(back.SerializeToString())
+        self.texts, self.errors, seen, fragment_run = [], [], set(), bool(fragment_id)
+        while True:
+            msg = await self._receive()
+            kind = msg.WhichOneof("type")
+            if kind == "new_session": # Every script run starts with one, including those st.rerun starts
+                self.session_id = msg.new_session.initialize.session_id or self.session_id
+                fragment_run = bool(msg.new_session.fragment_ids_this_run)
+                self.texts, self.errors, seen = [], [], set()
+                if not fragment_run:
+                    self.fragments, self.disabled = {}, set()
+            elif kind == "page_info_changed": # The app rewrote the URL, as when it did not accept our uid
+                self.query_string = msg.page_info_changed.query_string
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._element(msg.delta.new_element, seen)
+            elif kind == "auto_rerun":
+                self.fragments[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+            elif kind == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+        if not fragment_run: # Widgets that were not rendered are unmounted in the browser and no longer sent
+            self.states = {widget_id: state for widget_id, state in self.states.items() if widget_id in seen}
+        return self.texts
+
+    async def set(self, name, field, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        state = WidgetState(id=self.widgets[name])
+        setattr(state, field, value)
+        self.states[state.id] = state
+        return await self.rerun()
+
+    async def click(self, name):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        if self.widgets[name] in self.disabled: # A browser could not click it either
+            raise RuntimeError(f"{name!r} is disabled")
+        return await self.rerun(WidgetState(id=self.widgets[name], trigger_value=True))
+
+    async def upload(self, name, filename, data, mime_type):
+        """Asks for an upload URL, PUTs the file there and selects it in the file uploader."""
+        import requests
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        back = BackMsg()
+        back.file_urls_request.request_id = uuid.uuid4().hex
+        back.file_urls_request.file_names.append(filename)
+        back.file_urls_request.session_id = self.session_id
+        await self.ws.send(back.SerializeToString())
+        while True:
+            msg = await self._receive()
+            if msg.WhichOneof("type") == "file_urls_response" and msg.file_urls_response.response_id == back.file_urls_request.request_id:
+                break
+        urls = msg.file_urls_response.file_urls[0]
+        response = await asyncio.to_thread(requests.put, urljoin(self.base_url, urls.upload_url), files={"file": (filename, data, mime_type)}, timeout=60)
+        response.raise_for_status()
+        state = WidgetState(id=self.widgets[name])
+        info = state.file_uploader_state_value.uploaded_file_info.add()
+        info.name, info.size, info.file_id = filename, len(data), urls.file_id
+        info.file_urls.CopyFrom(urls)
+        self.states[state.id] = state
+        return await self.rerun()
+
+    async def poll(self, until, timeout=300):
+        """Reruns the auto-rerun fragments at their interval, as the browser does, until a run shows text containing one of until."""
+        deadline = time.monotonic() + timeout
+        while not any(marker in text for text in self.texts for marker in until):
+            if not self.fragments or time.monotonic() > deadline:
+                raise TimeoutError(f"Never showed any of {until}")
+            fragment_id, interval = next(iter(self.fragments.items()))
+            await asyncio.sleep(interval)
+            await self.rerun(fragment_id=fragment_id)
+
+
+def user_image(image, user):
+    """
+    The sample photo with a user-specific patch, so concurrent users do not share a cached or coalesced
+    call (trailing bytes would not do: preprocessing re-encodes the image). Unchanged without Pillow.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return ("photo.jpg",) + image
+    img = Image.open(io.BytesIO(image[0]))
+    seed = zlib.crc32(str(user).encode())
+    img.paste((seed % 256, seed // 256 % 256, seed // 65536 % 256), (seed % 1400, seed // 1400 % 1000, seed % 1400 + 200, seed // 1400 % 1000 + 200))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=92)
+    return "photo.jpg", out.getvalue(), "image/jpeg"
+
+def user_id(user):
+    return f"load-user-{user + 1:05d}" # user -1 is the warm-up journey
+
+async def journey(base_url, image, user, record):
+    """One scripted user; record(step, seconds, errors) is called per timed step. Returns the still connected session."""
+    session = Session(base_url, user_id(user))
+
+    async def timed(step, expected, *actions):
+        started = time.perf_counter()
+        for action in actions:
+            await action()
+        seconds = time.perf_counter() - started
+        missing = [] if any(expected in text for text in session.texts) else [f"{expected!r} not shown"]
+        record(step, seconds, session.errors + missing)
+
+    await timed("open", "1. Your Health Profile", session.connect)
+    if session.query_string != f"uid={user_id(user)}":
+        raise RuntimeError(f"The app replaced the session's user id: {session.query_string}")
+    await session.set("Daily Calorie Goal (kcal):", "double_value", 1900 + user % 400)
+    await timed("profile: save", "2. Upload Groceries", lambda: session.click("Save Profile")) # Navigates on to the plan page
+
+    await session.upload("grocery_uploader", *user_image(image, f"{user}-groceries"))
+    await session.set("plan_generation_mode", "string_value", "One request for the whole week")
+    await session.set("grocery_force_refresh", "bool_value", True) # Always a real round-trip
+    generate = "Analyze Groceries & Generate Weekly Meal Plan!"
+    until = ("6. Your Progress", "finished with some errors") # Navigates on when the plan is done
+    await timed("plan: generate", "6. Your Progress", lambda: session.click(generate), lambda: session.poll(until))
+
+    await timed("photo: open", "3. Log a Meal", lambda: session.set("Go to", "string_value", "Log Meal from Photo"))
+    await session.upload("meal_photo_uploader", *user_image(image, f"{user}-meal"))
+    await session.set("meal_photo_force_refresh", "bool_value", True)
+    await timed("photo: estimate", "4. Daily Health Tracking", lambda: session.click("Estimate Calories & Log Meals!")) # Navigates on to tracking
+    await session.set(f"calories_{date.today().isoformat()}", "double_value", 1700 + user % 500)
+    await timed("tracking: save", "5. Data Visualization", lambda: session.click(f"Log Data for {date.today().isoformat()}")) # Navigates on to the trends page
+    await timed("trends: range", "Summary for last 90 days", lambda: session.set("viz_range", "string_value", "Last 90 days"))
+
+    await timed("guidance: open", "6. Your Progress", lambda: session.set("Go to", "string_value", "Progress & AI Guidance"))
+    await session.set("Ask SmartPlate AI for advice:", "string_value", "How can I keep my blood sugar steady?")
+    await timed("guidance: ask", "SmartPlate AI's Advice!", lambda: session.click("Get Guidance"))
+    return session
+
+
+def server_rss_mb(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+async def run_level(base_url, image, users, journeys, first_user):
+    """users concurrent users, each running journeys journeys; returns wall seconds, {step: [seconds]} and failures."""
+    timings = {step: [] for step in STEPS}
+    failures = []
+
+    def record(step, seconds, errors):
+        timings[step].append(seconds)
+        if errors:
+            failures.append((step, errors[0][:120]))
+
+    async def user(index):
+        for run in range(journeys):
+            try:
+                session = await journey(base_url, image, first_user + index * journeys + run, record)
+                await session.close()
+            except Exception as e: # A widget that never appeared, a timeout: count it and keep the load going
+                failures.append(("journey", repr(e)[:120]))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(index) for index in range(users)))
+    return time.perf_counter() - started, timings, failures
+
+async def hold_sessions(base_url, image, count, first_user, pid):
+    """Runs count journeys one after another, keeping every session connected; returns (sessions, server RSS MB) samples."""
+    held = []
+    samples = [(0, server_rss_mb(pid))]
+    for i in range(count):
+        held.append(await journey(base_url, image, first_user + i, lambda step, seconds, errors: None))
+        samples.append((len(held), server_rss_mb(pid)))
+    for session in held:
+        await session.close()
+    return samples
+
+def slope(samples):
+    """Least-squares MB per session over the samples."""
+    xs, ys = [x for x, _ in samples], [y for _, y in samples]
+    x_mean, y_mean = statistics.fmean(xs), statistics.fmean(ys)
+    spread = sum((x - x_mean) ** 2 for x in xs)
+    return sum((x - x_mean) * (y - y_mean) for x, y in samples) / spread if spread else 0.0
+
+
+def start_app_server(env):
+    """Starts the app under streamlit run on a free port; returns (process, base URL) once it answers."""
+    import requests
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true", "--server.port", str(port),
+        "--server.address", "127.0.0.1", "--server.enableXsrfProtection", "false", "--server.enableCORS", "false",
+        "--browser.gatherUsageStats", "false", "--server.fileWatcherType", "none"
+    ], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(base_url + "/_stcore/health", timeout=1).ok:
+                return process, base_url
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("The app server did not start")
+
+
+async def measure(args, base_url, pid, image):
+    await journey(base_url, image, -1, lambda step, seconds, errors: None) # Warm-up: imports, first compile, connections
+    levels = []
+    next_user = 0
+    for users in args.levels:
+        wall, timings, failures = await run_level(base_url, image, users, args.journeys, next_user)
+        next_user += users * args.journeys
+        levels.append({
+            "users": users, "sessions": users * args.journeys, "wall_s": round(wall, 2),
+            "sessions_per_s": round(users * args.journeys / wall, 2), "server_rss_mb": round(server_rss_mb(pid), 1),
+            "steps": {step: {"p50_ms": round(statistics.median(values) * 1000), "p99_ms": round(percentile(values, 99) * 1000)}
+                      for step, values in timings.items() if values},
+            "failures": len(failures), "first_failure": failures[0] if failures else None,
+        })
+    memory = None
+    if args.hold_sessions:
+        samples = await hold_sessions(base_url, image, args.hold_sessions, next_user, pid)
+        warm = len(samples) // 4 # The first sessions also fill one-off caches
+        memory = {"sessions": args.hold_sessions, "start_mb": round(samples[0][1], 1), "warm_sessions": samples[warm][0],
+                  "warm_mb": round(samples[warm][1], 1), "end_mb": round(samples[-1][1], 1), "mb_per_session": round(slope(samples[warm:]), 3)}
+    return levels, memory
+
+def saturation_level(levels, p99_budget_ms):
+    for previous, level in zip(levels, levels[1:]):
+        slowest = max(step["p99_ms"] for step in level["steps"].values())
+        if level["sessions_per_s"] < previous["sessions_per_s"] * 1.1 or slowest > p99_budget_ms:
+            return previous
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Concurrent users per level")
+    parser.add_argument("--journeys", type=int, default=3, help="Journeys each user runs per level")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Mock time to first byte")
+    parser.add_argument("--chunk-delay-ms", type=float, default=2.0, help="Mock delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--p99-budget-ms", type=float, default=5000.0, help="A step slower than this at p99 counts as saturated")
+    parser.add_argument("--hold-sessions", type=int, default=40, help="Sessions kept connected for the memory phase; 0 skips it")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="smartplate-bench-load-")
+    # Set before smartplate is first imported, so the history below goes into the database the server opens
+    os.environ.update(SMARTPLATE_STORAGE="sqlite", SMARTPLATE_DB_PATH=os.path.join(workdir, "smartplate.db"), SMARTPLATE_CACHE_DIR=os.path.join(workdir, "cache"))
+    from smartplate.mock_gemini import start_mock_server
+    from smartplate.storage import get_storage
+    mock = start_mock_server(latency_ms=args.latency_ms, chunk_delay_ms=args.chunk_delay_ms, error_rate=args.error_rate, seed=0)
+    env = dict(os.environ, GEMINI_API_URL=mock.api_url())
+    for user in range(-1, sum(args.levels) * args.journeys + args.hold_sessions):
+        seed_history(get_storage(), user_id(user))
+
+    process, base_url = start_app_server(env)
+    try:
+        levels, memory = asyncio.run(measure(args, base_url, process.pid, sample_image_bytes()))
+    finally:
+        process.terminate()
+        process.wait()
+        mock.shutdown()
+        mock.server_close()
+
+    saturation = saturation_level(levels, args.p99_budget_ms)
+    if args.json:
+        print(json.dumps({"levels": levels, "saturation_users": saturation and saturation["users"], "memory": memory, "mock": mock.stats}, indent=2))
+        return
+    print(f"{'users':>5} {'sessions':>8} {'sessions/s':>10} {'RSS MB':>7} {'failed':>6}")
+    for level in levels:
+        print(f"{level['users']:>5} {level['sessions']:>8} {level['sessions_per_s']:>10} {level['server_rss_mb']:>7} {level['failures']:>6}")
+        if level["first_failure"]:
+            print(f"      first failure: {level['first_failure']}")
+    print(f"\n{'step p50 / p99 ms':<18}" + "".join(f"{str(level['users']) + ' users':>16}" for level in levels))
+    for step in STEPS:
+        cells = "".join(
+            f"{str(level['steps'][step]['p50_ms']) + ' / ' + str(level['steps'][step]['p99_ms']):>16}" if step in level["steps"] else f"{'-':>16}"
+            for level in levels
+        )
+        print(f"{step:<18}{cells}")
+    if saturation is not None:
+        print(f"\nsaturation: about {saturation['users']} concurrent users ({saturation['sessions_per_s']} sessions/s); more users only add latency")
+    else:
+        print(f"\nsaturation: not reached up to {levels[-1]['users']} concurrent users")
+    if memory is not None:
+        print(
+            f"memory: {memory['mb_per_session']} MB server RSS per connected session after the first {memory['warm_sessions']}"
+            f" ({memory['start_mb']} -> {memory['warm_mb']} -> {memory['end_mb']} MB over {memory['sessions']} sessions)"
+        )
+    print(f"mock requests: {mock.stats['requests']} {mock.stats['by_kind']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Nutrition table benchmark: ingredient lookups per second with a cold and a warm match cache, and
+the time to check a batch of generated day plans against the table (smartplate.nutrition), with
+the share of ingredients found and of meals flagged.
+
+Run from the repository root:
+    python benchmarks/bench_nutrition.py [--days N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack"]
+# Ingredient strings as models tend to write them
+PHRASINGS = ("{}", "1 cup {}", "150 g {}", "2 tbsp {}, chopped", "1/2 {}", "{} (about 100 g)", "fresh {}", "3 large {}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=1000, help="Day plans to check")
+    args = parser.parse_args()
+
+    from smartplate.mock_gemini import DISHES, _day_plan
+    from smartplate.nutrition import NutritionIndex, annotate_day_plan
+    from smartplate.records import DayPlan
+
+    started = time.perf_counter()
+    index = NutritionIndex()
+    load_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(0)
+    foods = sorted({ingredient for _, ingredients in DISHES for ingredient in ingredients} | set(index.names))
+    lookups = [rng.choice(PHRASINGS).format(food) for food in foods for _ in range(5)]
+    started = time.perf_counter()
+    found = sum(1 for text in lookups if index.resolve(text)[0] >= 0)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    for text in lookups:
+        index.resolve(text)
+    warm = time.perf_counter() - started
+
+    day_strs = [(date.today() + timedelta(days=i)).isoformat() for i in range(args.days)]
+    plans = [DayPlan.from_dict(day_str, _day_plan(rng, day_str, MEAL_TYPES, 2000)) for day_str in day_strs]
+    started = time.perf_counter()
+    estimates = [annotate_day_plan(plan, index) for plan in plans]
+    check = time.perf_counter() - started
+    meals = [meal for plan in plans for meal in plan.meals]
+
+    print(f"table: {len(index)} foods, loaded in {load_ms:.1f} ms")
+    print(f"lookups: {len(lookups)} strings, {found / len(lookups):.0%} matched, "
+          f"{len(lookups) / cold:,.0f}/s cold, {len(lookups) / warm:,.0f}/s warm")
+    print(f"plans: {len(plans)} days in {check * 1000:.0f} ms ({check / len(plans) * 1e6:.0f} us/day), "
+          f"ingredient coverage {sum(e.matched for e in estimates) / sum(e.total for e in estimates):.0%}, "
+          f"{sum(meal.flagged for meal in meals) / len(meals):.0%} of meals and "
+          f"{sum(plan.flagged for plan in plans) / len(plans):.0%} of days flagged")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+End-to-end page benchmark: drives each page of SmartPlate_AI.py through Streamlit's AppTest
+against the offline Gemini stand-in (smartplate/mock_gemini.py), with in-memory storage and a
+throwaway response cache, and reports p50/p95 wall time and peak Python memory per flow.
+
+Run from the repository root:
+    python benchmarks/bench_pages.py [--repeat N] [--latency-ms MS] [--error-rate R] [--only NAME ...]
+
+Wall time covers the interaction's script run (including any st.rerun it triggers, and for plans
+the background job until it finishes) and is measured without tracing; peak memory comes from
+one extra run under tracemalloc.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+APP_PATH = os.path.join(ROOT, "SmartPlate_AI.py")
+
+
+def sample_image_bytes():
+    """A small photo-sized JPEG; falls back to a 1x1 PNG without Pillow."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return bytes.fromhex(
+            "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+            "1f15c4890000000d49444154789c6360f8cf00000301010018dd8db00000000049454e44ae426082"
+        ), "image/png"
+    img = Image.new("RGB", (1600, 1200), (120, 180, 90))
+    for x in range(0, 1600, 40): # Some detail so the encoder has work to do
+        img.paste((200, 60 + x % 150, 40), (x, 0, x + 20, 1200))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=92)
+    return out.getvalue(), "image/jpeg"
+
+
+def _button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"No button labelled {label!r}")
+
+def _open_page(page):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.session_state["current_page"] = page
+    at.run()
+    return at
+
+
+# Each flow opens its page (untimed) and returns a callable performing the timed interaction
+def flow_profile_save(image):
+    at = _open_page("Health Profile")
+    at.number_input[0].set_value(2200)
+    at.text_input[1].set_value("vegetarian")
+    return at, _button(at, "Save Profile").click
+
+def _plan_flow(image, mode):
+    at = _open_page("Weekly Meal Plan Generation")
+    at.file_uploader(key="grocery_uploader").set_value(("groceries.jpg", image[0], image[1]))
+    at.radio(key="plan_generation_mode").set_value(mode)
+    at.checkbox(key="grocery_force_refresh").check() # Always measure a real round-trip
+    return at, _button(at, "Analyze Groceries & Generate Weekly Meal Plan!").click
+
+def flow_weekly_plan(image):
+    return _plan_flow(image, "One request for the whole week")
+
+def flow_per_day_plan(image):
+    return _plan_flow(image, "One request per day")
+
+def flow_photo_log(image):
+    at = _open_page("Log Meal from Photo")
+    at.file_uploader(key="meal_photo_uploader").set_value(("meal.jpg", image[0], image[1]))
+    at.checkbox(key="meal_photo_force_refresh").check()
+    return at, _button(at, "Estimate Calories & Log Meals!").click
+
+def flow_photo_batch(image):
+    at = _open_page("Log Meal from Photo")
+    # Distinct bytes per photo, so every one is a separate estimate rather than a cache hit
+    at.file_uploader(key="meal_photo_uploader").set_value(
+        [(f"meal_{i}.jpg", image[0] + bytes([i]), image[1]) for i in range(8)]
+    )
+    at.run()
+    at.checkbox(key="meal_photo_force_refresh").check()
+    return at, _button(at, "Estimate Calories & Log Meals!").click
+
+def flow_tracking(image):
+    at = _open_page("Daily Health Tracking")
+    at.number_input[0].set_value(1850)
+    at.number_input[1].set_value(110)
+    return at, _button(at, f"Log Data for {date.today().isoformat()}").click
+
+def flow_charts(image):
+    at = _open_page("Data Visualization & Trends")
+    at.selectbox(key="viz_range").set_value("Last year")
+    at.selectbox(key="viz_period").set_value("Weekly")
+    return at, lambda: at # The selections above take effect on the timed run
+
+def flow_guidance(image):
+    at = _open_page("Progress & AI Guidance")
+    at.text_area[0].set_value("How can I lower my sugar intake?")
+    return at, _button(at, "Get Guidance").click
+
+FLOWS = {
+    "profile_save": flow_profile_save,
+    "weekly_plan": flow_weekly_plan,
+    "per_day_plan": flow_per_day_plan,
+    "photo_log": flow_photo_log,
+    "photo_batch": flow_photo_batch,
+    "tracking": flow_tracking,
+    "charts": flow_charts,
+    "guidance": flow_guidance,
+}
+
+
+def seed_history(storage, user_id, days=365):
+    """A year of logged metrics so the charts page has a full range to aggregate."""
+    end = date.today()
+    storage.upsert_daily_logs(user_id, {
+        (end - timedelta(days=i)).isoformat(): {
+            "logged_calories": 1800 + (i * 37) % 400, "logged_sugar": 95 + (i * 13) % 40,
+            "logged_carbs": 180 + (i * 7) % 60, "logged_exercise": 30, "logged_steps": 8000, "logged_water": 2.0
+        }
+        for i in range(days)
+    })
+
+def run_flow(flow, image):
+    from smartplate.jobs import get_job_queue
+    at, interact = flow(image)
+    interact()
+    started = time.perf_counter()
+    at.run()
+    if "plan_job_id" in at.session_state:
+        # Plans run as background jobs: wait for it, then render the finished job as the polling page would
+        get_job_queue().wait(at.session_state["plan_job_id"], timeout=300)
+        at.run()
+    elapsed = time.perf_counter() - started
+    errors = [e.value for e in at.exception] + [e.value for e in at.error]
+    return elapsed, errors
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per flow")
+    parser.add_argument("--only", nargs="+", choices=sorted(FLOWS), help="Run just these flows")
+    parser.add_argument("--latency", choices=("fixed", "uniform", "lognormal"), default="fixed")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mock time to first byte")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--chunk-delay-ms", type=float, default=2.0, help="Mock delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    from smartplate.mock_gemini import start_mock_server
+    server = start_mock_server(
+        latency=args.latency, latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms,
+        chunk_delay_ms=args.chunk_delay_ms, error_rate=args.error_rate, truncate_rate=args.truncate_rate,
+        malformed_rate=args.malformed_rate, seed=0
+    )
+    # Must be set before the app (and smartplate modules) are first imported by AppTest
+    os.environ["GEMINI_API_URL"] = server.api_url()
+    os.environ["SMARTPLATE_STORAGE"] = "memory"
+    os.environ["SMARTPLATE_CACHE_DIR"] = tempfile.mkdtemp(prefix="smartplate-bench-cache-")
+    os.environ["SMARTPLATE_JOBS_DB"] = ":memory:"
+    os.environ["SMARTPLATE_USER_ID"] = "anonymous_user_id" # Every flow reads the history seeded below
+
+    from smartplate.storage import get_storage
+    seed_history(get_storage(), "anonymous_user_id")
+
+    image = sample_image_bytes()
+    names = args.only or list(FLOWS)
+    results = []
+    for name in names:
+        flow = FLOWS[name]
+        run_flow(flow, image) # Warm-up: first imports and connection setup are not part of the flow's cost
+        timings = []
+        failures = 0
+        for _ in range(args.repeat):
+            elapsed, errors = run_flow(flow, image)
+            timings.append(elapsed)
+            failures += bool(errors)
+        tracemalloc.start()
+        run_flow(flow, image)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append({
+            "flow": name, "runs": len(timings),
+            "p50_ms": round(statistics.median(timings) * 1000, 1),
+            "p95_ms": round(percentile(timings, 95) * 1000, 1),
+            "peak_mb": round(peak_bytes / (1024 * 1024), 2),
+            "runs_with_errors": failures
+        })
+
+    server.shutdown()
+    server.server_close()
+    if args.json:
+        print(json.dumps({"mock": server.stats, "results": results}, indent=2))
+        return
+    print(f"{'flow':<14} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'peak MB':>8} {'errors':>7}")
+    for row in results:
+        print(f"{row['flow']:<14} {row['runs']:>5} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['peak_mb']:>8} {row['runs_with_errors']:>7}")
+    print(f"mock requests: {server.stats['requests']} {server.stats['by_kind']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Photo index benchmark: lookup latency of the multi-index Hamming search in smartplate/photo_index.py
+against a linear scan, at several index sizes, plus how often edited copies of generated photos
+(recompressed, resized, cropped, rotated) are matched and unrelated photos are not.
+
+Run from the repository root:
+    python benchmarks/bench_photo_index.py [--sizes 10000 100000 300000] [--queries N]
+
+Stored hashes are uniformly random, which spreads them evenly over the part tables; real photo
+hashes cluster more, so expect somewhat more candidates per lookup in production.
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def flip_bits(rng, value, count):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+def time_lookups(search, queries):
+    """Median microseconds per call of search(query) over queries."""
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings)
+
+def lookup_table(sizes, query_count, max_distance):
+    from smartplate.photo_index import HammingIndex
+    rng = random.Random(0)
+    print(f"{'hashes':>8} {'load ms':>8} {'memory MB':>10} {'add us':>7} {'hit us':>8} {'miss us':>8} {'scan us':>9} {'speedup':>8}")
+    for size in sizes:
+        values = [rng.getrandbits(64) for _ in range(size)]
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = HammingIndex(values[:-HammingIndex.MERGE_AT]) # As loaded at startup
+        load = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0] / 1e6
+        tracemalloc.stop()
+        started = time.perf_counter()
+        for value in values[-HammingIndex.MERGE_AT:]: # Photos analyzed since, including one merge into the tables
+            index.add(value)
+        add = (time.perf_counter() - started) / HammingIndex.MERGE_AT
+        for value in values[-HammingIndex.MERGE_AT // 2:]: # Leaves a half-full pending list for the lookups
+            index.add(value)
+        values += values[-HammingIndex.MERGE_AT // 2:]
+        near = [flip_bits(rng, rng.choice(values), rng.randint(0, max_distance)) for _ in range(query_count)]
+        far = [rng.getrandbits(64) for _ in range(query_count)]
+        assert all(index.search(query, max_distance) for query in near)
+        hit = time_lookups(lambda query: index.search(query, max_distance), near)
+        miss = time_lookups(lambda query: index.search(query, max_distance), far)
+        scan = time_lookups(lambda query: [v for v in values if (v ^ query).bit_count() <= max_distance], far[:max(1, query_count // 10)])
+        print(f"{size:>8} {load * 1000:>8.0f} {memory:>10.1f} {add * 1e6:>7.0f} {hit:>8.0f} {miss:>8.0f} {scan:>9.0f} {scan / max(hit, miss):>7.0f}x")
+
+def recall_table(photo_count):
+    try:
+        from PIL import Image, ImageDraw, ImageFilter
+    except ImportError:
+        print("Pillow is not installed; skipping the photo recall check")
+        return
+    from smartplate.image_preprocessing import preprocess_image
+    from smartplate.photo_index import MATCH_BITS, SHARED_MATCH_BITS
+
+    def photo(seed):
+        rng = random.Random(seed)
+        img = Image.new("RGB", (1200, 900), (rng.randrange(256),) * 3)
+        draw = ImageDraw.Draw(img)
+        for _ in range(25):
+            x, y, r = rng.randrange(1200), rng.randrange(900), rng.randrange(40, 300)
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+        return img.filter(ImageFilter.GaussianBlur(3))
+
+    def dhash(img, quality=90):
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality)
+        return preprocess_image(out.getvalue(), "image/jpeg").dhash
+
+    edits = {
+        "recompressed q40": lambda img: dhash(img, 40),
+        "resized to 50%": lambda img: dhash(img.resize((600, 450))),
+        "cropped 3%": lambda img: dhash(img.crop((36, 27, 1200, 900))),
+        "cropped 8%": lambda img: dhash(img.crop((96, 0, 1200, 828))),
+        "rotated 3 degrees": lambda img: dhash(img.rotate(3)),
+    }
+    distances = {name: [] for name in edits}
+    unrelated = []
+    for seed in range(photo_count):
+        img = photo(seed)
+        base = dhash(img)
+        for name, edit in edits.items():
+            distances[name].append((edit(img) ^ base).bit_count())
+        unrelated.append((dhash(photo(seed + 10000)) ^ base).bit_count())
+    print(f"\n{'edit':<18} {'median bits':>12} {f'own <= {MATCH_BITS}':>10} {f'shared <= {SHARED_MATCH_BITS}':>12}")
+    for name, values in list(distances.items()) + [("unrelated photo", unrelated)]:
+        print(f"{name:<18} {statistics.median(values):>12.0f} {sum(v <= MATCH_BITS for v in values) / len(values):>10.0%} "
+              f"{sum(v <= SHARED_MATCH_BITS for v in values) / len(values):>12.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 300000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--photos", type=int, default=20, help="Generated photos for the recall check")
+    args = parser.parse_args()
+
+    os.environ["SMARTPLATE_STORAGE"] = "memory"
+    os.environ["SMARTPLATE_CACHE_DIR"] = tempfile.mkdtemp(prefix="smartplate-bench-cache-")
+    from smartplate.photo_index import MATCH_BITS
+    lookup_table(args.sizes, args.queries, MATCH_BITS)
+    recall_table(args.photos)
+
+
+if __name__ == "__main__":
+    main()
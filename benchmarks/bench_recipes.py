@@ -0,0 +1,103 @@
+"""
+Recipe library benchmark: runs several weekly plan jobs for different users against the offline
+Gemini stand-in, once with the recipe library and once without, and compares model calls, output
+tokens, meals served from the library and wall time.
+
+Run from the repository root:
+    python benchmarks/bench_recipes.py [--weeks N] [--latency-ms MS] [--workers N]
+
+The library starts empty, so the first week is generated in full and later weeks reuse what
+earlier ones produced; the mock has only a handful of dishes and a dish is used at most once a
+week, which caps the hit rate well below what a real library reaches. The mock's latency does not
+grow with the length of its answer, so days that only need some meals generated show up in output
+tokens rather than in wall time.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+GROCERIES = ("eggs, spinach, feta, chicken breast, quinoa, broccoli, lemon, lentils, carrots, celery, onion, tomatoes, "
+             "greek yogurt, berries, oats, honey, salmon, asparagus, garlic, apple, peanut butter, banana, cinnamon")
+
+
+class _Reporter:
+    def __init__(self):
+        self.errors = 0
+
+    def item_done(self, key, result=None, error=None, cached=False):
+        self.errors += error is not None
+
+    def partial(self, key, value):
+        pass
+
+
+def run_weeks(client, weeks, workers, use_library, first_day):
+    from smartplate.meal_plans import PER_DAY_MODE, PlanRunStats, run_plan_job
+    from smartplate.recipes import RecipeLibrary
+    import smartplate.meal_plans as meal_plans
+
+    library = RecipeLibrary(db_path=":memory:")
+    meal_plans.get_recipe_library = lambda: library # A fresh library and stats per run
+    meal_plans.plan_run_stats = PlanRunStats()
+    errors = 0
+    started = time.perf_counter()
+    for week in range(weeks):
+        day_strs = [(first_day + timedelta(days=7 * week + i)).isoformat() for i in range(7)]
+        params = {
+            "day_strs": day_strs, "meal_types": ["Breakfast", "Lunch", "Dinner", "Snack"], "groceries": GROCERIES,
+            "profile": {"calorie_goal": 2000, "health_conditions": "", "dietary_preferences": "", "fasting_type": "None"},
+            "mode": PER_DAY_MODE, "max_workers": workers, "stream": False, "force_refresh": False, "use_library": use_library
+        }
+        reporter = _Reporter()
+        run_plan_job(client, {"params": params, "user_id": f"user-{week}", "results": {}}, reporter)
+        errors += reporter.errors
+    stats = library.stats()
+    comparison = meal_plans.plan_run_stats.comparison()[0]
+    return {
+        "output_tokens": comparison["Avg output tokens"] * comparison["Runs"],
+        "mode": "library" if use_library else "no library", "hits": stats["hits"], "slots": 28 * weeks,
+        "errors": errors, "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+        "fill_ms": round(stats["avg_fill_ms"], 2), "recipes": stats["recipes"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=6, help="Plan jobs to run, each a new week for a new user")
+    parser.add_argument("--workers", type=int, default=7)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Mock time to first byte")
+    args = parser.parse_args()
+
+    from smartplate.mock_gemini import start_mock_server
+    os.environ["SMARTPLATE_STORAGE"] = "memory"
+    os.environ["SMARTPLATE_CACHE_DIR"] = tempfile.mkdtemp(prefix="smartplate-bench-cache-")
+    from smartplate.gemini_client import GeminiClient
+
+    rows = []
+    for run, use_library in enumerate((False, True)):
+        server = start_mock_server(latency_ms=args.latency_ms, seed=0)
+        # Each run plans its own dates, so no day checkpoint from the other run is reused
+        first_day = date.today() + timedelta(days=7 * args.weeks * run)
+        row = run_weeks(GeminiClient(server.api_url()), args.weeks, args.workers, use_library, first_day)
+        row["calls"] = server.stats["by_kind"].get("day_plan", 0)
+        server.shutdown()
+        server.server_close()
+        rows.append(row)
+    print(f"{'mode':<11} {'calls':>6} {'output tok':>11} {'library meals':>14} {'hit rate':>9} {'wall ms':>9} {'lookup ms':>10} {'errors':>7}")
+    for row in rows:
+        print(f"{row['mode']:<11} {row['calls']:>6} {row['output_tokens']:>11} {row['hits']:>14} {row['hits'] / row['slots']:>9.0%} "
+              f"{row['wall_ms']:>9} {row['fill_ms']:>10} {row['errors']:>7}")
+    without, with_library = rows
+    print(f"model calls saved: {without['calls'] - with_library['calls']}, "
+          f"output tokens saved: {1 - with_library['output_tokens'] / without['output_tokens']:.0%}, "
+          f"wall time saved: {without['wall_ms'] - with_library['wall_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
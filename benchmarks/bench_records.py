@@ -0,0 +1,79 @@
+"""
+Record memory benchmark: retained Python memory for what a session holds (a generated week of
+plans plus a window of daily logs), as the original nested dicts versus smartplate.records
+objects, and the stored size of each log as dict JSON versus the compact form.
+
+Run from the repository root:
+    python benchmarks/bench_records.py [--sessions N] [--log-days N]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack"]
+
+
+def session_dicts(rng, days, log_days):
+    """One session's week of plans and daily logs in the original dict shape, decoded from JSON as the app would."""
+    from smartplate.mock_gemini import _day_plan
+    week = {day_str: _day_plan(rng, day_str, MEAL_TYPES, 2000) for day_str in days}
+    logs = {}
+    for i in range(log_days):
+        day_str = (date.today() - timedelta(days=i)).isoformat()
+        logs[day_str] = {
+            "logged_calories": 1700 + rng.randrange(600), "logged_sugar": 90 + rng.randrange(50), "logged_carbs": 150 + rng.randrange(80),
+            "logged_exercise": 30, "logged_steps": 6000 + rng.randrange(4000), "logged_water": 2.0,
+            "meals_logged_from_photo": [{"description": "Chicken Quinoa Bowl (chicken breast, quinoa)", "calories": f"{400 + rng.randrange(300)} kcal",
+                                         "timestamp": f"{day_str}T12:30:00"}],
+            "meal_plan": _day_plan(rng, day_str, MEAL_TYPES, 2000)
+        }
+    return json.loads(json.dumps({"week": week, "logs": logs}))
+
+def retained_bytes(build):
+    tracemalloc.start()
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--log-days", type=int, default=7, help="Days of logs held per session")
+    args = parser.parse_args()
+
+    from smartplate.records import DayLog, DayPlan
+    days = [(date.today() + timedelta(days=i)).isoformat() for i in range(7)]
+    sources = [json.dumps(session_dicts(random.Random(i), days, args.log_days)) for i in range(args.sessions)]
+
+    dict_bytes, _ = retained_bytes(lambda: [json.loads(source) for source in sources])
+
+    def build_records():
+        sessions = []
+        for source in sources:
+            data = json.loads(source)
+            sessions.append((
+                {day_str: DayPlan.from_dict(day_str, plan) for day_str, plan in data["week"].items()},
+                {day_str: DayLog.from_dict(day_str, log) for day_str, log in data["logs"].items()}
+            ))
+        return sessions
+    record_bytes, sessions = retained_bytes(build_records)
+
+    logs = json.loads(sources[0])["logs"]
+    dict_stored = sum(len(json.dumps(log)) for log in logs.values())
+    compact_stored = sum(len(day_log.dumps()) for day_log in sessions[0][1].values())
+    print(f"{'':<22} {'dicts':>10} {'records':>10} {'saved':>7}")
+    print(f"{'per session (KB)':<22} {dict_bytes / args.sessions / 1024:>10.1f} {record_bytes / args.sessions / 1024:>10.1f} {1 - record_bytes / dict_bytes:>7.0%}")
+    print(f"{'stored per log (B)':<22} {dict_stored / len(logs):>10.0f} {compact_stored / len(logs):>10.0f} {1 - compact_stored / dict_stored:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
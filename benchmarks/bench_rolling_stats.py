@@ -0,0 +1,80 @@
+"""
+Rolling statistics benchmark: seeds a SQLite store with 1, 5 and 10 years of daily metrics and
+reports the time to save one day's log (which updates the stored 7/30/90-day windows), to read
+the windows back, and to compute the same figures by rescanning the history as the guidance
+prompt would have to without them.
+
+Run from the repository root:
+    python benchmarks/bench_rolling_stats.py [--years 1 5 10] [--repeat N]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def daily_log(rng):
+    return {
+        "logged_calories": rng.randint(1500, 2600), "logged_sugar": round(rng.uniform(80, 170), 1),
+        "logged_carbs": rng.randint(120, 320), "logged_exercise": rng.randint(0, 90),
+        "logged_steps": rng.randint(1000, 15000), "logged_water": round(rng.uniform(0.5, 3.5), 1),
+    }
+
+def rescan(storage, user_id, end):
+    """The windows computed from every stored row, as a prompt without stored statistics would."""
+    from smartplate.rolling_stats import RollingStats, metric_values
+    logs = storage.load_daily_logs(user_id, "0000-01-01", end)
+    return RollingStats.from_rows(end, {day_str: metric_values(log) for day_str, log in logs.items()}, 2000).summary()
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from smartplate.storage import SQLiteStorage
+    rng = random.Random(0)
+    print(f"{'years':>5} {'rows':>6} {'save ms':>8} {'read ms':>8} {'rescan ms':>10} {'same':>5}")
+    for years in args.years:
+        storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(), "bench.db"))
+        storage.save_profile("bench", {"calorie_goal": 2000})
+        days = years * 365
+        start = date(2020, 1, 1)
+        storage.upsert_daily_logs("bench", {(start + timedelta(days=i)).isoformat(): daily_log(rng) for i in range(days)})
+        day = [start + timedelta(days=days)]
+
+        def save_next_day():
+            storage.save_daily_log("bench", day[0].isoformat(), daily_log(rng))
+            day[0] += timedelta(days=1)
+
+        save_ms = timed(save_next_day, args.repeat)
+        read_ms = timed(lambda: storage.load_rolling_stats("bench").summary(), args.repeat)
+        end = (day[0] - timedelta(days=1)).isoformat()
+        rescan_ms = timed(lambda: rescan(storage, "bench", end), max(1, args.repeat // 4))
+        stored, scanned = storage.load_rolling_stats("bench").summary(), rescan(storage, "bench", end)
+        same = all(
+            abs(stored[metric][window][key] - value) < 1e-6 * max(1, abs(value))
+            for metric, windows in scanned.items() for window, values in windows.items()
+            for key, value in values.items() if value is not None
+        )
+        print(f"{years:>5} {days + args.repeat:>6} {save_ms:>8.2f} {read_ms:>8.2f} {rescan_ms:>10.1f} {'yes' if same else 'no':>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+UI-free building blocks for SmartPlate AI.
+The Streamlit pages in SmartPlate_AI.py import from here, as do the batch CLI (smartplate.batch)
+and the HTTP API (smartplate.api); nothing in this package touches st.*.
+"""
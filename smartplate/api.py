@@ -0,0 +1,264 @@
+"""
+A small JSON-over-HTTP API around smartplate/pipelines.py for integrations:
+    python -m smartplate.api --port 8600
+
+    GET  /v1/health
+    POST /v1/groceries?user_id=U&force_refresh=1 image body (Content-Type image/jpeg or image/png)
+    POST /v1/meals?user_id=U&date=D&time=T&log=0 image body; estimated, and added to U's log for D unless log=0
+    POST /v1/plans                                JSON {user_id, groceries, meal_types, days, start, mode, use_library, force_refresh}
+    GET  /v1/jobs/<job_id>                        a plan job's status and finished days
+    POST /v1/guidance                             JSON {user_id, query, date}
+
+Plans are queued on the process-wide job queue (smartplate/jobs.py) and answered with 202 and a
+job id to poll, so they resume after a restart as the app's do. With SMARTPLATE_API_TOKEN set,
+every request but /v1/health needs "Authorization: Bearer <token>".
+"""
+import argparse
+import hmac
+import json
+import os
+import re
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from smartplate.gemini_client import get_gemini_client
+from smartplate.jobs import get_job_queue
+from smartplate.meal_photos import estimate_meal_photo
+from smartplate.meal_plans import PER_DAY_MODE, PLAN_JOB_KIND, WEEKLY_MODE
+from smartplate.pipelines import (
+    DEFAULT_MEAL_TYPES, PLAN_DAYS, PLAN_MAX_WORKERS, day_plan_summary, gemini_api_url, identify_groceries, load_profile,
+    log_meal_estimates, plan_days, plan_job_params, register_plan_jobs, request_guidance
+)
+from smartplate.records import DayPlan
+
+# --- Configuration (overridable through environment variables) ---
+API_TOKEN = os.environ.get("SMARTPLATE_API_TOKEN", "") # Empty: no authentication (bind to localhost)
+API_MAX_BODY_BYTES = int(float(os.environ.get("SMARTPLATE_API_MAX_BODY_MB", "20")) * 1024 * 1024)
+
+_JOB_PATH = re.compile(r"^/v1/jobs/(?P<job_id>[0-9a-f]{32})$")
+_IMAGE_TYPES = ("image/jpeg", "image/png")
+_CONTENT_LENGTH = re.compile(r"[0-9]+")
+
+
+class ApiError(Exception):
+    """Ends a request with status and message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _flag(query, name, default=False):
+    values = query.get(name)
+    return default if not values else values[-1].lower() in ("1", "true", "yes")
+
+def _iso_date(value, field):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"{field} must be a date (YYYY-MM-DD)")
+
+def plan_job_view(job):
+    """A job snapshot for the API: status, error and each finished day's plan."""
+    return {
+        "job_id": job["job_id"], "status": job["status"], "error": job["error"], "user_id": job["user_id"],
+        "days": {
+            day_str: {
+                "status": item["status"], "error": item["error"], "cached": item["cached"],
+                "plan": day_plan_summary(DayPlan.from_compact(item["result"])) if item["result"] is not None else None
+            }
+            for day_str, item in sorted(job["results"].items())
+        }
+    }
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "SmartPlateAPI/1"
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if self.close_connection:
+            self.send_header("Connection", "close") # So the client does not send its next request on a socket about to close
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _parse_content_length(self):
+        # Parsed once per request: a negative value would make rfile.read() block until the client disconnects
+        header = (self.headers.get("Content-Length") or "0").strip()
+        if not _CONTENT_LENGTH.fullmatch(header):
+            raise ApiError(400, "Content-Length must be a non-negative integer")
+        return int(header)
+
+    def _read_body(self):
+        length = self._content_length
+        if length > API_MAX_BODY_BYTES:
+            raise ApiError(413, f"Body larger than {API_MAX_BODY_BYTES} bytes")
+        self._body_read = True
+        return self.rfile.read(length)
+
+    def _read_json(self):
+        try:
+            body = json.loads(self._read_body() or b"{}")
+        except json.JSONDecodeError as e:
+            raise ApiError(400, f"Invalid JSON body: {e}")
+        if not isinstance(body, dict):
+            raise ApiError(400, "The JSON body must be an object")
+        return body
+
+    def _read_image(self):
+        mime_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if mime_type not in _IMAGE_TYPES:
+            raise ApiError(415, f"Content-Type must be one of {', '.join(_IMAGE_TYPES)}")
+        image_bytes = self._read_body()
+        if not image_bytes:
+            raise ApiError(400, "Empty image body")
+        return image_bytes, mime_type
+
+    def _check_token(self):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+            raise ApiError(401, "Missing or wrong bearer token")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        self._body_read = False
+        self._content_length = None # Unknown until parsed; an unparsable header leaves the body unskippable
+        try:
+            self._content_length = self._parse_content_length()
+            if method == "GET" and url.path == "/v1/health":
+                self._send_json(200, {"status": "ok"})
+                return
+            self._check_token()
+            route = {
+                ("POST", "/v1/groceries"): self._groceries, ("POST", "/v1/meals"): self._meals,
+                ("POST", "/v1/plans"): self._plans, ("POST", "/v1/guidance"): self._guidance
+            }.get((method, url.path))
+            job_match = _JOB_PATH.match(url.path)
+            if route is not None:
+                status, body = route(query)
+            elif method == "GET" and job_match:
+                status, body = self._job(job_match.group("job_id"))
+            else:
+                raise ApiError(404, f"No route for {method} {url.path}")
+        except ApiError as e:
+            status, body = e.status, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+        if not self._body_read and self._content_length != 0:
+            self.close_connection = True # An unread body would be taken for the next request on this connection
+        self._send_json(status, body)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    # --- Routes: each returns (status, body) ---
+    def _groceries(self, query):
+        image_bytes, mime_type = self._read_image()
+        user_id = (query.get("user_id") or [""])[-1] or None # Optional; without it only other users' close copies match
+        client = self.server.client.for_user(user_id) if user_id else self.server.client
+        outcome = identify_groceries(client, image_bytes, mime_type, force_refresh=_flag(query, "force_refresh"), user_id=user_id)
+        return (502 if outcome["error"] else 200), outcome
+
+    def _meals(self, query):
+        user_id = (query.get("user_id") or [""])[-1]
+        if not user_id:
+            raise ApiError(400, "user_id is required")
+        day = _iso_date((query.get("date") or [date.today().isoformat()])[-1], "date")
+        time_str = (query.get("time") or [None])[-1]
+        image_bytes, mime_type = self._read_image()
+        outcome = estimate_meal_photo(self.server.client.for_user(user_id), image_bytes, mime_type,
+                                      force_refresh=_flag(query, "force_refresh"), user_id=user_id)
+        body = dict(outcome, logged_date=None)
+        if not outcome["error"] and _flag(query, "log", default=True):
+            timestamp = f"{day.isoformat()}T{time_str}" if time_str else day.isoformat()
+            log_meal_estimates(user_id, [(day.isoformat(), timestamp, outcome)])
+            body["logged_date"] = day.isoformat()
+        return (502 if outcome["error"] else 200), body
+
+    def _plans(self, query):
+        body = self._read_json()
+        user_id, groceries = body.get("user_id"), body.get("groceries")
+        if not user_id or not isinstance(groceries, str) or not groceries.strip():
+            raise ApiError(400, "user_id and groceries (comma-separated text) are required")
+        meal_types = body.get("meal_types") or DEFAULT_MEAL_TYPES
+        days = body.get("days", PLAN_DAYS)
+        if not isinstance(meal_types, list) or not isinstance(days, int) or not 1 <= days <= 31:
+            raise ApiError(400, "meal_types must be a list and days a number from 1 to 31")
+        start = _iso_date(body["start"], "start") if body.get("start") else date.today()
+        params = plan_job_params(
+            load_profile(user_id), meal_types, groceries.strip(), day_strs=plan_days(start, days),
+            mode=WEEKLY_MODE if body.get("mode") == "weekly" else PER_DAY_MODE, max_workers=PLAN_MAX_WORKERS,
+            force_refresh=bool(body.get("force_refresh")), stream=False, use_library=body.get("use_library", True)
+        )
+        job_id = get_job_queue().submit(PLAN_JOB_KIND, user_id, params)
+        return 202, {"job_id": job_id, "status": "queued", "poll": f"/v1/jobs/{job_id}"}
+
+    def _job(self, job_id):
+        job = get_job_queue().get(job_id)
+        if job is None or job["kind"] != PLAN_JOB_KIND:
+            raise ApiError(404, f"Unknown job {job_id}")
+        return 200, plan_job_view(job)
+
+    def _guidance(self, query):
+        body = self._read_json()
+        user_id, guidance_query = body.get("user_id"), body.get("query")
+        if not user_id or not isinstance(guidance_query, str) or not guidance_query.strip():
+            raise ApiError(400, "user_id and query are required")
+        day_str = _iso_date(body["date"], "date").isoformat() if body.get("date") else None
+        try:
+            text = request_guidance(self.server.client.for_user(user_id), user_id, guidance_query, day_str)
+        except Exception as e:
+            raise ApiError(502, f"Error getting guidance: {e}")
+        if not text:
+            raise ApiError(502, "Could not generate guidance.")
+        return 200, {"guidance": text}
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, client, token=API_TOKEN):
+        super().__init__(server_address, _ApiHandler)
+        self.client = client
+        self.token = token
+        register_plan_jobs(client)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def start_api_server(client, host="127.0.0.1", port=0, token=API_TOKEN):
+    """Starts an ApiServer on a daemon thread and returns it; port=0 picks a free port. Stop with .shutdown() and .server_close()."""
+    server = ApiServer((host, port), client, token=token)
+    threading.Thread(target=server.serve_forever, name="smartplate-api", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API for the SmartPlate pipelines.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+    server = ApiServer((args.host, args.port), get_gemini_client(gemini_api_url()))
+    print(f"SmartPlate API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Bulk processing of grocery and meal photos without the UI, e.g. a nightly batch:
+    python -m smartplate.batch photos/ --output results.jsonl --concurrency 8
+    python -m smartplate.batch manifest.csv --output results.jsonl --plan-days 7
+
+The source is a directory or a manifest (.csv or .jsonl). In a directory every .jpg/.jpeg/.png is an
+item; files under a folder named groceries are grocery photos, everything else is a meal photo
+(--kind changes the default), all for --user on --date. Manifest rows name path (relative to the
+manifest), kind, and optionally id, user_id, date and time.
+
+Meal photos are estimated and added to the user's daily logs (unless --no-log); grocery photos are
+identified and, with --plan-days, turned into a plan for the user's stored profile. Each finished
+item is appended to the output as one JSON line and flushed, so an interrupted run started again
+with the same output skips the items already done and retries the ones that failed.
+"""
+import argparse
+import csv
+import json
+import mimetypes
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import date, datetime, time as time_of_day
+
+from smartplate.gemini_client import get_gemini_client
+from smartplate.meal_photos import estimate_meal_photo
+from smartplate.meal_plans import PER_DAY_MODE, WEEKLY_MODE
+from smartplate.pipelines import (
+    DEFAULT_MEAL_TYPES, day_plan_summary, gemini_api_url, generate_plan, identify_groceries, load_profile,
+    log_meal_estimates, plan_days, plan_job_params
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+KINDS = ("meal", "grocery")
+GROCERY_FOLDERS = ("groceries", "grocery")
+BATCH_CONCURRENCY = int(os.environ.get("SMARTPLATE_BATCH_CONCURRENCY", "8")) # Items in flight at once
+
+
+def _item(path, kind, user_id, date_str, time_str=None, item_id=None):
+    """An item to process. A bad date or time does not stop the batch: the item is reported as failed ('invalid')."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind {kind!r} for {path}; expected one of {', '.join(KINDS)}")
+    item = {"id": item_id or path, "path": path, "kind": kind, "user_id": user_id, "date": date_str, "time": time_str or None}
+    try:
+        item["date"] = date.fromisoformat(date_str).isoformat() # Logs are keyed by the canonical form
+    except (TypeError, ValueError):
+        item["invalid"] = f"date must be YYYY-MM-DD, got {date_str!r}"
+        return item
+    if item["time"]:
+        try:
+            time_of_day.fromisoformat(item["time"])
+        except (TypeError, ValueError):
+            item["invalid"] = f"time must be HH:MM[:SS], got {item['time']!r}"
+    return item
+
+def scan_directory(root, default_kind, user_id, date_str):
+    """Items for every image under root, in a stable order; ids are paths relative to root."""
+    items = []
+    for folder, subfolders, files in os.walk(root):
+        subfolders.sort()
+        relative_folder = os.path.relpath(folder, root)
+        parts = [] if relative_folder == "." else relative_folder.lower().split(os.sep)
+        kind = "grocery" if any(part in GROCERY_FOLDERS for part in parts) else default_kind
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(folder, name)
+                items.append(_item(path, kind, user_id, date_str, item_id=os.path.relpath(path, root)))
+    return items
+
+def read_manifest(path, default_kind, user_id, date_str):
+    """Items from a .csv (with a header row) or .jsonl manifest; relative paths are resolved against its folder."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [
+        _item(os.path.join(base, row["path"]), row.get("kind") or default_kind, row.get("user_id") or user_id,
+              row.get("date") or date_str, row.get("time"), row.get("id") or row["path"])
+        for row in rows
+    ]
+
+def completed_ids(output_path):
+    """Ids recorded as ok in an earlier run's output; a torn last line (from a kill mid-write) is ignored."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def process_item(client, item, options):
+    """Runs one item's pipeline on a worker thread. Returns its output record and, for meals, the log entry to write."""
+    if "invalid" in item:
+        raise ValueError(item["invalid"])
+    with open(item["path"], "rb") as f:
+        image_bytes = f.read()
+    mime_type = mimetypes.guess_type(item["path"])[0] or "image/jpeg"
+    record = {"id": item["id"], "kind": item["kind"], "user_id": item["user_id"], "date": item["date"]}
+    client = client.for_user(item["user_id"])
+    if item["kind"] == "meal":
+        outcome = estimate_meal_photo(client, image_bytes, mime_type, force_refresh=options.force_refresh, user_id=item["user_id"])
+        record.update(status="error" if outcome["error"] else "ok", error=outcome["error"], cached=outcome["cached"],
+                      match=outcome["match"], description=outcome["description"], calories=outcome["calories"],
+                      carbs=outcome["carbs"], flagged=outcome["flagged"])
+        timestamp = f"{item['date']}T{item['time']}" if item["time"] else item["date"]
+        # Tagged with the item id, so logging it again after an interrupted run is a no-op
+        return record, (item["date"], timestamp, dict(outcome, source=f"batch:{item['id']}"))
+
+    outcome = identify_groceries(client, image_bytes, mime_type, force_refresh=options.force_refresh, user_id=item["user_id"])
+    record.update(status="error" if outcome["error"] else "ok", error=outcome["error"], cached=outcome["cached"],
+                  match=outcome["match"], groceries=outcome["groceries"])
+    if outcome["groceries"] and options.plan_days:
+        params = plan_job_params(load_profile(item["user_id"]), options.meal_types, outcome["groceries"],
+                                 day_strs=plan_days(date.fromisoformat(item["date"]), options.plan_days), mode=options.mode,
+                                 force_refresh=options.force_refresh, use_library=not options.no_library)
+        days = generate_plan(client, item["user_id"], params)
+        record["plan"] = [day_plan_summary(plan) for _, (plan, _) in sorted(days.items()) if plan is not None]
+        failed = sorted(day_str for day_str, (plan, _) in days.items() if plan is None)
+        if failed:
+            record.update(status="error", error=f"Could not generate the plan for {', '.join(failed)}")
+    return record, None
+
+
+def run_batch(client, items, output_path, options, log=print):
+    """
+    Processes items not already done in output_path with at most options.concurrency in flight,
+    appending one JSON line per item. Returns counts of ok, error and skipped items.
+    """
+    done = completed_ids(output_path)
+    pending = [item for item in items if item["id"] not in done]
+    counts = {"ok": 0, "error": 0, "skipped": len(items) - len(pending)}
+    if counts["skipped"]:
+        log(f"Skipping {counts['skipped']} item(s) already done in {output_path}")
+    started = time.perf_counter()
+    concurrency = max(1, options.concurrency)
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        def record_result(future, item): # Runs on this thread only, so log writes and output lines are never interleaved
+            try:
+                record, log_entry = future.result()
+            except Exception as e: # Unreadable file and the like; the item is retried on the next run
+                record, log_entry = {"id": item["id"], "kind": item["kind"], "status": "error", "error": f"{type(e).__name__}: {e}"}, None
+            if log_entry is not None and record["status"] == "ok" and not options.no_log:
+                # Before the line is written, so a done item is always logged; a kill in between leaves the item to be
+                # redone, and its entry's source makes the second log write skip it rather than count the meal twice
+                log_meal_estimates(item["user_id"], [log_entry])
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            counts[record["status"]] += 1
+            finished = counts["ok"] + counts["error"]
+            if finished % 100 == 0 or finished == len(pending):
+                elapsed = time.perf_counter() - started
+                log(f"{finished}/{len(pending)} items, {counts['error']} failed, {finished / elapsed:.1f} items/s")
+
+        # Only a bounded window is submitted at a time, so a large batch does not hold every image in memory
+        in_flight = {}
+        for item in pending:
+            if len(in_flight) >= concurrency * 2:
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    record_result(future, in_flight.pop(future))
+            in_flight[executor.submit(process_item, client, item, options)] = item
+        for future in as_completed(list(in_flight)):
+            record_result(future, in_flight.pop(future))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze grocery and meal photos in bulk, with resumable JSONL output.")
+    parser.add_argument("source", help="Directory of photos, or a .csv/.jsonl manifest")
+    parser.add_argument("--output", "-o", default="smartplate-results.jsonl", help="JSONL results; existing ok items are skipped")
+    parser.add_argument("--concurrency", "-j", type=int, default=BATCH_CONCURRENCY, help="Items processed at once")
+    parser.add_argument("--kind", choices=KINDS, default="meal", help="Kind of photos outside a groceries folder or manifest kind")
+    parser.add_argument("--user", default="batch_user", help="User id for items without one")
+    parser.add_argument("--date", default=date.today().isoformat(), help="Date (YYYY-MM-DD) for items without one")
+    parser.add_argument("--plan-days", type=int, default=0, help="Generate a plan of this many days from each grocery photo")
+    parser.add_argument("--meal-types", default=",".join(DEFAULT_MEAL_TYPES), help="Comma-separated meal types for plans")
+    parser.add_argument("--mode", choices=("per-day", "weekly"), default="per-day", help="Plan generation mode")
+    parser.add_argument("--no-library", action="store_true", help="Generate every meal instead of reusing library recipes")
+    parser.add_argument("--no-log", action="store_true", help="Estimate meal photos without adding them to daily logs")
+    parser.add_argument("--force-refresh", action="store_true", help="Ignore cached results")
+    args = parser.parse_args(argv)
+    args.meal_types = [meal_type.strip() for meal_type in args.meal_types.split(",") if meal_type.strip()]
+    args.mode = WEEKLY_MODE if args.mode == "weekly" else PER_DAY_MODE
+    datetime.strptime(args.date, "%Y-%m-%d") # Fails early on a bad date
+
+    if os.path.isdir(args.source):
+        items = scan_directory(args.source, args.kind, args.user, args.date)
+    else:
+        items = read_manifest(args.source, args.kind, args.user, args.date)
+    log = lambda message: print(message, file=sys.stderr)
+    log(f"{len(items)} item(s) from {args.source}")
+    counts = run_batch(get_gemini_client(gemini_api_url()), items, args.output, args, log=log)
+    log(f"Done: {counts['ok']} ok, {counts['error']} failed, {counts['skipped']} skipped; results in {args.output}")
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Shared-context caching for prompts that repeat a large static prefix (e.g. the seven per-day plan
+requests, which share the profile, meal types and grocery list). The prefix is stored once as a
+Gemini cachedContents resource and each request references it by name, sending only its own delta.
+Contexts are reused until shortly before they expire; creation failures fall back to sending the
+full prompt, and are not retried for a while.
+"""
+import hashlib
+import os
+import threading
+import time
+
+import requests
+
+from smartplate.instrumentation import get_instrumentation
+
+# --- Configuration (overridable through environment variables) ---
+CONTEXT_CACHE_MODE = os.environ.get("SMARTPLATE_CONTEXT_CACHE", "auto") # auto (when large enough), on, or off
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("SMARTPLATE_CONTEXT_CACHE_TTL_SECONDS", "600"))
+# The API rejects contexts below a model-specific minimum; below it the full prompt is sent instead
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("SMARTPLATE_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+CONTEXT_CACHE_FAILURE_BACKOFF_SECONDS = 300 # After a failed create, send full prompts for this long
+EXPIRY_MARGIN_SECONDS = 30 # Don't hand out a context that could expire mid-request
+CHARS_PER_TOKEN = 4 # Rough estimate, only used to decide whether a prefix is worth caching
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+class SharedContextCache:
+    """Process-wide map from (model, prefix text) to a live cachedContents name."""
+
+    def __init__(self, mode=CONTEXT_CACHE_MODE, ttl_seconds=CONTEXT_CACHE_TTL_SECONDS, min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._contexts = {} # key -> (name, expires_at, cached tokens)
+        self._failed_until = {} # key -> monotonic time before which creation is not retried
+
+    def should_cache(self, prefix_text, uses=2):
+        """Whether acquire() would try to cache this prefix for `uses` requests."""
+        if self.mode == "off" or uses < 2:
+            return False
+        return self.mode == "on" or estimate_tokens(prefix_text) >= self.min_tokens
+
+    def acquire(self, client, prefix_text, uses=2):
+        """
+        Returns the name of a cached context holding prefix_text (as a system instruction), creating
+        it if needed, or None when the full prompt should be sent instead. Concurrent callers with the
+        same prefix share one creation call.
+        """
+        instrumentation = get_instrumentation()
+        if not self.should_cache(prefix_text, uses):
+            instrumentation.increment("context_cache", result="skipped")
+            return None
+        key = hashlib.sha256(f"{client.model}\n{prefix_text}".encode("utf-8")).hexdigest()
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            now = time.monotonic()
+            with self._lock:
+                context = self._contexts.get(key)
+                failed_until = self._failed_until.get(key, 0)
+            if context is not None and context[1] - EXPIRY_MARGIN_SECONDS > now:
+                instrumentation.increment("context_cache", result="reused")
+                return context[0]
+            if failed_until > now:
+                instrumentation.increment("context_cache", result="backoff")
+                return None
+            try:
+                created = client.create_cached_content(prefix_text, self.ttl_seconds)
+                name = created["name"]
+            except (requests.exceptions.RequestException, ValueError, KeyError):
+                # Too small for the model, unsupported or unavailable: fall back to full prompts
+                with self._lock:
+                    self._failed_until[key] = now + CONTEXT_CACHE_FAILURE_BACKOFF_SECONDS
+                instrumentation.increment("context_cache", result="failed")
+                return None
+            tokens = (created.get("usageMetadata") or {}).get("totalTokenCount", 0)
+            with self._lock:
+                self._contexts[key] = (name, now + self.ttl_seconds, tokens)
+            instrumentation.increment("context_cache", result="created")
+            return name
+
+    def invalidate(self, name):
+        """Forgets a context the API no longer accepts (expired or deleted server-side)."""
+        with self._lock:
+            for key, context in list(self._contexts.items()):
+                if context[0] == name:
+                    del self._contexts[key]
+
+
+_shared_context_cache = None
+_shared_context_cache_lock = threading.Lock()
+
+def get_shared_context_cache():
+    """Returns the process-wide SharedContextCache (configured by the SMARTPLATE_CONTEXT_CACHE* variables)."""
+    global _shared_context_cache
+    if _shared_context_cache is None:
+        with _shared_context_cache_lock:
+            if _shared_context_cache is None:
+                _shared_context_cache = SharedContextCache()
+    return _shared_context_cache
@@ -0,0 +1,75 @@
+"""
+Point reduction for long chart series, so a figure sends at most a few hundred points per trace
+to the browser however long the visible range is. Line traces keep the points chosen by LTTB
+(largest triangle three buckets): one real point per bucket, the one forming the largest
+triangle with its neighbours, which keeps the peaks and troughs that give the line its shape.
+Bar traces are averaged over equal runs of consecutive rows instead, since there is no room
+for a bar per day at that density anyway. Series at or under the cap are returned unchanged.
+"""
+import os
+
+import numpy as np
+
+CHART_MAX_POINTS = int(os.environ.get("SMARTPLATE_CHART_MAX_POINTS", "400")) # Points per trace sent to the browser
+
+
+def _as_float(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype("datetime64[ns]").astype(np.int64)
+    return values.astype(float)
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the threshold points of (x, y) that LTTB keeps, always including the first and last.
+    The overall highest and lowest points are taken in their buckets even where another point
+    forms a larger triangle, so a chart never hides the range's extremes (unless both share one bucket).
+    x must be ascending (numbers or datetime64) and y free of NaN.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x, y = _as_float(x), _as_float(y)
+    # The n - 2 interior points split into threshold - 2 buckets of at least one point each
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    widths = edges[1:] - edges[:-1]
+    x_means = (x_sums[edges[1:]] - x_sums[edges[:-1]]) / widths
+    y_means = (y_sums[edges[1:]] - y_sums[edges[:-1]]) / widths
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    highest, lowest = int(np.argmax(y)), int(np.argmin(y))
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if start <= highest < end or start <= lowest < end:
+            previous = highest if start <= highest < end else lowest
+            selected[bucket + 1] = previous
+            continue
+        # The third corner is the next bucket's mean point, or the last point after the final bucket
+        next_x, next_y = (x_means[bucket + 1], y_means[bucket + 1]) if bucket + 3 < threshold else (x[-1], y[-1])
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def downsample_line(frame, column, max_points=CHART_MAX_POINTS, x="Date"):
+    """The rows of frame that LTTB keeps for column, after dropping rows where column is NaN."""
+    frame = frame.dropna(subset=[column])
+    if len(frame) <= max_points:
+        return frame
+    return frame.iloc[lttb_indices(frame[x].to_numpy(), frame[column].to_numpy(), max_points)]
+
+def downsample_bars(frame, max_points=CHART_MAX_POINTS, x="Date"):
+    """
+    (frame, bucket size): frame averaged over runs of bucket size consecutive rows, each labelled
+    by its first x, so there are at most max_points rows; a bucket size of 1 means frame unchanged.
+    """
+    n = len(frame)
+    if n <= max_points:
+        return frame, 1
+    size = -(-n // max_points) # Whole rows per bucket, so every bar spans the same number of days
+    averaged = frame.drop(columns=[x]).groupby(np.arange(n) // size).mean()
+    averaged.insert(0, x, frame[x].to_numpy()[::size])
+    return averaged, size
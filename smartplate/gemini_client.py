@@ -0,0 +1,283 @@
+"""
+Shared Gemini API client.
+One pooled requests.Session per process (keep-alive, so calls reuse TCP+TLS connections),
+connect/read timeouts on every call and jittered exponential backoff on 429/5xx.
+Streaming calls use the streamGenerateContent endpoint with server-sent events.
+Every call is recorded as a span with its latency, token usage, bytes on the wire and retries.
+Each HTTP attempt waits for the process-wide rate limiter, queued under the calling user, and
+concurrent identical payloads share one upstream call (see smartplate/rate_limit.py).
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from smartplate.instrumentation import get_instrumentation
+from smartplate.rate_limit import RequestCoalescer, get_rate_limiter, get_request_coalescer
+
+# --- Configuration (overridable through environment variables) ---
+CONNECT_TIMEOUT = float(os.environ.get("GEMINI_CONNECT_TIMEOUT", "5")) # Seconds to establish a connection
+READ_TIMEOUT = float(os.environ.get("GEMINI_READ_TIMEOUT", "90")) # Seconds to wait for the response body
+MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "3")) # Retries after the first attempt
+BACKOFF_BASE = float(os.environ.get("GEMINI_BACKOFF_BASE", "0.5")) # First backoff ceiling in seconds
+BACKOFF_MAX = float(os.environ.get("GEMINI_BACKOFF_MAX", "16")) # Upper bound for a single backoff sleep
+POOL_SIZE = int(os.environ.get("GEMINI_POOL_SIZE", "16")) # Keep-alive connections kept per host
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def extract_response_text(result):
+    """
+    Returns the text of the first candidate's first part of a generateContent response,
+    or None if the response does not have that shape.
+    """
+    if not isinstance(result, dict):
+        return None
+    candidates = result.get("candidates")
+    if not isinstance(candidates, list) or not candidates:
+        return None
+    candidate = candidates[0]
+    if not isinstance(candidate, dict) or not isinstance(candidate.get("content"), dict):
+        return None
+    parts = candidate["content"].get("parts")
+    if not isinstance(parts, list) or not parts:
+        return None
+    part = parts[0]
+    if isinstance(part, dict) and part.get("text"):
+        return part["text"]
+    return None
+
+
+def stream_url_for(api_url):
+    """Turns a ...:generateContent?key=... URL into the matching ...:streamGenerateContent?alt=sse&key=... URL."""
+    base, _, query = api_url.partition("?")
+    if base.endswith(":generateContent"):
+        base = base[:-len(":generateContent")] + ":streamGenerateContent"
+    return f"{base}?alt=sse&{query}" if query else f"{base}?alt=sse"
+
+
+def cached_contents_url_for(api_url):
+    """Turns a .../v1beta/models/<model>:generateContent?key=... URL into .../v1beta/cachedContents?key=..."""
+    base, _, query = api_url.partition("?")
+    root = base.split("/models/")[0]
+    return f"{root}/cachedContents?{query}" if query else f"{root}/cachedContents"
+
+def model_name_for(api_url):
+    """The 'models/<model>' resource name in a generateContent URL."""
+    base = api_url.partition("?")[0]
+    return "models/" + base.split("/models/")[-1].split(":")[0]
+
+
+class GeminiClient:
+    def __init__(self, api_url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 pool_size=POOL_SIZE):
+        self.api_url = api_url
+        self.stream_url = stream_url_for(api_url)
+        self.cached_contents_url = cached_contents_url_for(api_url)
+        self.model = model_name_for(api_url)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        # Retries are handled in _post so they can honour Retry-After and add jitter
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def _backoff_delay(self, attempt, response=None):
+        # Full jitter: sleep a random amount up to the exponential ceiling for this attempt
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+        return delay
+
+    def for_user(self, user):
+        """A view of this client whose calls queue for the rate limiter under user's name."""
+        return UserScopedClient(self, user)
+
+    def _post(self, url, body, span=None, user=None, **kwargs):
+        """
+        POSTs a pre-serialized body, retrying connection errors, timeouts and 429/5xx responses.
+        Every attempt first takes a rate-limiter token, queued fairly under user.
+        Raises requests.exceptions.RequestException (HTTPError for a final bad status, RateLimitTimeout
+        if the queue wait runs out) when retries run out.
+        Bytes sent (every attempt), retries, rate-limit wait and the final status are recorded on span.
+        """
+        attempt = 0
+        while True:
+            waited = get_rate_limiter().acquire(user)
+            if span is not None:
+                span.set(retries=attempt).add("bytes_sent", len(body))
+                if waited:
+                    span.add("rate_limit_wait_ms", round(waited * 1000, 1))
+            try:
+                response = self.session.post(url, data=body, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            if span is not None:
+                span.set(status=str(response.status_code))
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, response)
+                response.close()
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            response.raise_for_status()
+            return response
+
+    @staticmethod
+    def _record_usage(span, result):
+        usage = result.get("usageMetadata") if isinstance(result, dict) else None
+        if usage:
+            span.set(prompt_tokens=usage.get("promptTokenCount", 0), output_tokens=usage.get("candidatesTokenCount", 0),
+                     cached_tokens=usage.get("cachedContentTokenCount", 0))
+
+    def generate_content(self, payload, user=None):
+        """
+        Sends a generateContent payload and returns the decoded JSON response. A caller whose
+        identical payload is already in flight waits for that call and gets a copy of its response.
+        """
+        body = json.dumps(payload)
+        with get_instrumentation().span("gemini.generate_content") as span:
+            sent = []
+
+            def send():
+                sent.append(True)
+                response = self._post(self.api_url, body, span=span, user=user)
+                span.set(bytes_received=len(response.content))
+                result = response.json()
+                self._record_usage(span, result)
+                return result
+
+            result = get_request_coalescer().call(RequestCoalescer.key(self.api_url, body), send)
+            span.set(coalesced=0 if sent else 1)
+        return result
+
+    def generate_text(self, payload, user=None):
+        """Like generate_content, but also returns the unwrapped text (or None) as (text, result)."""
+        result = self.generate_content(payload, user=user)
+        return extract_response_text(result), result
+
+    def stream_generate_content(self, payload, user=None):
+        """
+        Sends a payload to streamGenerateContent and yields each decoded SSE chunk (a partial
+        generateContent response) as it arrives. Retries only happen before the first byte.
+        Callers with an identical payload already streaming replay that stream instead.
+        """
+        body = json.dumps(payload)
+        return get_request_coalescer().stream(RequestCoalescer.key(self.stream_url, body), lambda: self._stream(body, user))
+
+    def _stream(self, body, user):
+        with get_instrumentation().span("gemini.stream_generate_content", bytes_received=0, chunks=0) as span:
+            started = time.perf_counter()
+            response = self._post(self.stream_url, body, span=span, user=user, stream=True)
+            with response:
+                data_lines = []
+                for raw_line in response.iter_lines():
+                    span.add("bytes_received", len(raw_line) + 1)
+                    line = raw_line.decode("utf-8")
+                    if line:
+                        if line.startswith("data:"):
+                            data_lines.append(line[5:].lstrip())
+                        continue
+                    # A blank line ends one event
+                    if data_lines:
+                        chunk = json.loads("\n".join(data_lines))
+                        data_lines = []
+                        if not span.attrs["chunks"]:
+                            span.set(first_chunk_ms=round((time.perf_counter() - started) * 1000, 1))
+                        span.add("chunks", 1)
+                        self._record_usage(span, chunk) # Each chunk carries running totals
+                        yield chunk
+                if data_lines:
+                    chunk = json.loads("\n".join(data_lines))
+                    span.add("chunks", 1)
+                    self._record_usage(span, chunk)
+                    yield chunk
+
+    def stream_text(self, payload, user=None):
+        """Yields only the text deltas of a streamed response, e.g. for st.write_stream."""
+        for chunk in self.stream_generate_content(payload, user=user):
+            text = extract_response_text(chunk)
+            if text:
+                yield text
+
+    def create_cached_content(self, system_instruction, ttl_seconds, user=None):
+        """
+        Stores system_instruction server-side (cachedContents) so later requests can reference it
+        with {"cachedContent": name} instead of re-sending it. Returns the created resource
+        (with 'name', 'expireTime' and 'usageMetadata'); raises like generate_content on failure.
+        """
+        body = json.dumps({
+            "model": self.model,
+            "systemInstruction": {"parts": [{"text": system_instruction}]},
+            "ttl": f"{int(ttl_seconds)}s"
+        })
+        with get_instrumentation().span("gemini.create_cached_content") as span:
+            response = self._post(self.cached_contents_url, body, span=span, user=user)
+            span.set(bytes_received=len(response.content))
+            result = response.json()
+            span.set(cached_tokens=(result.get("usageMetadata") or {}).get("totalTokenCount", 0))
+        return result
+
+    def close(self):
+        self.session.close()
+
+
+class UserScopedClient:
+    """GeminiClient calls made on behalf of one user (for fair rate-limit queuing); everything else is delegated."""
+
+    def __init__(self, client, user):
+        self._client = client
+        self.user = user
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def for_user(self, user):
+        return UserScopedClient(self._client, user)
+
+    def generate_content(self, payload):
+        return self._client.generate_content(payload, user=self.user)
+
+    def generate_text(self, payload):
+        return self._client.generate_text(payload, user=self.user)
+
+    def stream_generate_content(self, payload):
+        return self._client.stream_generate_content(payload, user=self.user)
+
+    def stream_text(self, payload):
+        return self._client.stream_text(payload, user=self.user)
+
+    def create_cached_content(self, system_instruction, ttl_seconds):
+        return self._client.create_cached_content(system_instruction, ttl_seconds, user=self.user)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_gemini_client(api_url):
+    """Returns the process-wide client for api_url, creating it on first use. Safe to call from any thread."""
+    client = _clients.get(api_url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(api_url)
+            if client is None:
+                client = GeminiClient(api_url)
+                _clients[api_url] = client
+    return client
@@ -0,0 +1,118 @@
+"""
+Shrinks uploaded photos before they are base64-encoded into a Gemini request.
+Applies the EXIF orientation, downsamples to a maximum edge, re-encodes at a target quality
+and drops all metadata. Pillow is optional: without it the original bytes are passed through.
+While the photo is decoded anyway, its 64-bit difference hash is taken for near-duplicate
+lookups (see smartplate/photo_index.py).
+"""
+import base64
+import io
+import os
+
+from smartplate.instrumentation import get_instrumentation
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow not installed; preprocess_image becomes a pass-through
+    Image = None
+    ImageOps = None
+
+# --- Configuration (overridable through environment variables) ---
+MAX_EDGE = int(os.environ.get("SMARTPLATE_IMAGE_MAX_EDGE", "1536")) # Longest side in pixels after downsampling
+QUALITY = int(os.environ.get("SMARTPLATE_IMAGE_QUALITY", "85")) # JPEG/WEBP encoder quality
+OUTPUT_FORMAT = os.environ.get("SMARTPLATE_IMAGE_FORMAT", "JPEG").upper() # JPEG, WEBP or PNG
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+DHASH_MIN_CONTRAST = 8 # Grey levels; flatter thumbnails hash to (nearly) zero and would match each other
+
+
+class PreprocessedImage:
+    __slots__ = ("data", "mime_type", "original_size", "width", "height", "dhash")
+
+    def __init__(self, data, mime_type, original_size, width=None, height=None, dhash=None):
+        self.data = data
+        self.mime_type = mime_type
+        self.original_size = original_size
+        self.width = width
+        self.height = height
+        self.dhash = dhash # 64-bit difference hash of the upright image, or None
+
+    @property
+    def processed_size(self):
+        return len(self.data)
+
+    def to_inline_data(self):
+        """Returns the 'inlineData' part body expected by generateContent."""
+        return {"mimeType": self.mime_type, "data": base64.b64encode(self.data).decode("utf-8")}
+
+    def size_report(self):
+        """Human-readable 'before → after' summary, e.g. '5.8 MB → 312.4 KB (95% smaller)'."""
+        saved = 1 - self.processed_size / self.original_size if self.original_size else 0
+        change = f"{saved:.0%} smaller" if saved >= 0 else f"{-saved:.0%} larger"
+        return f"{format_bytes(self.original_size)} → {format_bytes(self.processed_size)} ({change})"
+
+
+def format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024 or unit == "MB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+def difference_hash(img):
+    """
+    64-bit dHash of a Pillow image: a 9x8 greyscale thumbnail, one bit per pixel that is darker
+    than its right-hand neighbour. Recompression, resizing and small crops change few bits.
+    None for a nearly uniform image.
+    """
+    pixels = list(img.convert("L").resize((9, 8), Image.BOX).getdata())
+    if max(pixels) - min(pixels) < DHASH_MIN_CONTRAST:
+        return None
+    value = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            value = (value << 1) | (pixels[col] < pixels[col + 1])
+    return value
+
+def preprocess_image(image_bytes, mime_type, max_edge=MAX_EDGE, quality=QUALITY, output_format=OUTPUT_FORMAT):
+    """
+    Returns a PreprocessedImage with the re-encoded bytes.
+    Falls back to the original bytes if Pillow is missing or the image cannot be decoded.
+    """
+    with get_instrumentation().span("image.preprocess", bytes_in=len(image_bytes)) as span:
+        prepared = _preprocess_image(image_bytes, mime_type, max_edge, quality, output_format)
+        span.set(bytes_out=prepared.processed_size)
+    return prepared
+
+def _preprocess_image(image_bytes, mime_type, max_edge, quality, output_format):
+    if Image is None:
+        return PreprocessedImage(image_bytes, mime_type, len(image_bytes))
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            original_size = img.size
+            orientation = img.getexif().get(0x0112, 1)
+            img = ImageOps.exif_transpose(img) # Bake the orientation in before the EXIF block is dropped
+            if max(img.size) > max_edge:
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            dhash = difference_hash(img)
+            geometry_changed = img.size != original_size or orientation != 1
+            if output_format == "JPEG" and img.mode != "RGB":
+                if img.mode in ("RGBA", "LA", "P"):
+                    # JPEG has no alpha channel; flatten transparent areas onto white
+                    img = img.convert("RGBA")
+                    background = Image.new("RGB", img.size, (255, 255, 255))
+                    background.paste(img, mask=img.getchannel("A"))
+                    img = background
+                else:
+                    img = img.convert("RGB")
+            out = io.BytesIO()
+            # No exif/icc_profile arguments are passed, so the encoder writes no metadata
+            if output_format == "PNG":
+                img.save(out, format="PNG", optimize=True)
+            else:
+                img.save(out, format=output_format, quality=quality, optimize=True)
+            if out.tell() >= len(image_bytes) and not geometry_changed:
+                # Already small and upright: re-encoding would only make the request bigger
+                return PreprocessedImage(image_bytes, mime_type, len(image_bytes), img.width, img.height, dhash)
+            return PreprocessedImage(out.getvalue(), _MIME_TYPES[output_format], len(image_bytes), img.width, img.height, dhash)
+    except (OSError, ValueError, KeyError):
+        return PreprocessedImage(image_bytes, mime_type, len(image_bytes))
@@ -0,0 +1,234 @@
+"""
+Hot-path instrumentation for model calls, storage, parsing and chart building.
+Each timed operation is a span: its duration and numeric attributes (tokens, bytes, retries, rows)
+are folded into per-operation aggregates, kept in a short recent-events buffer for the admin page,
+and optionally appended to a JSONL trace file. Aggregates are exported as Prometheus text,
+either from prometheus_text() or from a small /metrics HTTP endpoint.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuration (overridable through environment variables) ---
+TRACE_PATH = os.environ.get("SMARTPLATE_TRACE_PATH", "") # JSONL trace file; empty disables tracing
+METRICS_PORT = int(os.environ.get("SMARTPLATE_METRICS_PORT", "0")) # Serve /metrics on this port; 0 disables it
+RECENT_EVENTS = int(os.environ.get("SMARTPLATE_RECENT_EVENTS", "200")) # Events kept for the admin page
+DURATION_SAMPLES = 2048 # Recent durations kept per operation for percentiles
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Span:
+    """Times one operation. Use as a context manager; set() attaches attributes along the way."""
+    __slots__ = ("_recorder", "op", "attrs", "_started")
+
+    def __init__(self, recorder, op, attrs):
+        self._recorder = recorder
+        self.op = op
+        self.attrs = attrs
+        self._started = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, name, value):
+        self.attrs[name] = self.attrs.get(name, 0) + value
+        return self
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.attrs["error"] = exc_type.__name__
+        self._recorder.record(self.op, time.perf_counter() - self._started, **self.attrs)
+        return False
+
+
+class _OpStats:
+    __slots__ = ("count", "errors", "total_seconds", "max_seconds", "buckets", "durations", "sums")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1) # Last slot is +Inf
+        self.durations = deque(maxlen=DURATION_SAMPLES)
+        self.sums = {} # Numeric attribute -> running total
+
+
+class Instrumentation:
+    def __init__(self, trace_path=TRACE_PATH, recent_events=RECENT_EVENTS):
+        self._lock = threading.Lock()
+        self._ops = {}
+        self._counters = {} # (name, ((label, value), ...)) -> value
+        self._gauges = {} # Same keys; last value set, e.g. a current queue depth
+        self._recent = deque(maxlen=recent_events)
+        self.trace_path = trace_path
+        self._trace_file = None
+        if trace_path:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+            self._trace_file = open(trace_path, "a", buffering=1, encoding="utf-8") # Line-buffered
+
+    def span(self, op, **attrs):
+        return Span(self, op, attrs)
+
+    def record(self, op, duration_seconds, **attrs):
+        """Folds one finished operation into the aggregates (and the trace, if enabled)."""
+        event = {"ts": round(time.time(), 3), "op": op, "duration_ms": round(duration_seconds * 1000, 3)}
+        event.update(attrs)
+        with self._lock:
+            stats = self._ops.get(op)
+            if stats is None:
+                stats = self._ops[op] = _OpStats()
+            stats.count += 1
+            stats.total_seconds += duration_seconds
+            stats.max_seconds = max(stats.max_seconds, duration_seconds)
+            stats.buckets[bisect.bisect_left(DURATION_BUCKETS, duration_seconds)] += 1
+            stats.durations.append(duration_seconds)
+            if "error" in attrs:
+                stats.errors += 1
+            for name, value in attrs.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stats.sums[name] = stats.sums.get(name, 0) + value
+            self._recent.append(event)
+            if self._trace_file is not None:
+                self._trace_file.write(json.dumps(event, default=str) + "\n")
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def operation_summary(self):
+        """One row per operation: calls, errors, p50/p95/max latency and per-call averages of numeric attributes."""
+        with self._lock:
+            ops = {op: (stats.count, stats.errors, stats.total_seconds, stats.max_seconds, sorted(stats.durations), dict(stats.sums))
+                   for op, stats in self._ops.items()}
+        rows = []
+        for op in sorted(ops):
+            count, errors, total_seconds, max_seconds, durations, sums = ops[op]
+            row = {
+                "Operation": op, "Calls": count, "Errors": errors,
+                "p50 (ms)": round(durations[len(durations) // 2] * 1000, 1),
+                "p95 (ms)": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 1),
+                "Max (ms)": round(max_seconds * 1000, 1),
+                "Total (s)": round(total_seconds, 2)
+            }
+            for name, total in sorted(sums.items()):
+                row[f"Avg {name}"] = round(total / count, 1)
+            rows.append(row)
+        return rows
+
+    def counters(self):
+        """{(name, labels dict as tuple): value} snapshot of all counters."""
+        with self._lock:
+            return dict(self._counters)
+
+    def gauges(self):
+        """{(name, labels dict as tuple): value} snapshot of all gauges."""
+        with self._lock:
+            return dict(self._gauges)
+
+    def recent_events(self, limit=None):
+        with self._lock:
+            events = list(self._recent)
+        return events[-limit:] if limit else events
+
+    def prometheus_text(self):
+        """All aggregates in the Prometheus text exposition format."""
+        with self._lock:
+            ops = {op: (stats.count, stats.errors, stats.total_seconds, list(stats.buckets), dict(stats.sums))
+                   for op, stats in self._ops.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        lines = [
+            "# HELP smartplate_operation_duration_seconds Duration of instrumented operations.",
+            "# TYPE smartplate_operation_duration_seconds histogram"
+        ]
+        for op in sorted(ops):
+            count, _, total_seconds, buckets, _ = ops[op]
+            cumulative = 0
+            for bound, bucket_count in zip(DURATION_BUCKETS + ("+Inf",), buckets):
+                cumulative += bucket_count
+                lines.append(f'smartplate_operation_duration_seconds_bucket{{op="{op}",le="{bound}"}} {cumulative}')
+            lines.append(f'smartplate_operation_duration_seconds_sum{{op="{op}"}} {total_seconds:.6f}')
+            lines.append(f'smartplate_operation_duration_seconds_count{{op="{op}"}} {count}')
+        lines += ["# HELP smartplate_operation_errors_total Operations that raised.", "# TYPE smartplate_operation_errors_total counter"]
+        lines += [f'smartplate_operation_errors_total{{op="{op}"}} {ops[op][1]}' for op in sorted(ops)]
+        attribute_names = sorted({name for op in ops for name in ops[op][4]})
+        for name in attribute_names:
+            lines += [f"# TYPE smartplate_{name}_total counter"]
+            lines += [f'smartplate_{name}_total{{op="{op}"}} {ops[op][4][name]:g}' for op in sorted(ops) if name in ops[op][4]]
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE smartplate_{name}_total counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                    lines.append(f"smartplate_{name}_total{{{label_text}}} {value:g}")
+        for name in sorted({name for name, _ in gauges}):
+            lines.append(f"# TYPE smartplate_{name} gauge")
+            for (gauge_name, labels), value in sorted(gauges.items()):
+                if gauge_name == name:
+                    label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                    lines.append(f"smartplate_{name}{{{label_text}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        # Gauges describe current state rather than history, so they survive a reset
+        with self._lock:
+            self._ops.clear()
+            self._counters.clear()
+            self._recent.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.partition("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_instrumentation().prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves prometheus_text() at http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="smartplate-metrics", daemon=True).start()
+    return server
+
+
+_instrumentation = None
+_instrumentation_lock = threading.Lock()
+
+def get_instrumentation():
+    """Returns the process-wide recorder, starting the /metrics endpoint if SMARTPLATE_METRICS_PORT is set."""
+    global _instrumentation
+    if _instrumentation is None:
+        with _instrumentation_lock:
+            if _instrumentation is None:
+                instrumentation = Instrumentation()
+                if METRICS_PORT:
+                    start_metrics_server(METRICS_PORT)
+                _instrumentation = instrumentation
+    return _instrumentation
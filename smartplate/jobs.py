@@ -0,0 +1,306 @@
+"""
+Background jobs that outlive the Streamlit rerun that started them.
+submit() persists the job to a local SQLite queue and returns its id immediately; a per-process
+pool of worker threads runs it through the handler registered for its kind. Handlers report
+per-item results (e.g. one per day of a plan) as they finish, so pages can poll get() cheaply
+and show progress, and a job interrupted by a restart resumes from the items it still lacks.
+Several processes (the app, the API, the batch CLI) can share one jobs database: a worker claims
+a job by taking a lease on it, renews the lease while the job runs, and only jobs whose lease
+has expired (their process died) are taken over by another process.
+"""
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from smartplate.storage import DB_PATH
+
+# --- Configuration (overridable through environment variables) ---
+JOBS_DB_PATH = os.environ.get("SMARTPLATE_JOBS_DB", os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "jobs.db"))
+JOB_WORKERS = int(os.environ.get("SMARTPLATE_JOB_WORKERS", "2")) # Jobs run at once per process
+JOB_LEASE_SECONDS = float(os.environ.get("SMARTPLATE_JOB_LEASE_SECONDS", "30")) # A running job is taken over once its lease is this stale
+LIVE_JOBS_KEPT = 256 # Finished jobs kept in memory for polling before falling back to the database
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobReporter:
+    """Handed to a handler so it can publish progress for its job. Safe to call from any thread."""
+
+    def __init__(self, job_queue, job_id):
+        self._queue = job_queue
+        self.job_id = job_id
+
+    def item_done(self, key, result=None, error=None, cached=False):
+        """Records the final result (or error) for one item, e.g. one day of a plan."""
+        self._queue._record_item(self.job_id, key, result, error, cached)
+
+    def partial(self, key, value):
+        """Publishes an in-progress value for an item (e.g. a streamed meal); kept in memory only."""
+        self._queue._record_partial(self.job_id, key, value)
+
+
+class JobQueue:
+    def __init__(self, db_path=JOBS_DB_PATH, workers=JOB_WORKERS, lease_seconds=JOB_LEASE_SECONDS):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        self._handlers = {}
+        self._live = {} # job_id -> job dict, for running and recently finished jobs
+        self._pending = queue.Queue()
+        self._workers = []
+        self.worker_count = max(1, workers)
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}" # Unique per queue, even within one process
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, user_id TEXT NOT NULL, status TEXT NOT NULL,"
+                " params TEXT NOT NULL, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+                " owner TEXT, leased_until REAL)"
+            )
+            existing_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner", "TEXT"), ("leased_until", "REAL")): # Databases created before leases
+                if column not in existing_columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_user ON jobs (user_id, kind, created_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_results ("
+                " job_id TEXT NOT NULL, item_key TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT,"
+                " cached INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (job_id, item_key)) WITHOUT ROWID"
+            )
+
+    # --- Registration and submission ---
+    def register_handler(self, kind, handler):
+        """
+        Sets handler(job, reporter) for a kind; it may be called again to replace it (e.g. on every rerun).
+        The first registration queues that kind's jobs left queued, or running under an expired lease,
+        by another process; jobs a live process still holds are left to it.
+        """
+        with self._lock:
+            first = kind not in self._handlers
+            self._handlers[kind] = handler
+        if first:
+            self._recover((kind,), include_queued=True)
+        self._ensure_workers()
+
+    def _recover(self, kinds, include_queued=False):
+        """Queues jobs of these kinds whose lease has expired (and, optionally, unclaimed queued ones) for a claim attempt."""
+        if not kinds:
+            return
+        states = "(status = 'running' AND COALESCE(leased_until, 0) < ?)" # No lease: written before leases existed
+        if include_queued:
+            states = f"(status = 'queued' OR {states})"
+        with self._lock:
+            recovered = [row[0] for row in self._conn.execute(
+                f"SELECT job_id FROM jobs WHERE kind IN ({', '.join('?' * len(kinds))}) AND {states} ORDER BY created_at",
+                tuple(kinds) + (time.time(),)
+            )]
+        for job_id in recovered:
+            self._pending.put(job_id)
+
+    def submit(self, kind, user_id, params):
+        """Persists a new job and queues it. Returns the job id without waiting for any work."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {"job_id": job_id, "kind": kind, "user_id": user_id, "status": "queued", "params": params, "error": None,
+               "created_at": now, "started_at": None, "finished_at": None, "results": {}, "partial": {}}
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, user_id, status, params, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, user_id, json.dumps(params), now)
+            )
+            self._live[job_id] = job
+        self._pending.put(job_id)
+        self._ensure_workers()
+        return job_id
+
+    def retry_failed(self, job_id):
+        """
+        Re-queues a finished job. Items that succeeded are kept as they are; failed ones are cleared,
+        so the handler only redoes those (and any it never reached). Returns False if the job is unknown or still active.
+        """
+        job = self.get(job_id)
+        if job is None or job["status"] in ACTIVE_STATUSES:
+            return False
+        with self._lock:
+            self._conn.execute("DELETE FROM job_results WHERE job_id = ? AND status = 'failed'", (job_id,))
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = NULL, finished_at = NULL, owner = NULL, leased_until = NULL WHERE job_id = ?",
+                (job_id,)
+            )
+            job["results"] = {key: item for key, item in job["results"].items() if item["status"] != "failed"}
+            job.update(status="queued", error=None, finished_at=None, partial={})
+            self._live[job_id] = job
+        self._pending.put(job_id)
+        self._ensure_workers()
+        return True
+
+    # --- Polling ---
+    def get(self, job_id):
+        """A snapshot of the job (status, params, per-item results and partial values), or None."""
+        with self._lock:
+            job = self._live.get(job_id)
+            if job is not None:
+                return json.loads(json.dumps(job)) # Callers get a copy they are free to mutate
+        return self._load(job_id)
+
+    def latest(self, user_id, kind, active_only=False):
+        """The id of the user's most recent job of this kind (optionally only if still queued/running)."""
+        statuses = ACTIVE_STATUSES if active_only else ACTIVE_STATUSES + ("done", "failed")
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT job_id FROM jobs WHERE user_id = ? AND kind = ? AND status IN ({', '.join('?' * len(statuses))})"
+                " ORDER BY created_at DESC LIMIT 1",
+                (user_id, kind) + statuses
+            ).fetchone()
+        return row[0] if row else None
+
+    def wait(self, job_id, timeout=None, poll_seconds=0.05):
+        """Blocks until the job leaves the queued/running states (for scripts and benchmarks, not pages)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] not in ACTIVE_STATUSES:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(poll_seconds)
+
+    def _load(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, kind, user_id, status, params, error, created_at, started_at, finished_at FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            result_rows = self._conn.execute(
+                "SELECT item_key, status, result, error, cached FROM job_results WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        job = dict(zip(("job_id", "kind", "user_id", "status", "params", "error", "created_at", "started_at", "finished_at"), row))
+        job["params"] = json.loads(job["params"])
+        job["results"] = {
+            key: {"status": status, "result": json.loads(result) if result is not None else None, "error": error, "cached": bool(cached)}
+            for key, status, result, error, cached in result_rows
+        }
+        job["partial"] = {}
+        return job
+
+    # --- Progress from handlers ---
+    def _record_item(self, job_id, key, result, error, cached):
+        status = "failed" if error else "done"
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_results (job_id, item_key, status, result, error, cached, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, key, status, json.dumps(result) if result is not None else None, error, int(cached), time.time())
+            )
+            job = self._live.get(job_id)
+            if job is not None:
+                job["results"][key] = {"status": status, "result": result, "error": error, "cached": cached}
+                job["partial"].pop(key, None)
+
+    def _record_partial(self, job_id, key, value):
+        with self._lock:
+            job = self._live.get(job_id)
+            if job is not None:
+                job["partial"].setdefault(key, []).append(value)
+
+    def _claim(self, job_id):
+        """Atomically takes the job if it is queued or its lease has expired; False if another worker holds it."""
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                "UPDATE jobs SET status = 'running', error = NULL, started_at = ?, owner = ?, leased_until = ?"
+                " WHERE job_id = ? AND (status = 'queued' OR (status = 'running' AND COALESCE(leased_until, 0) < ?))",
+                (now, self.owner, now + self.lease_seconds, job_id, now)
+            ).rowcount == 1
+            job = self._live.get(job_id)
+            if claimed and job is not None:
+                job.update(status="running", error=None, started_at=now)
+        return claimed
+
+    def _finish(self, job_id, status, error=None):
+        now = time.time()
+        with self._lock:
+            # Only while still the owner: a worker that stalled past its lease must not overwrite the takeover's outcome
+            owned = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, leased_until = NULL WHERE job_id = ? AND owner = ?",
+                (status, error, now, job_id, self.owner)
+            ).rowcount == 1
+            if not owned:
+                self._live.pop(job_id, None) # Polling falls back to the database, where the new owner reports
+            elif job_id in self._live:
+                self._live[job_id].update(status=status, error=error, finished_at=now)
+
+    def _renew_leases(self):
+        """Heartbeat: extends the leases of the jobs this queue is running and takes over ones whose owner died."""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            now = time.time()
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET leased_until = ? WHERE owner = ? AND status = 'running'", (now + self.lease_seconds, self.owner)
+                )
+                kinds = tuple(self._handlers)
+            self._recover(kinds)
+
+    # --- Workers ---
+    def _ensure_workers(self):
+        with self._lock:
+            if not self._workers:
+                threading.Thread(target=self._renew_leases, name="smartplate-job-leases", daemon=True).start()
+            while len(self._workers) < self.worker_count:
+                worker = threading.Thread(target=self._work, name=f"smartplate-job-{len(self._workers)}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def _work(self):
+        while True:
+            job_id = self._pending.get()
+            job = self.get(job_id)
+            if job is None or job["status"] not in ACTIVE_STATUSES:
+                continue
+            with self._lock:
+                handler = self._handlers.get(job["kind"])
+            if handler is None:
+                continue # Stays queued; register_handler() picks it up from the database
+            if not self._claim(job_id):
+                continue # Another worker (possibly in another process) holds it
+            job = self._load(job_id) # Includes items a previous owner recorded, so the handler resumes after them
+            with self._lock:
+                self._live[job_id] = job # Recovered jobs start polling from memory too
+            job = self.get(job_id)
+            try:
+                handler(job, JobReporter(self, job_id))
+            except Exception as e:
+                self._finish(job_id, "failed", f"{type(e).__name__}: {e}")
+            else:
+                self._finish(job_id, "done")
+            self._trim_live()
+
+    def _trim_live(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._live.items() if job["status"] not in ACTIVE_STATUSES]
+            for job_id in finished[:max(0, len(finished) - LIVE_JOBS_KEPT)]: # Oldest first (insertion order)
+                del self._live[job_id]
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Returns the process-wide queue and worker pool (SMARTPLATE_JOB_WORKERS threads)."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,187 @@
+"""
+Single-pass extraction of JSON objects from model output.
+Model text may wrap the JSON in markdown fences, add prose before or after it, contain stray
+braces, or be cut off. JsonObjectScanner walks the text once, left to right, keeping its state
+between feed() calls so streamed text can be scanned chunk by chunk as it arrives;
+extract_json_from_string() runs the same scan over a whole string and returns the first
+balanced top-level object that parses.
+"""
+import json
+import re
+from itertools import accumulate, islice
+
+from smartplate.instrumentation import get_instrumentation
+
+_decoder = json.JSONDecoder()
+# Inside an open candidate: a whole string literal (its braces are not structure; group 1 is empty), a brace,
+# or the quote of a string that runs past the end of the chunk. The unrolled string pattern cannot backtrack quadratically.
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|([{}"])', re.DOTALL)
+_DEPTH_CHANGE = {"{": 1, "}": -1, "": 0}
+_STRING_END = re.compile(r'["\\]') # What matters inside a string continued from an earlier chunk
+
+
+def _object_start(text, pos):
+    """
+    Offset of the first '{' at or after pos that can start an object, i.e. is followed (after
+    whitespace) by '"' or '}'; stray prose braces cannot. Or -1. Found from the characters that must
+    follow it with str.find, which skips prose far faster than a regex scan.
+    """
+    quote = text.find('"', pos)
+    close = text.find("}", pos)
+    while quote != -1 or close != -1:
+        if close == -1 or quote != -1 and quote < close:
+            follower = quote
+            quote = text.find('"', follower + 1)
+        else:
+            follower = close
+            close = text.find("}", follower + 1)
+        i = follower - 1
+        while i >= pos and text[i].isspace():
+            i -= 1
+        if i >= pos and text[i] == "{":
+            return i
+    return -1
+
+
+class JsonObjectScanner:
+    """
+    Incremental scan for top-level JSON objects. feed() returns the objects completed by each chunk.
+    A candidate that is whole within one chunk is handed straight to the C decoder; one that spans
+    chunks (or does not decode) is tracked brace by brace, skipping string literals, and parsed once
+    it closes. Only the text of the currently open candidate is buffered; prose between objects is not.
+    """
+
+    def __init__(self):
+        self._parts = [] # Text of the open candidate from earlier chunks
+        self._depth = 0
+        self._in_string = False
+        self._escape_pending = False # A backslash ended the previous chunk
+        self._start_pending = False # A top-level '{' ended the previous chunk; the next character decides
+
+    def feed(self, chunk):
+        """Scans the next chunk of text; returns the dicts completed by it, in order."""
+        return list(self._scan(chunk, final=False))
+
+    @property
+    def pending(self):
+        """Text of an object that has started but not closed yet (e.g. a truncated tail)."""
+        return "".join(self._parts)
+
+    def _scan(self, chunk, final):
+        # final: chunk is the whole remaining text, so an object it cuts off can never complete
+        pos = 0
+        start = 0 # Where the open candidate's text begins in this chunk
+        n = len(chunk)
+        if self._start_pending:
+            while pos < n and chunk[pos].isspace():
+                pos += 1
+            if pos == n:
+                self._parts.append(chunk)
+                return
+            self._start_pending = False
+            if chunk[pos] not in '"}':
+                self._depth = 0 # A stray '{' in prose after all
+                self._parts = []
+        while pos < n:
+            if self._depth == 0:
+                start = _object_start(chunk, pos)
+                if start == -1:
+                    last = chunk.rfind("{", pos)
+                    if last != -1 and not chunk[last + 1:].strip():
+                        self._parts = [chunk[last:]] # Only the next chunk can tell whether it starts an object
+                        self._depth = 1
+                        self._start_pending = True
+                    return
+                try:
+                    obj, end = _decoder.raw_decode(chunk, start)
+                except json.JSONDecodeError as e:
+                    if final and (e.pos >= n or e.msg.startswith("Unterminated string")):
+                        return # Cut off: nothing complete can follow
+                    # Spans chunks or is malformed: track its braces to find where it ends
+                    self._depth = 1
+                    pos = start + 1
+                    continue
+                yield obj
+                pos = end
+                continue
+            if self._in_string:
+                if self._escape_pending:
+                    self._escape_pending = False
+                    pos += 1
+                    continue
+                match = _STRING_END.search(chunk, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape_pending = True
+                else:
+                    self._in_string = False
+                continue
+            # Depth after each token, computed in C rather than token by token
+            tokens = _TOKEN.findall(chunk, pos)
+            open_string = tokens.index('"') if '"' in tokens else None
+            if open_string is not None:
+                del tokens[open_string:] # Everything after that quote is inside the string
+            depths = list(accumulate(map(_DEPTH_CHANGE.__getitem__, tokens), initial=self._depth))
+            try:
+                closing = depths.index(0, 1)
+            except ValueError:
+                self._depth = depths[-1]
+                if open_string is None:
+                    break
+                # No unescaped quote follows the open one, so it is normally the chunk's last quote
+                quote = chunk.rfind('"')
+                escapes_from = quote
+                while escapes_from > pos and chunk[escapes_from - 1] == "\\":
+                    escapes_from -= 1
+                if (quote - escapes_from) % 2:
+                    quote = next(islice(_TOKEN.finditer(chunk, pos), open_string, None)).start()
+                pos = quote + 1
+                self._in_string = True # A string literal that continues in the next chunk
+                continue
+            pos = next(islice(_TOKEN.finditer(chunk, pos), closing - 1, None)).end()
+            self._depth = 0
+            self._parts.append(chunk[start:pos])
+            candidate = "".join(self._parts)
+            self._parts = []
+            try:
+                obj = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue # Balanced but malformed: skipped whole
+            if isinstance(obj, dict):
+                yield obj
+        if self._depth > 0:
+            self._parts.append(chunk[start:])
+
+
+def iter_json_objects(text):
+    """
+    Lazily yields every top-level JSON object found in text, in order.
+    Each candidate is tried once with the C decoder; a malformed one is then walked once to its
+    closing brace and skipped whole, so every character is visited a bounded number of times.
+    """
+    return JsonObjectScanner()._scan(text, final=True)
+
+def extract_json_from_string(text):
+    """
+    Attempts to extract a JSON object from a string that might contain
+    additional conversational text or markdown code blocks.
+    Returns the first top-level object that parses, or None.
+    """
+    if not text:
+        return None
+    with get_instrumentation().span("json.extract", chars=len(text)):
+        return _extract_first(text)
+
+def _extract_first(text):
+    for obj in iter_json_objects(text):
+        return obj
+    # A bare JSON array (no object anywhere) is still accepted, as before
+    stripped = text.strip()
+    if stripped.startswith("["):
+        try:
+            return json.loads(stripped)
+        except json.JSONDecodeError:
+            return None
+    return None
@@ -0,0 +1,162 @@
+"""
+Calorie estimation for meal photos, one photo or a whole batch.
+Nothing here touches Streamlit, so estimates can run on a bounded worker pool; each photo's
+outcome is returned as a plain dict and the caller writes all of them to the logs in one batch.
+Carbs come from the nutrition table for the ingredients the model lists in the same response,
+scaled to its calorie estimate, since the photo shows the portion size and the table does not.
+A photo close to one analyzed before (see smartplate/photo_index.py) reuses that analysis.
+"""
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from smartplate.image_preprocessing import preprocess_image
+from smartplate.nutrition import get_nutrition_index, is_far_off
+from smartplate.photo_index import get_photo_index
+from smartplate.records import DayLog, MealEntry, parse_calories
+from smartplate.response_cache import get_response_cache, make_cache_key
+
+PHOTO_MAX_WORKERS = int(os.environ.get("SMARTPLATE_PHOTO_WORKERS", "4")) # Estimation calls in flight for a batch
+
+MEAL_ESTIMATION_PROMPT = """
+                    Analyze the provided image of a meal. Identify the main food items and
+                    provide a concise description of the meal and its approximate total calorie count.
+                    Return the output as a JSON object with the following structure:
+                    {
+                      "meal_description": "Description of the meal items.",
+                      "estimated_calories": "Approximate total calories (e.g., 500 kcal)",
+                      "ingredients": ["Each main food item with its approximate amount (e.g., 150 g chicken breast)"]
+                    }
+                    """
+MEAL_ESTIMATE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "meal_description": { "type": "STRING" },
+        "estimated_calories": { "type": "STRING" },
+        "ingredients": { "type": "ARRAY", "items": { "type": "STRING" } }
+    },
+    "required": ["meal_description", "estimated_calories"]
+}
+
+
+def description_ingredients(description):
+    # "Chicken Quinoa Bowl (chicken breast, quinoa)" -> ["chicken breast", "quinoa"]; otherwise the parts joined by ',', 'with', 'and'
+    listed = re.search(r"\(([^)]*)\)", description)
+    text = listed.group(1) if listed else description
+    return [part.strip() for part in re.split(r",|\bwith\b|\band\b", text) if part.strip()]
+
+def photo_nutrition(calories, ingredients):
+    """(carbs in grams or None, flagged) for a photo estimate of calories made of ingredients."""
+    estimate = get_nutrition_index().estimate(ingredients)
+    if not estimate.matched or estimate.calories <= 0:
+        return None, False
+    scale = calories / estimate.calories if calories else 1.0
+    return round(estimate.carbs * scale), is_far_off(calories, estimate)
+
+def estimate_meal_photo(client, image_bytes, mime_type, force_refresh=False, user_id=None):
+    """
+    Estimates one photo, serving repeated photos from the response cache and near-duplicates of
+    earlier photos (user_id's own, or close copies of anyone's) from the photo index; force_refresh skips both.
+    Returns a dict with 'description', 'calories_text', 'calories' (int), 'carbs' (grams or None),
+    'flagged', 'cached', 'match' ({'distance', 'shared'} for a near-duplicate, else None), 'size_report'
+    and 'error' (a user-facing message or None); it never raises.
+    """
+    outcome = {"description": None, "calories_text": None, "calories": 0, "carbs": None, "flagged": False,
+               "cached": False, "match": None, "size_report": None, "error": None}
+    prepared_image = preprocess_image(image_bytes, mime_type) # Orient, downsample and strip metadata
+    outcome["size_report"] = prepared_image.size_report()
+    payload = {
+        "contents": [{"role": "user", "parts": [{"text": MEAL_ESTIMATION_PROMPT}, {"inlineData": prepared_image.to_inline_data()}]}],
+        "generationConfig": {"responseMimeType": "application/json", "responseSchema": MEAL_ESTIMATE_SCHEMA}
+    }
+    response_cache = get_response_cache()
+    cache_key = make_cache_key("meal_estimate", {"prompt": MEAL_ESTIMATION_PROMPT}, image_bytes)
+    if force_refresh:
+        response_cache.invalidate(cache_key)
+
+    json_string = None
+    try:
+        estimated_meal_data = response_cache.get(cache_key)
+        if estimated_meal_data is None and not force_refresh:
+            match = get_photo_index().lookup("meal_estimate", prepared_image.dhash, user_id)
+            if match is not None:
+                estimated_meal_data, distance, shared = match
+                outcome["match"] = {"distance": distance, "shared": shared}
+                response_cache.set(cache_key, estimated_meal_data) # The same bytes again are then an exact hit
+        outcome["cached"] = estimated_meal_data is not None
+        if estimated_meal_data is None:
+            json_string, meal_result = client.generate_text(payload)
+            if not json_string:
+                outcome["error"] = f"Could not estimate meal calories. The AI response was empty or malformed: {meal_result}"
+                return outcome
+            estimated_meal_data = json.loads(json_string)
+            response_cache.set(cache_key, estimated_meal_data)
+            get_photo_index().add("meal_estimate", prepared_image.dhash, user_id, estimated_meal_data)
+        outcome["description"] = estimated_meal_data.get("meal_description", "N/A")
+        outcome["calories_text"] = estimated_meal_data.get("estimated_calories", "0 kcal")
+        outcome["calories"] = parse_calories(outcome["calories_text"])
+        ingredients = estimated_meal_data.get("ingredients")
+        if not isinstance(ingredients, list) or not ingredients:
+            ingredients = description_ingredients(outcome["description"])
+        outcome["carbs"], outcome["flagged"] = photo_nutrition(outcome["calories"], ingredients)
+    except json.JSONDecodeError as e:
+        outcome["error"] = f"Failed to decode JSON from AI response. Error: {e}. Raw response: {json_string or 'N/A'}"
+    except requests.exceptions.RequestException as e:
+        outcome["error"] = f"An error occurred while connecting to the AI service: {e}"
+    except Exception as e:
+        outcome["error"] = f"An unexpected error occurred: {e}"
+    return outcome
+
+def estimate_meal_photos(client, photos, max_workers=PHOTO_MAX_WORKERS, force_refresh=False, on_done=None, user_id=None):
+    """
+    Estimates photos (dicts with 'data' and 'mime_type') over a pool of at most max_workers calls.
+    on_done(index, outcome) runs on the calling thread as each photo finishes, e.g. to update a
+    progress bar. Returns the outcomes in input order.
+    """
+    outcomes = [None] * len(photos)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(photos) or 1))) as executor:
+        futures = {
+            executor.submit(estimate_meal_photo, client, photo["data"], photo["mime_type"], force_refresh, user_id): index
+            for index, photo in enumerate(photos)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            outcomes[index] = future.result()
+            if on_done is not None:
+                on_done(index, outcomes[index])
+    return outcomes
+
+def add_estimates_to_logs(logs, entries):
+    """
+    Adds successful estimates to {date: DayLog} in place. entries are (date_str, timestamp, outcome);
+    each adds its calories to logged_calories, its carbs to logged_carbs and a MealEntry to meals_logged_from_photo.
+    An outcome with a 'source' already logged on its day is skipped, so logging the same item again is harmless.
+    Returns the dates that changed.
+    """
+    changed = []
+    for date_str, timestamp, outcome in entries:
+        if outcome["error"]:
+            continue
+        day_log = logs.get(date_str)
+        if day_log is None:
+            day_log = logs[date_str] = DayLog(date_str)
+        source = outcome.get("source")
+        if source is not None and any(meal.source == source for meal in day_log.meals_logged_from_photo):
+            continue
+        day_log.logged_calories = (day_log.logged_calories or 0) + outcome["calories"]
+        if outcome["carbs"] is not None:
+            day_log.logged_carbs = (day_log.logged_carbs or 0) + outcome["carbs"]
+        day_log.meals_logged_from_photo.append(MealEntry.from_photo_dict({
+            "description": outcome["description"],
+            "calories": outcome["calories_text"],
+            "timestamp": timestamp,
+            "carbs": outcome["carbs"],
+            "flagged": outcome["flagged"],
+            "source": source
+        }))
+        if date_str not in changed:
+            changed.append(date_str)
+    return changed
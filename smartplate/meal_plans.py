@@ -0,0 +1,564 @@
+"""
+Prompts, response schemas and token budgeting for meal plan generation.
+Two modes share this module: one request per day (request_daily_meal_plan, whose shared prompt
+prefix can be held once as a cached context, see smartplate/context_cache.py) and a single
+schema-enforced request for the whole week (request_weekly_meal_plan), which continues the
+output when the model stops at its token limit instead of discarding it.
+run_plan_job runs either mode as a background job (see smartplate/jobs.py), after taking what
+it can from the recipe library (see smartplate/recipes.py).
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from smartplate.context_cache import get_shared_context_cache
+from smartplate.gemini_client import extract_response_text
+from smartplate.json_extract import extract_json_from_string
+from smartplate.nutrition import annotate_day_plan
+from smartplate.recipes import get_recipe_library, merge_library_meals
+from smartplate.records import DayPlan
+from smartplate.render_cache import day_plan_markdown
+from smartplate.response_cache import get_response_cache, make_cache_key
+from smartplate.storage import get_storage
+from smartplate.streaming import MealPlanStreamParser
+
+PER_DAY_MODE = "One request per day"
+WEEKLY_MODE = "One request for the whole week"
+PLAN_JOB_KIND = "weekly_plan"
+PLAN_PROFILE_FIELDS = ("calorie_goal", "health_conditions", "dietary_preferences", "fasting_type") # Profile fields that shape a meal plan
+# Counts generate_days() returns for one run and PlanRunStats keeps totals of
+RUN_COUNTS = ("calls", "prompt_tokens", "output_tokens", "responded_days", "parse_failures", "network_errors", "cached_days",
+              "cached_prompt_tokens")
+
+DAY_MAX_OUTPUT_TOKENS = 1024 # Output budget for a single day in per-day mode
+TOKENS_PER_MEAL = 220 # Dish name, calories, ingredient list and concise instructions for one meal
+TOKENS_PER_DAY_OVERHEAD = 96 # date, daily_total_calories, daily_notes and JSON punctuation
+WEEK_OVERHEAD_TOKENS = 64
+MODEL_MAX_OUTPUT_TOKENS = 8192 # gemini-2.0-flash output ceiling per call
+MAX_CONTINUATIONS = 3 # Follow-up calls after a MAX_TOKENS stop
+
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off. Continue the JSON exactly where it stopped. "
+    "Output only the remaining characters: no repetition, no code fences, no commentary."
+)
+
+MEAL_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "meal_type": {"type": "STRING"},
+        "dish_name": {"type": "STRING"},
+        "estimated_calories": {"type": "STRING"},
+        "ingredients": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "instructions": {"type": "STRING"}
+    },
+    "required": ["meal_type", "dish_name", "estimated_calories", "ingredients", "instructions"],
+    "propertyOrdering": ["meal_type", "dish_name", "estimated_calories", "ingredients", "instructions"]
+}
+DAY_PLAN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "date": {"type": "STRING"},
+        "daily_total_calories": {"type": "STRING"},
+        "meal_plan": {"type": "ARRAY", "items": MEAL_SCHEMA},
+        "daily_notes": {"type": "STRING"}
+    },
+    "required": ["date", "daily_total_calories", "meal_plan", "daily_notes"],
+    "propertyOrdering": ["date", "daily_total_calories", "meal_plan", "daily_notes"]
+}
+WEEKLY_PLAN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"days": {"type": "ARRAY", "items": DAY_PLAN_SCHEMA}},
+    "required": ["days"]
+}
+
+
+def _profile_lines(user_profile):
+    return f"""- Daily Calorie Goal: {user_profile["calorie_goal"]} kcal
+    - Health Conditions: {user_profile["health_conditions"] if user_profile["health_conditions"].strip() else 'None'}
+    - Dietary Preferences: {user_profile["dietary_preferences"] if user_profile["dietary_preferences"].strip() else 'None'}
+    - Fasting Type: {user_profile["fasting_type"]}"""
+
+def build_daily_meal_plan_context(user_profile, meal_types_to_plan, identified_groceries):
+    # Everything but the date, identical for all days of a week, so it can be held once as a cached context
+    return f"""
+    You are an expert nutritionist and chef, specializing in creating personalized meal plans.
+    Each request names one date; generate the meal plan for that date using the identified groceries.
+    Prioritize using the identified groceries and ensure the plan aligns with the user's profile.
+    ONLY return the JSON object, no conversational text before or after.
+
+    **User Profile:**
+    {_profile_lines(user_profile)}
+    **Meals to Include for this Day:** {', '.join(meal_types_to_plan)}
+    **Identified Groceries available for the week:** {identified_groceries}
+
+    Return the output as a JSON object with the following structure:
+    {{
+      "date": "The requested date, as YYYY-MM-DD",
+      "daily_total_calories": "Approximate total calories for this day (e.g., '1800 kcal')",
+      "meal_plan": [
+        {{
+          "meal_type": "Breakfast",
+          "dish_name": "Creative dish name",
+          "estimated_calories": "Approximate calories (e.g., '350 kcal')",
+          "ingredients": ["Ingredient 1", "Ingredient 2"],
+          "instructions": "Step-by-step cooking instructions."
+        }},
+        {{
+          "meal_type": "Lunch",
+          "dish_name": "Creative dish name",
+          "estimated_calories": "Approximate calories (e.g., '500 kcal')",
+          "ingredients": ["Ingredient 1", "Ingredient 2"],
+          "instructions": "Step-by-step cooking instructions."
+        }}
+        // ... include all selected meal types
+      ],
+      "daily_notes": "Any specific notes for this day's plan."
+    }}
+    Ensure all fields are populated.
+    """
+
+def build_daily_meal_plan_delta(day_str):
+    return f"Generate the meal plan for **{day_str}**."
+
+def build_daily_meal_plan_prompt(day_str, user_profile, meal_types_to_plan, identified_groceries):
+    """The self-contained prompt for one day, sent when no cached context is in use."""
+    return build_daily_meal_plan_context(user_profile, meal_types_to_plan, identified_groceries) + "\n" + build_daily_meal_plan_delta(day_str)
+
+def grocery_set(identified_groceries):
+    """The identified groceries as a sorted, de-duplicated list, so listing order does not change checkpoint keys."""
+    return sorted({item.strip().casefold() for item in identified_groceries.split(",") if item.strip()})
+
+def plan_checkpoint_key(day_str, user_profile, meal_types_to_plan, identified_groceries):
+    """
+    Key under which a successfully parsed day is checkpointed in the response cache:
+    (grocery set, plan-relevant profile fields, meal types, date). Both generation modes share it.
+    """
+    return make_cache_key("day_plan", {
+        "day": day_str,
+        "profile": {field: user_profile[field] for field in PLAN_PROFILE_FIELDS},
+        "meal_types": meal_types_to_plan,
+        "groceries": grocery_set(identified_groceries)
+    })
+
+def request_daily_meal_plan(client, day_str, user_profile, meal_types_to_plan, identified_groceries, force_refresh=False, on_meal=None,
+                            cached_context=None):
+    """
+    Requests and parses the meal plan for a single day, serving it from the response cache when possible.
+    If on_meal is given, the plan is streamed and on_meal(day_str, meal) is called for each meal as it completes.
+    cached_context names a cached context holding build_daily_meal_plan_context(); the request then
+    sends only the day's delta, falling back to the full prompt if the API no longer accepts it.
+    Returns a dict with 'day', 'result' (raw AI response), 'plan' (parsed plan or None), 'cached',
+    'usage', 'cached_tokens', 'error' (a user-facing message or None) and 'network_error' (no response
+    arrived, as opposed to one that did not parse), so a failed day never raises into the pool.
+    """
+    outcome = {"day": day_str, "result": None, "plan": None, "cached": False, "error": None, "network_error": False,
+               "usage": (0, 0), "cached_tokens": 0}
+    response_cache = get_response_cache()
+    cache_key = plan_checkpoint_key(day_str, user_profile, meal_types_to_plan, identified_groceries)
+    if force_refresh:
+        response_cache.invalidate(cache_key)
+    else:
+        cached_plan = response_cache.get(cache_key)
+        if cached_plan is not None:
+            outcome["plan"] = cached_plan
+            outcome["cached"] = True
+            return outcome
+
+    daily_meal_plan_payload = {
+        "contents": [{"role": "user", "parts": [{"text": build_daily_meal_plan_prompt(day_str, user_profile, meal_types_to_plan, identified_groceries)}]}],
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "maxOutputTokens": DAY_MAX_OUTPUT_TOKENS # Limit tokens for single day, adjust if recipes are too short
+        }
+    }
+
+    def send(payload):
+        if on_meal is not None:
+            stream_parser = MealPlanStreamParser()
+            text_chunks = []
+            for chunk in client.stream_generate_content(payload):
+                text_chunk = extract_response_text(chunk)
+                if text_chunk:
+                    text_chunks.append(text_chunk)
+                    for meal in stream_parser.feed(text_chunk):
+                        on_meal(day_str, meal)
+                if chunk.get("usageMetadata"):
+                    outcome["usage"] = usage_tokens(chunk)
+                    outcome["cached_tokens"] = cached_prompt_tokens(chunk)
+            json_string = "".join(text_chunks)
+            return json_string, {"streamed_text": json_string}
+        json_string, result = client.generate_text(payload)
+        outcome["usage"] = usage_tokens(result)
+        outcome["cached_tokens"] = cached_prompt_tokens(result)
+        return json_string, result
+
+    try:
+        if cached_context is None:
+            json_string, result = send(daily_meal_plan_payload)
+        else:
+            try:
+                json_string, result = send({
+                    "cachedContent": cached_context,
+                    "contents": [{"role": "user", "parts": [{"text": build_daily_meal_plan_delta(day_str)}]}],
+                    "generationConfig": daily_meal_plan_payload["generationConfig"]
+                })
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code not in (400, 403, 404):
+                    raise
+                # The context expired or was deleted server-side: send the self-contained prompt instead
+                get_shared_context_cache().invalidate(cached_context)
+                json_string, result = send(daily_meal_plan_payload)
+        outcome["result"] = result
+
+        if json_string:
+            daily_plan_data = extract_json_from_string(json_string)
+            if daily_plan_data and 'meal_plan' in daily_plan_data: # Check for 'meal_plan' key in daily response
+                outcome["plan"] = daily_plan_data
+                response_cache.set(cache_key, daily_plan_data) # Only well-formed plans are cached
+            else:
+                outcome["error"] = f"Could not parse meal plan for {day_str}. Structure unexpected or 'meal_plan' key missing. Raw AI text: {json_string}"
+        else:
+            outcome["error"] = f"Could not generate meal plan for {day_str}. AI response text part missing or malformed. Raw AI response: {result}"
+    except json.JSONDecodeError as e:
+        outcome["error"] = f"Failed to decode JSON for {day_str}. Error: {e}."
+    except requests.exceptions.RequestException as e:
+        outcome["error"] = f"Network error for {day_str}: {e}"
+        outcome["network_error"] = True
+    except Exception as e:
+        outcome["error"] = f"An unexpected error occurred for {day_str}: {e}. Raw response: {outcome['result']}"
+    return outcome
+
+def build_weekly_meal_plan_prompt(day_strs, user_profile, meal_types_to_plan, identified_groceries):
+    # The profile and grocery list are sent once for all days instead of once per day
+    return f"""
+    You are an expert nutritionist and chef, specializing in creating personalized meal plans.
+    Generate a meal plan for each of these {len(day_strs)} days, in order: {', '.join(day_strs)}.
+    Prioritize using the identified groceries, vary the dishes across the week and ensure every day aligns with the user's profile.
+
+    **User Profile:**
+    {_profile_lines(user_profile)}
+    **Meals to Include for each Day:** {', '.join(meal_types_to_plan)}
+    **Identified Groceries available for the week:** {identified_groceries}
+
+    Return {{"days": [...]}} with one entry per day, each with "date", "daily_total_calories" (e.g. '1800 kcal'),
+    "meal_plan" (one entry per meal type above, with "estimated_calories" like '350 kcal', an "ingredients" list
+    and step-by-step "instructions") and "daily_notes". Keep instructions concise.
+    """
+
+def weekly_output_token_budget(n_days, n_meal_types):
+    """Output tokens needed for n_days with n_meal_types each, capped at the model's limit."""
+    needed = WEEK_OVERHEAD_TOKENS + n_days * (TOKENS_PER_DAY_OVERHEAD + n_meal_types * TOKENS_PER_MEAL)
+    return min(MODEL_MAX_OUTPUT_TOKENS, needed)
+
+def build_weekly_meal_plan_payload(day_strs, user_profile, meal_types_to_plan, identified_groceries):
+    return {
+        "contents": [{"role": "user", "parts": [{"text": build_weekly_meal_plan_prompt(day_strs, user_profile, meal_types_to_plan, identified_groceries)}]}],
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "responseSchema": WEEKLY_PLAN_SCHEMA,
+            "maxOutputTokens": weekly_output_token_budget(len(day_strs), len(meal_types_to_plan))
+        }
+    }
+
+def usage_tokens(response):
+    """(prompt tokens, output tokens) from a response or stream chunk's usageMetadata, 0 when absent."""
+    usage = (response.get("usageMetadata") or {}) if isinstance(response, dict) else {}
+    return usage.get("promptTokenCount", 0), usage.get("candidatesTokenCount", 0)
+
+def cached_prompt_tokens(response):
+    """Prompt tokens served from a cached context (included in the prompt count, billed at a discount)."""
+    usage = (response.get("usageMetadata") or {}) if isinstance(response, dict) else {}
+    return usage.get("cachedContentTokenCount", 0)
+
+def _finish_reason(chunk):
+    candidates = chunk.get("candidates") or []
+    if candidates and isinstance(candidates[0], dict):
+        return candidates[0].get("finishReason")
+    return None
+
+def _strip_leading_fence(text):
+    stripped = text.lstrip()
+    if stripped.startswith("```"):
+        newline = stripped.find("\n")
+        return stripped[newline + 1:] if newline != -1 else ""
+    return text
+
+def request_weekly_meal_plan(client, day_strs, user_profile, meal_types_to_plan, identified_groceries, on_day=None):
+    """
+    Generates every day in one streamed, schema-enforced request. If the model stops with
+    finishReason MAX_TOKENS, the partial output is replayed as the model's turn and it is asked to
+    continue (up to MAX_CONTINUATIONS times). on_day(day_plan) is called as each day completes.
+    Returns a dict with 'plans' ({day: plan}), 'missing' (days without a valid plan), 'calls',
+    'continuations', 'prompt_tokens', 'output_tokens', 'parse_failed' and 'text'.
+    Network errors propagate to the caller.
+    """
+    payload = build_weekly_meal_plan_payload(day_strs, user_profile, meal_types_to_plan, identified_groceries)
+    contents = payload["contents"]
+    stream_parser = MealPlanStreamParser(array_key="days")
+    streamed_days = []
+    text_parts = []
+    outcome = {"plans": {}, "missing": [], "calls": 0, "continuations": 0, "prompt_tokens": 0, "output_tokens": 0, "parse_failed": False, "text": ""}
+
+    for attempt in range(MAX_CONTINUATIONS + 1):
+        finish_reason = None
+        call_usage = (0, 0)
+        first_text = True
+        for chunk in client.stream_generate_content(payload):
+            text = extract_response_text(chunk)
+            if text:
+                if attempt > 0 and first_text:
+                    text = _strip_leading_fence(text)
+                first_text = False
+                text_parts.append(text)
+                for day_plan in stream_parser.feed(text):
+                    streamed_days.append(day_plan)
+                    if on_day is not None:
+                        on_day(day_plan)
+            finish_reason = _finish_reason(chunk) or finish_reason
+            if chunk.get("usageMetadata"):
+                call_usage = usage_tokens(chunk) # Each chunk carries running totals for the call
+        outcome["calls"] += 1
+        outcome["prompt_tokens"] += call_usage[0]
+        outcome["output_tokens"] += call_usage[1]
+        if finish_reason != "MAX_TOKENS":
+            break
+        outcome["continuations"] += 1
+        # Schema mode would restart the object, so continuations ask for plain text
+        payload = {
+            "contents": contents + [
+                {"role": "model", "parts": [{"text": "".join(text_parts)}]},
+                {"role": "user", "parts": [{"text": CONTINUE_PROMPT}]}
+            ],
+            "generationConfig": {"maxOutputTokens": payload["generationConfig"]["maxOutputTokens"]}
+        }
+
+    outcome["text"] = "".join(text_parts)
+    week = extract_json_from_string(outcome["text"])
+    if isinstance(week, dict) and isinstance(week.get("days"), list):
+        day_plans = week["days"]
+    else:
+        # Keep every day that did complete rather than discarding the whole week
+        outcome["parse_failed"] = True
+        day_plans = streamed_days
+
+    for position, day_plan in enumerate(day_plans):
+        if not isinstance(day_plan, dict) or 'meal_plan' not in day_plan:
+            continue
+        day_str = day_plan.get("date") if day_plan.get("date") in day_strs else None
+        if day_str is None and position < len(day_strs):
+            day_str = day_strs[position] # Fall back to order when the model mangles the date
+        if day_str is not None and day_str not in outcome["plans"]:
+            day_plan["date"] = day_str
+            outcome["plans"][day_str] = day_plan
+    outcome["missing"] = [day_str for day_str in day_strs if day_str not in outcome["plans"]]
+    return outcome
+
+
+def save_plan_to_log(user_id, day_str, plan):
+    """Stores a DayPlan in its daily log, keeping whatever else was logged for that day."""
+    def set_plan(day_log):
+        day_log.meal_plan = plan
+    get_storage().update_daily_log(user_id, day_str, set_plan)
+
+def run_plan_job(client, job, reporter):
+    """
+    Job handler for PLAN_JOB_KIND. params: day_strs, profile, meal_types, groceries, mode,
+    max_workers, force_refresh, stream and use_library. With use_library, slots the recipe library
+    can fill (see smartplate/recipes.py) are taken from it and only the other meal types are requested.
+    Each day is parsed into a DayPlan and checked against the nutrition table, then reported (in its
+    compact form) and saved to its log as soon as it finishes. Days a resumed or retried job already completed are skipped, and days with a
+    checkpoint (see plan_checkpoint_key) are reused instead of being paid for again.
+    """
+    params = job["params"]
+    user_id = job["user_id"]
+    client = client.for_user(user_id) # Queue this job's calls under its user for fair rate limiting
+    done_days = {day_str for day_str, item in job["results"].items() if item["status"] == "done"}
+    day_strs = [day_str for day_str in params["day_strs"] if day_str not in done_days]
+    if not day_strs:
+        return
+    run_started = time.perf_counter()
+    recipe_library = get_recipe_library()
+    library_meals = {}
+    if params.get("use_library", False) and not params.get("force_refresh", False):
+        library_meals = recipe_library.fill(day_strs, params["profile"], params["meal_types"], params["groceries"])
+
+    def finish_day(day_str, plan, error, cached=False):
+        result = None
+        if plan is not None:
+            recipe_library.add_plan(plan, params["profile"]) # Model meals become reusable recipes
+        if error is None and day_str in library_meals:
+            plan = merge_library_meals(plan, library_meals[day_str], params["meal_types"])
+        if plan is not None:
+            day_plan = DayPlan.from_dict(day_str, plan) # Calories are parsed here, once
+            annotate_day_plan(day_plan) # Table calories, carbs and protein per meal; far-off model estimates flagged
+            save_plan_to_log(user_id, day_str, day_plan)
+            day_plan_markdown(day_plan) # Rendered now, so the progress page only looks it up
+            result = day_plan.to_compact()
+        reporter.item_done(day_str, result=result, error=error, cached=cached)
+
+    # Days the library fills completely need no call; the rest are requested for the meal types they
+    # still lack, grouped by those types (usually a single group)
+    groups = {}
+    for day_str in day_strs:
+        missing = tuple(meal_type for meal_type in params["meal_types"] if meal_type not in library_meals.get(day_str, {}))
+        if missing:
+            groups.setdefault(missing, []).append(day_str)
+        else:
+            finish_day(day_str, None, None, cached=True)
+    def generate_group(meal_types, group_days):
+        group_started = time.perf_counter()
+        run = generate_days(client, params, group_days, list(meal_types), finish_day, reporter)
+        generated_meals = (len(group_days) - run["cached_days"]) * len(meal_types)
+        if generated_meals:
+            recipe_library.record_generation(generated_meals, time.perf_counter() - group_started)
+        return run
+
+    totals = dict.fromkeys(RUN_COUNTS, 0)
+    # Groups are independent, so they run side by side rather than adding up their latencies
+    with ThreadPoolExecutor(max_workers=max(1, len(groups))) as executor:
+        for run in executor.map(lambda group: generate_group(*group), list(groups.items())):
+            for name in totals:
+                totals[name] += run[name]
+    plan_run_stats.record(params["mode"], len(day_strs), latency_seconds=time.perf_counter() - run_started,
+                          library_meals=sum(len(meals) for meals in library_meals.values()), **totals)
+
+def generate_days(client, params, day_strs, meal_types, finish_day, reporter):
+    """
+    Requests meal_types for day_strs in the job's mode, passing each day to finish_day(day_str, plan, error, cached).
+    Returns the run's RUN_COUNTS: responded_days counts the days whose response arrived, and only those
+    can be parse_failures; days whose request never got a response are network_errors.
+    """
+    run = dict.fromkeys(RUN_COUNTS, 0)
+    if params["mode"] == WEEKLY_MODE:
+        response_cache = get_response_cache()
+        checkpoint_keys = {
+            day_str: plan_checkpoint_key(day_str, params["profile"], meal_types, params["groceries"])
+            for day_str in day_strs
+        }
+        missing_days = []
+        for day_str in day_strs:
+            if params.get("force_refresh", False):
+                response_cache.invalidate(checkpoint_keys[day_str])
+                checkpoint = None
+            else:
+                checkpoint = response_cache.get(checkpoint_keys[day_str])
+            if checkpoint is not None:
+                finish_day(day_str, checkpoint, None, cached=True)
+            else:
+                missing_days.append(day_str)
+        run["cached_days"] = len(day_strs) - len(missing_days)
+        if not missing_days:
+            return run
+
+        def on_day(day_plan):
+            for meal in day_plan.get('meal_plan', []):
+                reporter.partial(day_plan.get("date"), meal)
+
+        # Only the days without a checkpoint are requested, so one failed day does not cost a whole week again
+        week = request_weekly_meal_plan(client, missing_days, params["profile"], meal_types, params["groceries"],
+                                        on_day=on_day if params.get("stream", True) else None)
+        for day_str in missing_days:
+            if day_str in week["plans"]:
+                response_cache.set(checkpoint_keys[day_str], week["plans"][day_str])
+                finish_day(day_str, week["plans"][day_str], None)
+            else:
+                finish_day(day_str, None, f"Could not parse meal plan for {day_str} from the weekly response.")
+        run.update(calls=week["calls"], prompt_tokens=week["prompt_tokens"], output_tokens=week["output_tokens"],
+                   responded_days=len(missing_days), parse_failures=len(week["missing"]))
+        return run
+
+    on_meal = (lambda day_str, meal: reporter.partial(day_str, meal)) if params.get("stream", True) else None
+    # The profile, meal types and groceries are the same for every day: hold them once as a cached context
+    # for the days that will actually be requested (checked without counting, as request_daily_meal_plan looks them up)
+    response_cache = get_response_cache()
+    days_to_request = len(day_strs) if params.get("force_refresh", False) else sum(
+        1 for day_str in day_strs
+        if not response_cache.contains(plan_checkpoint_key(day_str, params["profile"], meal_types, params["groceries"]))
+    )
+    cached_context = get_shared_context_cache().acquire(
+        client, build_daily_meal_plan_context(params["profile"], meal_types, params["groceries"]), uses=days_to_request
+    )
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=max(1, params.get("max_workers", 1))) as executor:
+        futures = [
+            executor.submit(request_daily_meal_plan, client, day_str, params["profile"], meal_types,
+                            params["groceries"], params.get("force_refresh", False), on_meal, cached_context)
+            for day_str in day_strs
+        ]
+        for future in as_completed(futures):
+            outcome = future.result()
+            outcomes.append(outcome)
+            finish_day(outcome["day"], outcome["plan"], outcome["error"], outcome["cached"])
+    run.update(
+        calls=sum(1 for o in outcomes if not o["cached"]),
+        prompt_tokens=sum(o["usage"][0] for o in outcomes),
+        output_tokens=sum(o["usage"][1] for o in outcomes),
+        responded_days=sum(1 for o in outcomes if not o["cached"] and not o["network_error"]),
+        parse_failures=sum(1 for o in outcomes if o["plan"] is None and not o["network_error"]),
+        network_errors=sum(1 for o in outcomes if o["network_error"]),
+        cached_days=sum(1 for o in outcomes if o["cached"]),
+        cached_prompt_tokens=sum(o["cached_tokens"] for o in outcomes)
+    )
+    return run
+
+
+class PlanRunStats:
+    """
+    Process-wide record of plan generation runs, so per-day and weekly modes can be compared
+    on input tokens, latency, parse-failure rate (of the responses that arrived) and network errors.
+    Only running totals per mode are kept, so memory stays constant however many plans the process generates.
+    """
+    FIELDS = ("days", "calls", "prompt_tokens", "output_tokens", "latency_seconds", "responded_days", "parse_failures",
+              "network_errors", "cached_days", "cached_prompt_tokens", "library_meals")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {} # mode -> {"runs": count, field: sum over runs}
+
+    def record(self, mode, days, calls, prompt_tokens, output_tokens, latency_seconds, responded_days, parse_failures,
+               network_errors=0, cached_days=0, cached_prompt_tokens=0, library_meals=0):
+        run = {
+            "days": days, "calls": calls, "prompt_tokens": prompt_tokens, "output_tokens": output_tokens,
+            "latency_seconds": latency_seconds, "responded_days": responded_days, "parse_failures": parse_failures,
+            "network_errors": network_errors, "cached_days": cached_days,
+            "cached_prompt_tokens": cached_prompt_tokens, "library_meals": library_meals
+        }
+        with self._lock:
+            totals = self._totals.setdefault(mode, dict.fromkeys(("runs",) + self.FIELDS, 0))
+            totals["runs"] += 1
+            for field in self.FIELDS:
+                totals[field] += run[field]
+
+    def comparison(self):
+        """One row per mode: run count and per-run averages."""
+        with self._lock:
+            all_totals = {mode: dict(totals) for mode, totals in self._totals.items()}
+        rows = []
+        for mode in sorted(all_totals):
+            totals = all_totals[mode]
+            n = totals["runs"]
+            total_prompt_tokens = totals["prompt_tokens"]
+            total_cached_tokens = totals["cached_prompt_tokens"]
+            rows.append({
+                "Mode": mode,
+                "Runs": n,
+                "Avg calls": round(totals["calls"] / n, 1),
+                "Avg input tokens": round(total_prompt_tokens / n),
+                # Input tokens served from a shared cached context rather than re-sent at the full rate
+                "Avg cached input tokens": round(total_cached_tokens / n),
+                "Input from cache": f"{total_cached_tokens / total_prompt_tokens:.0%}" if total_prompt_tokens else "0%",
+                "Avg output tokens": round(totals["output_tokens"] / n),
+                "Avg latency (s)": round(totals["latency_seconds"] / n, 2),
+                # Only days whose response arrived can fail to parse; requests that got no response are network errors
+                "Parse failure rate": f"{totals['parse_failures'] / totals['responded_days']:.0%}" if totals["responded_days"] else "0%",
+                "Network errors": totals["network_errors"],
+                "Cached days": totals["cached_days"],
+                "Meals from library": totals["library_meals"]
+            })
+        return rows
+
+
+plan_run_stats = PlanRunStats()
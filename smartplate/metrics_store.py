@@ -0,0 +1,69 @@
+"""
+Columnar, pandas-backed view of a user's daily metrics.
+Rows come from StorageBackend.load_metrics() as columns, are laid onto a gap-free daily
+DatetimeIndex with NumPy (missing days are NaN), and all rollups are vectorized pandas calls.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from smartplate.storage import METRIC_FIELDS
+
+# Rollup periods offered in the UI -> pandas resample rule ("S" variants label each bucket by its first day)
+ROLLUP_RULES = {"Daily": "D", "Weekly": "W-MON", "Monthly": "MS", "Yearly": "YS"}
+
+
+class MetricsStore:
+    def __init__(self, frame):
+        self.frame = frame # DatetimeIndex (one row per day), float64 column per metric
+
+    @classmethod
+    def from_columns(cls, columns, start_date, end_date, fields=METRIC_FIELDS):
+        """Builds the daily frame for [start_date, end_date] from load_metrics()-style columns."""
+        start = np.datetime64(start_date, "D")
+        n_days = (np.datetime64(end_date, "D") - start).astype(int) + 1
+        index = pd.date_range(start_date, periods=n_days, freq="D")
+        data = {}
+        if columns["date"]:
+            # Scatter the stored rows into their day slots in one shot instead of a per-day lookup
+            positions = (np.array(columns["date"], dtype="datetime64[D]") - start).astype(int)
+            for field in fields:
+                values = np.full(n_days, np.nan)
+                values[positions] = np.array(columns[field], dtype=float) # None becomes NaN
+                data[field] = values
+        else:
+            data = {field: np.full(n_days, np.nan) for field in fields}
+        return cls(pd.DataFrame(data, index=index))
+
+    @classmethod
+    def load(cls, storage, user_id, start_date, end_date, fields=METRIC_FIELDS):
+        columns = storage.load_metrics(user_id, start_date.isoformat(), end_date.isoformat(), fields)
+        return cls.from_columns(columns, start_date, end_date, fields)
+
+    @classmethod
+    def load_last_days(cls, storage, user_id, days, end_date=None):
+        end_date = end_date or date.today()
+        return cls.load(storage, user_id, end_date - timedelta(days=days - 1), end_date)
+
+    @property
+    def empty(self):
+        return bool(self.frame.isna().all().all())
+
+    def rollup(self, period="Weekly", stats=("mean", "min", "max")):
+        """
+        Aggregates every metric per period. Returns a frame with (metric, stat) columns;
+        days without a value are ignored rather than counted as zero.
+        """
+        rule = ROLLUP_RULES[period]
+        if rule == "D":
+            return pd.concat({stat: self.frame for stat in stats}, axis=1).swaplevel(axis=1).sort_index(axis=1)
+        return self.frame.resample(rule).agg(list(stats))
+
+    def rolling_mean(self, window_days, min_periods=1):
+        """Trailing rolling average over calendar days (missing days are skipped, not zero-filled)."""
+        return self.frame.rolling(window_days, min_periods=min_periods).mean()
+
+    def summary(self, stats=("mean", "min", "max", "count")):
+        """One row per metric with whole-range statistics."""
+        return self.frame.agg(list(stats)).T
@@ -0,0 +1,401 @@
+"""
+Offline stand-in for the Gemini generateContent / streamGenerateContent endpoints.
+Answers every request the app makes (grocery list, per-day and weekly plans, meal photo
+estimates, guidance) with deterministic, well-formed responses, and can inject latency,
+HTTP errors, MAX_TOKENS truncation and malformed JSON at configurable rates. cachedContents
+are emulated too: a request naming one is answered as if its stored prefix had been sent, and
+reports cachedContentTokenCount.
+
+Point the app at it with GEMINI_API_URL, e.g.:
+    python -m smartplate.mock_gemini --port 8765 --latency lognormal --latency-ms 800
+    GEMINI_API_URL=http://127.0.0.1:8765/v1beta/models/gemini-2.0-flash:generateContent?key=mock streamlit run SmartPlate_AI.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_MODELS = ("fixed", "uniform", "lognormal")
+ERROR_STATUSES = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+CHARS_PER_TOKEN = 4 # Rough token estimate used for usageMetadata and maxOutputTokens
+IMAGE_TOKENS = 258 # What the real API charges per inline image
+STREAM_CHUNK_CHARS = 64 # Text per SSE event
+
+_PATH = re.compile(r"^/v1beta/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)$")
+_CACHED_CONTENTS_PATH = "/v1beta/cachedContents"
+_DAY_PROMPT = re.compile(r"meal plan for \*\*(\d{4}-\d{2}-\d{2})\*\*")
+_WEEK_DAYS = re.compile(r"in order: ([\d\-, ]+)\.")
+_MEAL_TYPES = re.compile(r"\*\*Meals to Include for (?:this|each) Day:\*\* ([^\n]*)")
+_CALORIE_GOAL = re.compile(r"Daily Calorie Goal: (\d+)")
+
+DISHES = (
+    ("Spinach and Feta Omelette", ["eggs", "spinach", "feta", "olive oil"]),
+    ("Chicken Quinoa Bowl", ["chicken breast", "quinoa", "broccoli", "lemon"]),
+    ("Lentil Vegetable Soup", ["lentils", "carrots", "celery", "onion", "tomatoes"]),
+    ("Greek Yogurt Parfait", ["greek yogurt", "berries", "oats", "honey"]),
+    ("Baked Salmon with Greens", ["salmon", "asparagus", "garlic", "olive oil"]),
+    ("Chickpea Salad Wrap", ["chickpeas", "tortilla", "cucumber", "yogurt"]),
+    ("Apple Slices with Peanut Butter", ["apple", "peanut butter"]),
+    ("Turkey Stir-Fry", ["ground turkey", "bell pepper", "soy sauce", "rice"]),
+    ("Banana Oat Pancakes", ["banana", "oats", "eggs", "cinnamon"]),
+    ("Roasted Vegetable Pasta", ["whole wheat pasta", "zucchini", "tomatoes", "basil"]),
+)
+GROCERIES = ("apples", "bananas", "chicken breast", "broccoli", "milk", "eggs", "spinach",
+             "oats", "greek yogurt", "salmon", "lentils", "tomatoes", "rice", "carrots")
+
+
+def _prompt_text(payload):
+    # The system instruction (e.g. from a cached context) followed by the first user turn
+    contents = payload.get("contents") or [{}]
+    parts = ((payload.get("systemInstruction") or {}).get("parts") or []) + contents[0].get("parts", [])
+    return "\n".join(part.get("text", "") for part in parts if isinstance(part, dict))
+
+def _count_prompt_tokens(payload):
+    tokens = 0
+    for turn in [payload.get("systemInstruction") or {}] + (payload.get("contents") or []):
+        for part in turn.get("parts", []):
+            if "text" in part:
+                tokens += len(part["text"]) // CHARS_PER_TOKEN
+            elif "inlineData" in part:
+                tokens += IMAGE_TOKENS
+    return max(tokens, 1)
+
+def _meal(rng, meal_type, calories):
+    dish, ingredients = rng.choice(DISHES)
+    return {
+        "meal_type": meal_type,
+        "dish_name": dish,
+        "estimated_calories": f"{calories} kcal",
+        "ingredients": list(ingredients),
+        "instructions": f"Prepare the {ingredients[0]}, combine with the remaining ingredients and cook until done. Serve warm."
+    }
+
+def _day_plan(rng, day_str, meal_types, calorie_goal):
+    per_meal = max(100, calorie_goal // max(1, len(meal_types)))
+    meals = [_meal(rng, meal_type, per_meal + rng.randrange(-60, 61, 10)) for meal_type in meal_types]
+    total = sum(int(meal["estimated_calories"].split()[0]) for meal in meals)
+    return {"date": day_str, "daily_total_calories": f"{total} kcal", "meal_plan": meals,
+            "daily_notes": "Drink water with every meal and prep lunches the night before."}
+
+def build_response_text(payload):
+    """
+    The full, well-formed text the mock answers payload with, and its kind.
+    Depends only on the system instruction and first user turn, so a continuation request can be
+    answered with the rest of it.
+    """
+    contents = payload.get("contents") or [{}]
+    prompt = _prompt_text(payload)
+    schema = (payload.get("generationConfig") or {}).get("responseSchema") or {}
+    seed = hashlib.sha256(prompt.encode("utf-8"))
+    for part in contents[0].get("parts", []):
+        if isinstance(part, dict) and "inlineData" in part:
+            seed.update(part["inlineData"].get("data", "").encode("utf-8")) # Different photos get different answers
+    rng = random.Random(seed.digest())
+    meal_types = _MEAL_TYPES.search(prompt)
+    meal_types = [m.strip() for m in meal_types.group(1).split(",") if m.strip()] if meal_types else ["Breakfast", "Lunch", "Dinner"]
+    calorie_goal = int(_CALORIE_GOAL.search(prompt).group(1)) if _CALORIE_GOAL.search(prompt) else 2000
+
+    week = _WEEK_DAYS.search(prompt)
+    if "days" in schema.get("properties", {}) or week:
+        day_strs = [d.strip() for d in week.group(1).split(",")] if week else []
+        days = [_day_plan(rng, day_str, meal_types, calorie_goal) for day_str in day_strs]
+        return "weekly_plan", json.dumps({"days": days}, indent=1)
+    day = _DAY_PROMPT.search(prompt)
+    if day:
+        return "day_plan", json.dumps(_day_plan(rng, day.group(1), meal_types, calorie_goal), indent=1)
+    if "meal_description" in schema.get("properties", {}) or "meal_description" in prompt:
+        dish, ingredients = rng.choice(DISHES)
+        return "meal_estimate", json.dumps({
+            "meal_description": f"{dish} ({', '.join(ingredients)})",
+            "estimated_calories": f"{rng.randrange(250, 900, 10)} kcal",
+            "ingredients": list(ingredients)
+        })
+    if "Identify and list all edible food items" in prompt:
+        return "groceries", ", ".join(rng.sample(GROCERIES, 8))
+    return "guidance", (
+        "You are doing well by tracking your meals every day. Aim to fill half your plate with vegetables "
+        "and keep sugary drinks to a minimum. A 20-minute walk after dinner helps steady blood sugar. "
+        "Small, consistent changes add up, so keep going!"
+    )
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    """
+    HTTP server with the fault-injection settings. Every rate is a probability per request;
+    latency is the time to first byte, and streamed chunks are spaced by chunk_delay_ms.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency="fixed", latency_ms=0.0, latency_jitter_ms=0.0, chunk_delay_ms=0.0,
+                 error_rate=0.0, error_statuses=(429, 500, 503), truncate_rate=0.0, malformed_rate=0.0, seed=None,
+                 prefill_ms_per_1k_tokens=0.0, cache_min_tokens=0):
+        if latency not in LATENCY_MODELS:
+            raise ValueError(f"latency must be one of {LATENCY_MODELS}")
+        super().__init__(address, _MockGeminiHandler)
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.chunk_delay_ms = chunk_delay_ms
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.truncate_rate = truncate_rate
+        self.malformed_rate = malformed_rate
+        self.prefill_ms_per_1k_tokens = prefill_ms_per_1k_tokens # Extra time to first byte per 1k uncached prompt tokens
+        self.cache_min_tokens = cache_min_tokens # cachedContents smaller than this are rejected, as the API does
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._cached_contents = {} # name -> (stored payload fields, token count, expiry as time.monotonic())
+        self.stats = {"requests": 0, "errors": 0, "truncated": 0, "malformed": 0, "by_kind": {},
+                      "prompt_tokens": 0, "cached_tokens": 0, "contexts_created": 0}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def api_url(self, model="gemini-2.0-flash", key="mock"):
+        """A generateContent URL for GEMINI_API_URL."""
+        return f"{self.base_url}/models/{model}:generateContent?key={key}"
+
+    def _random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def sample_latency(self):
+        """Seconds before the first byte, drawn from the configured distribution."""
+        if self.latency_ms <= 0:
+            return 0.0
+        with self._lock:
+            if self.latency == "uniform":
+                ms = self._rng.uniform(max(0.0, self.latency_ms - self.latency_jitter_ms), self.latency_ms + self.latency_jitter_ms)
+            elif self.latency == "lognormal":
+                # latency_ms is the median; jitter sets the spread (sigma of the underlying normal)
+                sigma = self.latency_jitter_ms / self.latency_ms if self.latency_jitter_ms else 0.5
+                ms = self._rng.lognormvariate(math.log(self.latency_ms), sigma)
+            else:
+                ms = self.latency_ms
+        return ms / 1000
+
+    def pick_error(self):
+        if self.error_rate and self._random() < self.error_rate:
+            with self._lock:
+                return self._rng.choice(self.error_statuses)
+        return None
+
+    def record(self, kind, prompt_tokens=0, cached_tokens=0, **flags):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["by_kind"][kind] = self.stats["by_kind"].get(kind, 0) + 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["cached_tokens"] += cached_tokens
+            for flag, value in flags.items():
+                if value:
+                    self.stats[flag] += 1
+
+    def store_cached_content(self, body):
+        """Stores a cachedContents create request; returns (name, token count), or (None, token count) if too small."""
+        stored = {"systemInstruction": body.get("systemInstruction") or {"parts": []}, "contents": body.get("contents") or []}
+        tokens = _count_prompt_tokens(stored)
+        if tokens < self.cache_min_tokens:
+            return None, tokens
+        ttl_seconds = float(str(body.get("ttl", "3600s")).rstrip("s") or 3600)
+        name = f"cachedContents/{hashlib.sha256(json.dumps(stored, sort_keys=True).encode('utf-8')).hexdigest()[:16]}"
+        with self._lock:
+            self._cached_contents[name] = (stored, tokens, time.monotonic() + ttl_seconds)
+            self.stats["contexts_created"] += 1
+        return name, tokens
+
+    def resolve_cached_content(self, name):
+        """(stored payload fields, token count) for a live cached context, or None if unknown or expired."""
+        with self._lock:
+            entry = self._cached_contents.get(name)
+            if entry is None or entry[2] <= time.monotonic():
+                self._cached_contents.pop(name, None)
+                return None
+        return entry[0], entry[1]
+
+
+class _MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, so the client's connection pool is exercised as in production
+    disable_nagle_algorithm = True # Headers and body are separate writes; Nagle would hold the body for a delayed ACK
+
+    def log_message(self, format, *args):
+        pass # Request logging would dominate benchmark output
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        path = self.path.partition("?")[0]
+        match = _PATH.match(path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length)
+        if path == _CACHED_CONTENTS_PATH:
+            self._create_cached_content(raw_body)
+            return
+        if match is None:
+            self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {self.path}", "status": "NOT_FOUND"}})
+            return
+        try:
+            payload = json.loads(raw_body)
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": {"code": 400, "message": f"Invalid JSON payload: {e}", "status": "INVALID_ARGUMENT"}})
+            return
+
+        time.sleep(server.sample_latency())
+        status = server.pick_error()
+        if status is not None:
+            server.record("error", errors=True)
+            self._send_json(status, {"error": {"code": status, "message": "Injected by mock server", "status": ERROR_STATUSES.get(status, "UNKNOWN")}})
+            return
+
+        cached_tokens = 0
+        if payload.get("cachedContent"):
+            cached = server.resolve_cached_content(payload["cachedContent"])
+            if cached is None:
+                self._send_json(404, {"error": {"code": 404, "message": f"CachedContent not found: {payload['cachedContent']}", "status": "NOT_FOUND"}})
+                return
+            stored, cached_tokens = cached
+            # Answer as if the stored prefix had been sent with the request
+            payload = dict(payload, systemInstruction=stored["systemInstruction"], contents=stored["contents"] + (payload.get("contents") or []))
+
+        contents = payload.get("contents") or [{}]
+        kind, text = build_response_text(payload)
+        if len(contents) > 1 and contents[-2].get("role") == "model":
+            # Continuation after MAX_TOKENS: answer with whatever the model turn has not covered yet
+            already_sent = "".join(part.get("text", "") for part in contents[-2].get("parts", []))
+            text = text[len(already_sent):] if text.startswith(already_sent) else text
+            kind = "continuation"
+
+        finish_reason = "STOP"
+        max_output_tokens = (payload.get("generationConfig") or {}).get("maxOutputTokens")
+        truncated = False
+        if max_output_tokens and len(text) > max_output_tokens * CHARS_PER_TOKEN:
+            text, truncated = text[:max_output_tokens * CHARS_PER_TOKEN], True
+        elif kind != "guidance" and server.truncate_rate and server._random() < server.truncate_rate:
+            text, truncated = text[:max(1, int(len(text) * (0.3 + 0.6 * server._random())))], True
+        if truncated:
+            finish_reason = "MAX_TOKENS"
+        malformed = False
+        if not truncated and kind not in ("guidance", "groceries") and server.malformed_rate and server._random() < server.malformed_rate:
+            # A missing comma between two members, the most common way model JSON breaks
+            broken = text.replace('",', '"', 1)
+            malformed = broken != text
+            text = broken
+        prompt_tokens = _count_prompt_tokens(payload)
+        server.record(kind, prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, truncated=truncated, malformed=malformed)
+        if server.prefill_ms_per_1k_tokens:
+            time.sleep(server.prefill_ms_per_1k_tokens * (prompt_tokens - cached_tokens) / 1000 / 1000)
+
+        if match.group("method") == "generateContent":
+            time.sleep(server.chunk_delay_ms / 1000 * math.ceil(len(text) / STREAM_CHUNK_CHARS))
+            self._send_json(200, _response(text, finish_reason, prompt_tokens, len(text) // CHARS_PER_TOKEN, match.group("model"), cached_tokens))
+            return
+
+        # streamGenerateContent?alt=sse: one event per slice of text, sent with chunked encoding
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        slices = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        for position, text_slice in enumerate(slices):
+            if position and server.chunk_delay_ms:
+                time.sleep(server.chunk_delay_ms / 1000)
+            sent += len(text_slice)
+            last = position == len(slices) - 1
+            event = _response(text_slice, finish_reason if last else None, prompt_tokens, sent // CHARS_PER_TOKEN, match.group("model"), cached_tokens)
+            data = f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8")
+            try:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return # The client stopped reading
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _create_cached_content(self, raw_body):
+        server = self.server
+        try:
+            body = json.loads(raw_body)
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": {"code": 400, "message": f"Invalid JSON payload: {e}", "status": "INVALID_ARGUMENT"}})
+            return
+        time.sleep(server.sample_latency())
+        status = server.pick_error()
+        if status is not None:
+            server.record("error", errors=True)
+            self._send_json(status, {"error": {"code": status, "message": "Injected by mock server", "status": ERROR_STATUSES.get(status, "UNKNOWN")}})
+            return
+        name, tokens = server.store_cached_content(body)
+        server.record("cached_content")
+        if name is None:
+            self._send_json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                            "message": f"Cached content is too small. total_token_count={tokens}, min_total_token_count={server.cache_min_tokens}"}})
+            return
+        self._send_json(200, {"name": name, "model": body.get("model"), "usageMetadata": {"totalTokenCount": tokens}})
+
+
+def _response(text, finish_reason, prompt_tokens, output_tokens, model, cached_tokens=0):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens, "totalTokenCount": prompt_tokens + output_tokens}
+    if cached_tokens:
+        usage["cachedContentTokenCount"] = cached_tokens # Included in promptTokenCount, as in the real API
+    return {"candidates": [candidate], "usageMetadata": usage, "modelVersion": model}
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """
+    Starts a MockGeminiServer on a daemon thread and returns it; port=0 picks a free port.
+    Call .shutdown() and .server_close() to stop it. Options are MockGeminiServer's keyword arguments.
+    """
+    server = MockGeminiServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="mock-gemini", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Gemini API stand-in for local runs and benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", choices=LATENCY_MODELS, default="fixed", help="Time-to-first-byte distribution")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed value, uniform centre or lognormal median")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0, help="Uniform half-width or lognormal spread")
+    parser.add_argument("--chunk-delay-ms", type=float, default=0.0, help="Delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429/500/503")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Share of JSON responses cut off with MAX_TOKENS")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of JSON responses with a syntax error")
+    parser.add_argument("--prefill-ms-per-1k-tokens", type=float, default=0.0, help="Extra first-byte delay per 1k uncached prompt tokens")
+    parser.add_argument("--cache-min-tokens", type=int, default=0, help="Reject cachedContents smaller than this")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    server = MockGeminiServer(
+        (args.host, args.port), latency=args.latency, latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms, chunk_delay_ms=args.chunk_delay_ms, error_rate=args.error_rate,
+        truncate_rate=args.truncate_rate, malformed_rate=args.malformed_rate, seed=args.seed,
+        prefill_ms_per_1k_tokens=args.prefill_ms_per_1k_tokens, cache_min_tokens=args.cache_min_tokens
+    )
+    print(f"Mock Gemini listening; set GEMINI_API_URL={server.api_url()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Offline nutrition table (smartplate/data/nutrition.csv) with a fuzzy ingredient index.
+Calories from the model are free text and can be far off; this computes deterministic totals
+from the ingredient lists instead, without another model call. Ingredient strings such as
+"1 cup cooked quinoa" or "chicken breast (150 g), diced" are split into an amount and a food
+name, the name is matched through exact names/aliases and then a character-trigram inverted
+index (Dice overlap, scored for all foods at once with NumPy), and per-meal and per-day totals
+are summed as array arithmetic over the per-100g table.
+"""
+import csv
+import functools
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+# --- Configuration (overridable through environment variables) ---
+NUTRITION_TABLE_PATH = os.environ.get(
+    "SMARTPLATE_NUTRITION_TABLE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "nutrition.csv")
+) # CSV of per-100g kcal/carbs/protein plus typical portion, piece and cup weights in grams
+MIN_SIMILARITY = float(os.environ.get("SMARTPLATE_NUTRITION_MIN_SIMILARITY", "0.5")) # Trigram Dice score a name needs to match a food
+FLAG_TOLERANCE = float(os.environ.get("SMARTPLATE_NUTRITION_TOLERANCE", "0.35")) # Relative gap between model and table calories that is flagged
+MIN_COVERAGE = float(os.environ.get("SMARTPLATE_NUTRITION_MIN_COVERAGE", "0.6")) # Share of ingredients that must match before an estimate is checked
+
+NUTRIENTS = ("kcal", "carbs_g", "protein_g") # Columns of NutritionIndex.per_100g
+DEFAULT_CUP_GRAMS = 150.0 # For foods without a cup weight in the table
+MASS_UNITS = {
+    "g": 1.0, "gram": 1.0, "grams": 1.0, "kg": 1000.0, "oz": 28.35, "ounce": 28.35, "ounces": 28.35,
+    "lb": 453.6, "lbs": 453.6, "pound": 453.6, "pounds": 453.6,
+    "ml": 1.0, "l": 1000.0, "liter": 1000.0, "liters": 1000.0, "litre": 1000.0, "litres": 1000.0
+}
+CUP_UNITS = {"cup": 1.0, "cups": 1.0, "tbsp": 1 / 16, "tablespoon": 1 / 16, "tablespoons": 1 / 16,
+             "tsp": 1 / 48, "teaspoon": 1 / 48, "teaspoons": 1 / 48}
+FIXED_UNITS = {"pinch": 0.5, "dash": 0.5, "handful": 30.0, "handfuls": 30.0, "scoop": 30.0, "scoops": 30.0}
+PIECE_UNITS = {"slice", "slices", "clove", "cloves", "piece", "pieces", "fillet", "fillets", "whole",
+               "small", "medium", "large", "stalk", "stalks", "can", "cans"}
+# Preparation words that do not change which food it is
+DESCRIPTORS = {
+    "of", "a", "an", "the", "and", "or", "to", "taste", "for", "serving", "fresh", "freshly", "chopped", "diced",
+    "sliced", "minced", "grated", "shredded", "cooked", "raw", "uncooked", "boneless", "skinless", "organic",
+    "grilled", "baked", "roasted", "steamed", "boiled", "toasted", "low", "fat", "reduced", "lean", "plain",
+    "unsweetened", "optional", "finely", "roughly", "thinly", "cut", "into", "cubes", "cubed", "pieces", "halved",
+    "drained", "rinsed", "peeled", "crushed", "ground", "frozen", "canned", "about", "approx", "approximately", "some"
+}
+_VULGAR_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3}
+_QUANTITY = re.compile(r"(?P<number>\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?|[½¼¾⅓⅔])(?:\s*-\s*[\d.]+)?\s*(?P<unit>[a-z]+\b)?")
+
+
+def _number(text):
+    text = text.strip()
+    if text in _VULGAR_FRACTIONS:
+        return _VULGAR_FRACTIONS[text]
+    if "/" in text:
+        whole, _, fraction = text.rpartition(" ")
+        numerator, denominator = fraction.split("/")
+        return (float(whole) if whole else 0.0) + float(numerator) / max(float(denominator), 1.0)
+    return float(text)
+
+def normalize_name(text):
+    """Lowercase food name without amounts, notes in parentheses, preparation words or punctuation."""
+    text = re.sub(r"\([^)]*\)", " ", text.lower()).split(",")[0] # "chicken breast, diced" -> "chicken breast"
+    return " ".join(word for word in re.sub(r"[^a-z ]", " ", text).split() if word not in DESCRIPTORS)
+
+def parse_ingredient(text):
+    """(normalized name, amount or None, unit or None) from an ingredient string such as '2 tbsp olive oil'."""
+    lowered = text.lower()
+    match = _QUANTITY.search(lowered)
+    if match is None:
+        return normalize_name(lowered), None, None
+    unit = match.group("unit")
+    if unit not in MASS_UNITS and unit not in CUP_UNITS and unit not in FIXED_UNITS and unit not in PIECE_UNITS:
+        unit = None # "2 eggs": the word after the number is the food itself
+    end = match.end() if unit else match.end("number")
+    return normalize_name(lowered[:match.start()] + " " + lowered[end:]), _number(match.group("number")), unit
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NutritionEstimate:
+    """Table totals for a group of ingredients; matched of total ingredients were found in the table."""
+    __slots__ = ("calories", "carbs", "protein", "matched", "total")
+
+    def __init__(self, calories, carbs, protein, matched, total):
+        self.calories = calories
+        self.carbs = carbs
+        self.protein = protein
+        self.matched = matched
+        self.total = total
+
+    @property
+    def coverage(self):
+        return self.matched / self.total if self.total else 0.0
+
+
+class NutritionIndex:
+    """The nutrition table as NumPy arrays plus the name indexes used to resolve ingredient strings."""
+
+    def __init__(self, path=NUTRITION_TABLE_PATH, min_similarity=MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        names, rows, portions, pieces, cups = [], [], [], [], []
+        entries = [] # (searchable text, food index): every name and alias
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                food = len(names)
+                names.append(row["name"])
+                rows.append([float(row[column]) for column in NUTRIENTS])
+                portions.append(float(row["portion_g"]))
+                pieces.append(float(row["piece_g"]) if row["piece_g"] else math.nan)
+                cups.append(float(row["cup_g"]) if row["cup_g"] else math.nan)
+                for text in [row["name"]] + [alias for alias in row["aliases"].split(";") if alias]:
+                    entries.append((normalize_name(text), food))
+        self.names = names
+        self.per_100g = np.array(rows, dtype=np.float64) # One row per food, columns in NUTRIENTS order
+        self.portion_g = np.array(portions)
+        self.piece_g = np.array(pieces)
+        self.cup_g = np.array(cups)
+
+        self._exact = {}
+        postings = defaultdict(list)
+        for entry, (text, food) in enumerate(entries):
+            self._exact.setdefault(text, food)
+            for gram in _trigrams(text):
+                postings[gram].append(entry)
+        self._postings = {gram: np.array(ids, dtype=np.intp) for gram, ids in postings.items()}
+        self._entry_food = np.array([food for _, food in entries], dtype=np.intp)
+        self._entry_sizes = np.array([len(_trigrams(text)) for text, _ in entries], dtype=np.float64)
+        self.resolve = functools.lru_cache(maxsize=8192)(self._resolve)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _best(self, text):
+        # Dice overlap of text's trigrams with every indexed name at once: 2|A∩B| / (|A| + |B|)
+        grams = _trigrams(text)
+        hits = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not hits:
+            return -1, 0.0
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self._entry_food))
+        scores = 2.0 * overlap / (len(grams) + self._entry_sizes)
+        best = int(scores.argmax())
+        return int(self._entry_food[best]), float(scores[best])
+
+    def match(self, name):
+        """
+        Food index for a normalized name, or -1. Exact word runs are tried before fuzzy ones (so
+        'whole wheat tortilla' is a tortilla, not whole wheat pasta); either way longer runs win,
+        then the rightmost, which is usually the head noun.
+        """
+        if not name:
+            return -1
+        words = name.split()
+        phrases = [" ".join(words[start:start + size]) for size in range(len(words), 0, -1) for start in range(len(words) - size, -1, -1)]
+        for phrase in phrases:
+            if phrase in self._exact:
+                return self._exact[phrase]
+        for phrase in phrases:
+            food, score = self._best(phrase)
+            if score >= self.min_similarity:
+                return food
+        return -1
+
+    def grams(self, food, amount, unit):
+        """Weight in grams of amount units of a food; the table's typical portion when there is no amount."""
+        if amount is None:
+            return float(self.portion_g[food])
+        if unit in MASS_UNITS:
+            return amount * MASS_UNITS[unit]
+        if unit in CUP_UNITS:
+            cup = self.cup_g[food]
+            return amount * CUP_UNITS[unit] * (DEFAULT_CUP_GRAMS if math.isnan(cup) else float(cup))
+        if unit in FIXED_UNITS:
+            return amount * FIXED_UNITS[unit]
+        piece = self.piece_g[food] # A count ("2 eggs", "3 slices bread")
+        return amount * float(self.portion_g[food] if math.isnan(piece) else piece)
+
+    def _resolve(self, ingredient):
+        # (food index or -1, grams); cached, since plans repeat the same ingredient strings
+        name, amount, unit = parse_ingredient(ingredient)
+        food = self.match(name)
+        return (food, self.grams(food, amount, unit)) if food >= 0 else (-1, 0.0)
+
+    def estimate_groups(self, groups):
+        """One NutritionEstimate per list of ingredient strings (e.g. per meal), summed in a single pass."""
+        group_ids, foods, grams, totals = [], [], [], [0] * len(groups)
+        for group, ingredients in enumerate(groups):
+            for ingredient in ingredients:
+                totals[group] += 1
+                food, weight = self.resolve(str(ingredient))
+                if food >= 0:
+                    group_ids.append(group)
+                    foods.append(food)
+                    grams.append(weight)
+        group_ids = np.asarray(group_ids, dtype=np.intp)
+        amounts = self.per_100g[np.asarray(foods, dtype=np.intp)] * (np.asarray(grams, dtype=np.float64) / 100.0)[:, None]
+        sums = np.zeros((len(groups), len(NUTRIENTS)))
+        np.add.at(sums, group_ids, amounts)
+        matched = np.bincount(group_ids, minlength=len(groups))
+        return [
+            NutritionEstimate(float(sums[group, 0]), float(sums[group, 1]), float(sums[group, 2]), int(matched[group]), totals[group])
+            for group in range(len(groups))
+        ]
+
+    def estimate(self, ingredients):
+        return self.estimate_groups([ingredients])[0]
+
+
+def combine(estimates):
+    """Day total of several estimates."""
+    return NutritionEstimate(
+        sum(e.calories for e in estimates), sum(e.carbs for e in estimates), sum(e.protein for e in estimates),
+        sum(e.matched for e in estimates), sum(e.total for e in estimates)
+    )
+
+def is_far_off(model_calories, estimate, tolerance=FLAG_TOLERANCE, min_coverage=MIN_COVERAGE):
+    """True when the model's calories differ from a well-covered table estimate by more than tolerance."""
+    if not model_calories or estimate is None or estimate.calories <= 0 or estimate.coverage < min_coverage:
+        return False
+    return abs(model_calories - estimate.calories) > tolerance * estimate.calories
+
+def annotate_day_plan(day_plan, index=None):
+    """
+    Sets computed_calories, carbs, protein and flagged on each meal of a DayPlan from its ingredients,
+    and flagged on the day for its model total. Returns the day's combined NutritionEstimate.
+    """
+    index = index or get_nutrition_index()
+    estimates = index.estimate_groups([meal.ingredients for meal in day_plan.meals])
+    for meal, estimate in zip(day_plan.meals, estimates):
+        if estimate.matched:
+            meal.computed_calories = round(estimate.calories)
+            meal.carbs = round(estimate.carbs)
+            meal.protein = round(estimate.protein)
+        meal.flagged = is_far_off(meal.calories, estimate)
+    day_estimate = combine(estimates)
+    day_plan.flagged = is_far_off(day_plan.total_calories, day_estimate)
+    return day_estimate
+
+
+_nutrition_index = None
+_nutrition_index_lock = threading.Lock()
+
+def get_nutrition_index():
+    """Returns the process-wide index, loading the table on first use."""
+    global _nutrition_index
+    if _nutrition_index is None:
+        with _nutrition_index_lock:
+            if _nutrition_index is None:
+                _nutrition_index = NutritionIndex()
+    return _nutrition_index
@@ -0,0 +1,228 @@
+"""
+Near-duplicate lookup for analyzed photos, so a meal or receipt uploaded again (recompressed,
+resized, slightly cropped or re-shot) reuses the stored analysis instead of a new vision call.
+Photos are keyed by their 64-bit difference hash (see image_preprocessing.difference_hash) and
+searched by Hamming distance with multi-index hashing: each hash is split into four 16-bit
+parts with one table per part. Two hashes at most r bits apart differ in at most r // 4 bits
+of some part, so a lookup probes the values that close to each part of the query and only
+checks the hashes found there, instead of comparing against every stored one.
+A user's own photos match within SMARTPLATE_PHOTO_MATCH_BITS; other users' photos need the
+stricter SMARTPLATE_PHOTO_SHARED_MATCH_BITS. Hashes are kept in memory; the analyses stay in
+SQLite (SMARTPLATE_PHOTO_INDEX_DB) and are read only for a match.
+"""
+import functools
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+import numpy as np
+
+from smartplate.instrumentation import get_instrumentation
+from smartplate.storage import DB_PATH, STORAGE_BACKEND
+
+# --- Configuration (overridable through environment variables) ---
+PHOTO_INDEX_DB_PATH = os.environ.get(
+    "SMARTPLATE_PHOTO_INDEX_DB", ":memory:" if STORAGE_BACKEND == "memory" else os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "photo_index.db")
+)
+MATCH_BITS = int(os.environ.get("SMARTPLATE_PHOTO_MATCH_BITS", "8")) # Max differing bits (of 64) for the user's own photos
+SHARED_MATCH_BITS = int(os.environ.get("SMARTPLATE_PHOTO_SHARED_MATCH_BITS", "4")) # Same for other users' photos; -1 turns sharing off
+
+HASH_BITS = 64
+PART_BITS = 16
+PARTS = HASH_BITS // PART_BITS
+PART_MASK = (1 << PART_BITS) - 1
+
+
+@functools.lru_cache(maxsize=None)
+def _flip_masks(radius):
+    """Every PART_BITS-bit mask with at most radius bits set, as an array."""
+    masks = [0]
+    for count in range(1, radius + 1):
+        for bits in itertools.combinations(range(PART_BITS), count):
+            masks.append(sum(1 << bit for bit in bits))
+    return np.array(masks, dtype=np.int64)
+
+_BYTE_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+def _popcount(values):
+    """Set bits of each uint64 in values."""
+    if hasattr(np, "bitwise_count"): # NumPy 2
+        return np.bitwise_count(values)
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit values; rows are numbered in insertion order. Each part table
+    is direct-addressed: the rows sorted by that part's value plus an offset per possible value.
+    New values go to a short pending list that is scanned directly and merged into the tables
+    once it reaches MERGE_AT, so adding one value does not rebuild everything.
+    """
+    MERGE_AT = 2048
+
+    def __init__(self, values=()):
+        self._values = np.array(values, dtype=np.uint64)
+        self._pending = []
+        self._build()
+
+    def __len__(self):
+        return len(self._values) + len(self._pending)
+
+    def _build(self):
+        parts = [((self._values >> np.uint64(part * PART_BITS)) & np.uint64(PART_MASK)).astype(np.int64) for part in range(PARTS)]
+        self._rows = [np.argsort(values, kind="stable").astype(np.int32) for values in parts]
+        self._offsets = [np.concatenate(([0], np.cumsum(np.bincount(values, minlength=PART_MASK + 1)))) for values in parts]
+
+    def add(self, value):
+        self._pending.append(value)
+        if len(self._pending) >= self.MERGE_AT:
+            self._values = np.concatenate((self._values, np.array(self._pending, dtype=np.uint64)))
+            self._pending = []
+            self._build()
+        return len(self) - 1
+
+    def search(self, value, max_distance):
+        """(distance, row) for every stored value within max_distance bits, closest first, then oldest."""
+        if max_distance < 0 or not len(self):
+            return []
+        masks = _flip_masks(min(max_distance // PARTS, PART_BITS))
+        found = []
+        for part in range(PARTS):
+            probes = ((value >> (part * PART_BITS)) & PART_MASK) ^ masks
+            starts, ends = self._offsets[part][probes], self._offsets[part][probes + 1]
+            counts = ends - starts
+            total = int(counts.sum())
+            if total:
+                # The concatenated ranges [start, end) of every probed value, without a Python loop
+                positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+                found.append(self._rows[part][positions])
+        matches = []
+        if found:
+            rows = np.concatenate(found) # A row found through several parts is checked more than once; cheaper than deduplicating
+            distances = _popcount(self._values[rows] ^ np.uint64(value))
+            close = distances <= max_distance
+            matches = list(set(zip(distances[close].tolist(), rows[close].tolist())))
+        offset = len(self._values)
+        for i, pending in enumerate(self._pending):
+            distance = (pending ^ value).bit_count()
+            if distance <= max_distance:
+                matches.append((distance, offset + i))
+        matches.sort()
+        return matches
+
+
+class PhotoIndex:
+    def __init__(self, db_path=PHOTO_INDEX_DB_PATH, match_bits=MATCH_BITS, shared_match_bits=SHARED_MATCH_BITS):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self.match_bits = match_bits
+        self.shared_match_bits = shared_match_bits
+        self._kinds = {} # kind -> {"index": HammingIndex, "entry_ids": array, "users": array of user numbers}
+        self._user_numbers = {} # user id -> small int, so rows hold a number rather than a string
+        self._stats = {"lookups": 0, "hits": 0, "shared_hits": 0, "lookup_seconds": 0.0}
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS photo_hashes ("
+                " entry_id INTEGER PRIMARY KEY, kind TEXT NOT NULL, user_id TEXT NOT NULL, dhash INTEGER NOT NULL,"
+                " result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            rows = self._conn.execute("SELECT entry_id, kind, user_id, dhash FROM photo_hashes ORDER BY entry_id").fetchall()
+        loaded = {} # Each kind's tables are built once from all its stored hashes
+        for entry_id, kind, user_id, dhash in rows:
+            values, entry_ids, users = loaded.setdefault(kind, ([], array("q"), array("I")))
+            values.append(dhash & ((1 << HASH_BITS) - 1))
+            entry_ids.append(entry_id)
+            users.append(self._user_numbers.setdefault(user_id, len(self._user_numbers)))
+        for kind, (values, entry_ids, users) in loaded.items():
+            self._kinds[kind] = {"index": HammingIndex(values), "entry_ids": entry_ids, "users": users}
+
+    def __len__(self):
+        return sum(len(entries["index"]) for entries in self._kinds.values())
+
+    def _remember(self, entry_id, kind, user_id, dhash):
+        entries = self._kinds.get(kind)
+        if entries is None:
+            entries = self._kinds[kind] = {"index": HammingIndex(), "entry_ids": array("q"), "users": array("I")}
+        user_number = self._user_numbers.setdefault(user_id, len(self._user_numbers))
+        entries["index"].add(dhash)
+        entries["entry_ids"].append(entry_id)
+        entries["users"].append(user_number)
+
+    def add(self, kind, dhash, user_id, result):
+        """Stores the analysis (JSON-serializable) of a photo with this hash. A None hash is ignored."""
+        if dhash is None:
+            return
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO photo_hashes (kind, user_id, dhash, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, user_id or "", _signed(dhash), json.dumps(result), time.time())
+            )
+            self._remember(cursor.lastrowid, kind, user_id or "", dhash)
+
+    def lookup(self, kind, dhash, user_id):
+        """
+        The stored analysis of the closest earlier photo, as (result, distance, shared), or None.
+        The user's own photos win ties, then the most recent; shared is True for another user's photo.
+        """
+        if dhash is None:
+            return None
+        started = time.perf_counter()
+        best = None
+        with self._lock:
+            entries = self._kinds.get(kind)
+            user_number = self._user_numbers.get(user_id or "")
+            if entries is not None:
+                for distance, row in entries["index"].search(dhash, max(self.match_bits, self.shared_match_bits)):
+                    own = entries["users"][row] == user_number
+                    if distance > (self.match_bits if own else self.shared_match_bits):
+                        continue
+                    rank = (distance, not own, -row)
+                    if best is None or rank < best[0]:
+                        best = (rank, entries["entry_ids"][row], distance, not own)
+            row = None
+            if best is not None:
+                row = self._conn.execute("SELECT result FROM photo_hashes WHERE entry_id = ?", (best[1],)).fetchone()
+            seconds = time.perf_counter() - started
+            self._stats["lookups"] += 1
+            self._stats["lookup_seconds"] += seconds
+            if row is not None:
+                self._stats["hits"] += 1
+                self._stats["shared_hits"] += best[3]
+        instrumentation = get_instrumentation()
+        instrumentation.record("photo_index.lookup", seconds, kind=kind, hit=row is not None)
+        instrumentation.increment("photo_index_lookups", kind=kind, result="hit" if row is not None else "miss")
+        if row is None:
+            return None
+        return json.loads(row[0]), best[2], best[3]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["photos"] = sum(len(entries["index"]) for entries in self._kinds.values())
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["avg_lookup_us"] = stats["lookup_seconds"] / stats["lookups"] * 1e6 if stats["lookups"] else 0.0
+        return stats
+
+
+_photo_index = None
+_photo_index_lock = threading.Lock()
+
+def get_photo_index():
+    """Returns the process-wide index (SMARTPLATE_PHOTO_INDEX_DB), loading the stored hashes on first use."""
+    global _photo_index
+    if _photo_index is None:
+        with _photo_index_lock:
+            if _photo_index is None:
+                _photo_index = PhotoIndex()
+    return _photo_index
@@ -0,0 +1,211 @@
+"""
+The app's pipelines without the UI: grocery identification, weekly plan jobs, meal-photo logging
+and guidance. The Streamlit pages, the batch CLI (smartplate/batch.py) and the HTTP API
+(smartplate/api.py) all call these, so a photo analyzed in one is served from the response cache
+in the others. Every function takes an explicit client and user id instead of reading a session.
+"""
+import functools
+import os
+from datetime import date, timedelta
+
+from smartplate.image_preprocessing import preprocess_image
+from smartplate.jobs import get_job_queue
+from smartplate.meal_photos import add_estimates_to_logs
+from smartplate.meal_plans import PER_DAY_MODE, PLAN_JOB_KIND, PLAN_PROFILE_FIELDS, run_plan_job
+from smartplate.photo_index import get_photo_index
+from smartplate.records import DayPlan
+from smartplate.response_cache import get_response_cache, make_cache_key
+from smartplate.storage import get_storage
+
+# --- Configuration (overridable through environment variables) ---
+GEMINI_API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+PLAN_MAX_WORKERS = int(os.environ.get("SMARTPLATE_PLAN_MAX_WORKERS", "7")) # Per-day plan requests in flight for one job (app and API)
+
+DEFAULT_PROFILE = {"calorie_goal": 2000, "health_conditions": "", "dietary_preferences": "", "fasting_type": "None"}
+DEFAULT_MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snack 1"]
+PLAN_DAYS = 7
+
+
+GROCERY_IDENTIFICATION_PROMPT = """
+                    Analyze the provided image. Identify and list all edible food items you can clearly see.
+                    Ignore non-food items, prices, store names, or any other non-edible text/objects.
+                    List the edible items as a comma-separated string.
+                    Example: "apples, bananas, chicken breast, broccoli, milk, eggs"
+                    """ # Unchanged from the page, so earlier cache entries stay valid
+
+
+def gemini_api_url(api_key=None):
+    """GEMINI_API_URL, or the generateContent URL for GEMINI_MODEL under GEMINI_API_BASE with api_key (default GEMINI_API_KEY)."""
+    if api_key is None:
+        api_key = os.environ.get("GEMINI_API_KEY", "")
+    return os.environ.get("GEMINI_API_URL") or f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:generateContent?key={api_key}"
+
+def load_profile(user_id):
+    """The stored profile's plan fields, with DEFAULT_PROFILE for any that were never saved."""
+    profile = dict(DEFAULT_PROFILE)
+    profile.update({field: value for field, value in (get_storage().load_profile(user_id) or {}).items() if field in PLAN_PROFILE_FIELDS})
+    return profile
+
+
+# --- Groceries ---
+def identify_groceries(client, image_bytes, mime_type, force_refresh=False, user_id=None):
+    """
+    Lists the edible items in a grocery or receipt photo, serving repeated photos from the response
+    cache and near-duplicates from the photo index, as estimate_meal_photo does.
+    Returns a dict with 'groceries' (comma-separated text or None), 'cached', 'match', 'size_report' and
+    'error' (a user-facing message or None); it never raises.
+    """
+    outcome = {"groceries": None, "cached": False, "match": None, "size_report": None, "error": None}
+    prepared_image = preprocess_image(image_bytes, mime_type) # Orient, downsample and strip metadata
+    outcome["size_report"] = prepared_image.size_report()
+    payload = {
+        "contents": [{"role": "user", "parts": [{"text": GROCERY_IDENTIFICATION_PROMPT}, {"inlineData": prepared_image.to_inline_data()}]}]
+    }
+    response_cache = get_response_cache()
+    cache_key = make_cache_key("groceries", {"prompt": GROCERY_IDENTIFICATION_PROMPT}, image_bytes)
+    if force_refresh:
+        response_cache.invalidate(cache_key)
+    try:
+        groceries = response_cache.get(cache_key)
+        if not groceries and not force_refresh:
+            match = get_photo_index().lookup("groceries", prepared_image.dhash, user_id)
+            if match is not None:
+                groceries, distance, shared = match
+                outcome["match"] = {"distance": distance, "shared": shared}
+                response_cache.set(cache_key, groceries)
+        outcome["cached"] = bool(groceries)
+        if not groceries:
+            groceries, _ = client.generate_text(payload)
+            if not groceries:
+                outcome["error"] = "Could not identify groceries from the image. Please try a clearer picture or list them manually below."
+                return outcome
+            response_cache.set(cache_key, groceries)
+            get_photo_index().add("groceries", prepared_image.dhash, user_id, groceries)
+        outcome["groceries"] = groceries
+    except Exception as e:
+        outcome["error"] = f"Error identifying groceries from image: {e}"
+    return outcome
+
+
+# --- Meal plans ---
+def plan_days(start=None, days=PLAN_DAYS):
+    """ISO dates of the days to plan, from start (default today)."""
+    start = start or date.today()
+    return [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+def plan_job_params(profile, meal_types, groceries, day_strs=None, mode=PER_DAY_MODE, max_workers=1,
+                    force_refresh=False, stream=True, use_library=True):
+    """The params of a PLAN_JOB_KIND job (see run_plan_job); the profile is snapshotted to its plan fields."""
+    return {
+        "day_strs": day_strs or plan_days(),
+        "profile": {field: profile[field] for field in PLAN_PROFILE_FIELDS},
+        "meal_types": list(meal_types),
+        "groceries": groceries,
+        "mode": mode,
+        "max_workers": max_workers,
+        "force_refresh": force_refresh,
+        "stream": stream,
+        "use_library": use_library
+    }
+
+def register_plan_jobs(client):
+    """Routes PLAN_JOB_KIND jobs on the process-wide queue to run_plan_job with client (cheap to repeat)."""
+    get_job_queue().register_handler(PLAN_JOB_KIND, functools.partial(run_plan_job, client))
+
+class _CollectingReporter:
+    """A JobReporter stand-in that keeps item results in memory, for plans run on the calling thread."""
+
+    def __init__(self):
+        self.results = {}
+
+    def item_done(self, key, result=None, error=None, cached=False):
+        self.results[key] = {"status": "failed" if error else "done", "result": result, "error": error, "cached": cached}
+
+    def partial(self, key, value):
+        pass
+
+def generate_plan(client, user_id, params):
+    """
+    Runs a plan job to completion on the calling thread (no queue), saving each day to the user's logs.
+    Returns {day: (DayPlan or None, error or None)}.
+    """
+    reporter = _CollectingReporter()
+    run_plan_job(client, {"params": dict(params, stream=False), "user_id": user_id, "results": {}}, reporter)
+    return {
+        day_str: (DayPlan.from_compact(item["result"]) if item["result"] is not None else None, item["error"])
+        for day_str, item in reporter.results.items()
+    }
+
+def day_plan_summary(day_plan):
+    """A DayPlan as plain JSON-ready values, for the CLI's and API's output."""
+    return {
+        "date": day_plan.date, "total_calories": day_plan.total_calories_label, "computed_calories": day_plan.computed_calories,
+        "carbs": day_plan.carbs, "protein": day_plan.protein, "flagged": day_plan.flagged, "notes": day_plan.notes,
+        "meals": [{
+            "meal_type": meal.meal_type, "name": meal.name, "calories": meal.calories_label,
+            "computed_calories": meal.computed_calories, "carbs": meal.carbs, "protein": meal.protein,
+            "flagged": meal.flagged, "ingredients": list(meal.ingredients), "instructions": meal.instructions
+        } for meal in day_plan.meals]
+    }
+
+
+# --- Meal photos ---
+def log_meal_estimates(user_id, entries):
+    """
+    Adds successful photo estimates ((date_str, timestamp, outcome) as for add_estimates_to_logs) to the
+    user's logs, reading every affected day once and writing them back in one batch. Returns the changed dates.
+    """
+    logged_dates = sorted({date_str for date_str, _, outcome in entries if not outcome["error"]})
+    if not logged_dates:
+        return []
+    changed_dates = []
+    def add_estimates(logs):
+        changed_dates[:] = add_estimates_to_logs(logs, entries)
+        return changed_dates
+    # Atomic, so concurrent API requests, batch items or plan jobs for one day cannot drop each other's changes
+    get_storage().update_daily_logs(user_id, logged_dates, add_estimates)
+    return changed_dates
+
+
+# --- Guidance ---
+def build_guidance_prompt(profile, day_log, query, rolling_stats=None):
+    """
+    The coaching prompt for query, given the profile, the day's log (a DayLog) and optionally the
+    user's RollingStats, whose stored windows add weeks of context without reading the history.
+    """
+    trends = rolling_stats.describe() if rolling_stats is not None else []
+    trend_lines = "".join(f"\n            - {line}" for line in trends)
+    history = f"""
+            User's longer-term trends (logged days up to {rolling_stats.as_of}):{trend_lines}""" if trends else ""
+    return f"""
+            You are a supportive and knowledgeable health coach.
+            User's Profile:
+            - Goal: {profile['calorie_goal']} kcal
+            - Health Conditions: {profile['health_conditions'] if profile['health_conditions'].strip() else 'None'}
+            - Dietary Preferences: {profile['dietary_preferences'] if profile['dietary_preferences'].strip() else 'None'}
+            - Fasting Type: {profile['fasting_type']}
+            User's recent activity (if available):
+            - Calories Logged Today: {day_log.logged_calories or 0}
+            - Sugar Reading Today: {day_log.logged_sugar if day_log.logged_sugar is not None else 'N/A'}
+            - Exercise Today: {day_log.logged_exercise or 0} minutes
+            - Steps Today: {day_log.logged_steps or 0} steps
+            - Water Today: {day_log.logged_water or 0.0} liters
+            - Carbs Today: {day_log.logged_carbs or 0} grams{history}
+            User's query: "{query.strip()}"
+
+            Provide concise, actionable, and encouraging guidance (2-4 sentences) based on their profile, recent data, and query.
+            """
+
+def guidance_payload(profile, day_log, query, rolling_stats=None):
+    return {"contents": [{"role": "user", "parts": [{"text": build_guidance_prompt(profile, day_log, query, rolling_stats)}]}]}
+
+def request_guidance(client, user_id, query, day_str=None):
+    """
+    Guidance text for query from the user's profile, their log for day_str (default today) and their
+    rolling statistics; raises on request errors.
+    """
+    storage = get_storage()
+    day_log = storage.load_daily_log(user_id, day_str or date.today().isoformat())
+    text, _ = client.generate_text(guidance_payload(load_profile(user_id), day_log, query, storage.load_rolling_stats(user_id)))
+    return text
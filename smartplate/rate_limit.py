@@ -0,0 +1,293 @@
+"""
+Process-wide traffic shaping for Gemini calls, shared by every Streamlit session and job worker.
+TokenBucketLimiter keeps the process under the API quota: each HTTP attempt takes a token, and
+callers waiting for one are queued per user and served round-robin, so one user's seven-day plan
+cannot starve another user's single request. RequestCoalescer lets concurrent identical payloads
+(same prompt and image bytes) share one upstream call and its result, streamed or not.
+Queue depth and wait times are published through smartplate.instrumentation.
+"""
+import copy
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+from smartplate.instrumentation import get_instrumentation
+
+# --- Configuration (overridable through environment variables) ---
+RATE_LIMIT_RPM = float(os.environ.get("GEMINI_RATE_LIMIT_RPM", "0")) # Requests per minute for the whole process; 0 disables limiting
+RATE_LIMIT_BURST = int(os.environ.get("GEMINI_RATE_LIMIT_BURST", "0")) # Bucket size; 0 means ten seconds' worth of requests
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("GEMINI_RATE_LIMIT_MAX_WAIT", "120")) # Seconds a request may queue before giving up
+COALESCE_REQUESTS = os.environ.get("GEMINI_COALESCE_REQUESTS", "1") == "1" # Share in-flight identical calls
+
+DEFAULT_USER = "anonymous"
+
+
+class RateLimitTimeout(requests.exceptions.RequestException):
+    """Raised when a request waited longer than its limit for a token. Handled like any other network error."""
+
+
+class _Waiter:
+    __slots__ = ("user", "granted")
+
+    def __init__(self, user):
+        self.user = user
+        self.granted = False
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket (rate tokens per second, up to burst) with fair queuing: waiters line up in a
+    FIFO per user, and free tokens go to users in rotation, one request each.
+    """
+
+    def __init__(self, requests_per_minute=RATE_LIMIT_RPM, burst=RATE_LIMIT_BURST, max_wait_seconds=RATE_LIMIT_MAX_WAIT):
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1, burst or int(self.rate * 10))
+        self.max_wait_seconds = max_wait_seconds
+        self._cond = threading.Condition()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._queues = {} # user -> deque of _Waiter
+        self._rotation = deque() # Users with someone waiting, in serving order
+        self._depth = 0
+        self._stats = {"granted": 0, "queued": 0, "timeouts": 0, "max_queue_depth": 0, "total_wait_seconds": 0.0}
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def acquire(self, user=None):
+        """Blocks until a token is granted to this user's request; returns the seconds waited."""
+        if not self.enabled:
+            return 0.0
+        user = user or DEFAULT_USER
+        started = time.monotonic()
+        waiter = _Waiter(user)
+        with self._cond:
+            self._refill(started)
+            if not self._depth and self._tokens >= 1: # Nobody queued: no need to line up
+                self._tokens -= 1
+                self._stats["granted"] += 1
+                return 0.0
+            self._enqueue(waiter)
+            depth_at_enqueue = self._depth
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    granted = self._dispatch()
+                    if granted > waiter.granted:
+                        self._cond.notify_all() # Tokens went to other waiters: wake them now, not at the end of their wait
+                    if waiter.granted:
+                        break
+                    remaining = started + self.max_wait_seconds - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise RateLimitTimeout(f"Waited {self.max_wait_seconds:g}s for a Gemini rate-limit slot ({self._depth} requests queued)")
+                    self._cond.wait(min(remaining, max(0.001, (1 - self._tokens) / self.rate)))
+            finally:
+                if not waiter.granted:
+                    self._remove(waiter)
+            waited = time.monotonic() - started
+            self._stats["total_wait_seconds"] += waited
+            depth = self._depth
+        instrumentation = get_instrumentation()
+        instrumentation.record("gemini.rate_limit_wait", waited, user=user, queue_depth=depth_at_enqueue)
+        instrumentation.set_gauge("gemini_rate_limit_queue_depth", depth)
+        return waited
+
+    def _refill(self, now):
+        self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _enqueue(self, waiter):
+        user_queue = self._queues.get(waiter.user)
+        if user_queue is None:
+            user_queue = self._queues[waiter.user] = deque()
+            self._rotation.append(waiter.user)
+        user_queue.append(waiter)
+        self._depth += 1
+        self._stats["queued"] += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._depth)
+        get_instrumentation().set_gauge("gemini_rate_limit_queue_depth", self._depth)
+
+    def _dispatch(self):
+        # One token per user per turn of the rotation; returns how many waiters were granted one
+        granted = 0
+        while self._tokens >= 1 and self._rotation:
+            user = self._rotation.popleft()
+            user_queue = self._queues[user]
+            user_queue.popleft().granted = True
+            self._tokens -= 1
+            self._depth -= 1
+            self._stats["granted"] += 1
+            granted += 1
+            if user_queue:
+                self._rotation.append(user)
+            else:
+                del self._queues[user]
+        return granted
+
+    def _remove(self, waiter):
+        user_queue = self._queues.get(waiter.user)
+        if user_queue is None or waiter not in user_queue:
+            return
+        user_queue.remove(waiter)
+        self._depth -= 1
+        if not user_queue:
+            del self._queues[waiter.user]
+            self._rotation.remove(waiter.user)
+
+    def stats(self):
+        """Current queue depth per user plus lifetime counts, for the admin page and quota sizing."""
+        with self._cond:
+            self._refill(time.monotonic())
+            stats = dict(self._stats)
+            stats.update(
+                enabled=self.enabled, requests_per_minute=round(self.rate * 60, 1), burst=self.burst,
+                tokens_available=round(self._tokens, 2), queue_depth=self._depth,
+                queued_by_user={user: len(user_queue) for user, user_queue in self._queues.items()}
+            )
+        stats["avg_wait_seconds"] = round(stats["total_wait_seconds"] / stats["queued"], 3) if stats["queued"] else 0.0
+        return stats
+
+
+class _Flight:
+    __slots__ = ("cond", "done", "result", "error", "chunks", "followers")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.result = None
+        self.error = None
+        self.chunks = []
+        self.followers = 0
+
+
+class RequestCoalescer:
+    """Runs at most one upstream call per key at a time; concurrent callers with the same key share it."""
+
+    def __init__(self, enabled=COALESCE_REQUESTS):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    @staticmethod
+    def key(url, body):
+        return hashlib.sha256(url.encode("utf-8") + b"\n" + body.encode("utf-8")).hexdigest()
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self._stats["leaders"] += 1
+                return flight, True
+            flight.followers += 1
+            self._stats["coalesced"] += 1
+        return flight, False
+
+    def _land(self, key, flight, error=None):
+        if error is not None and not isinstance(error, Exception):
+            # KeyboardInterrupt, SystemExit and the like stop the leader's thread, not the followers'
+            error = RuntimeError(f"Shared request was interrupted by {type(error).__name__}")
+        with self._lock:
+            self._flights.pop(key, None)
+            followers = flight.followers
+        with flight.cond:
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+        if followers:
+            get_instrumentation().increment("gemini_coalesced_requests", followers)
+
+    def call(self, key, fn):
+        """fn() for the first caller with this key; callers arriving while it runs get a copy of its result (or its exception)."""
+        if not self.enabled:
+            return fn()
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                flight.result = fn()
+            except BaseException as e: # Followers must be released whatever stops the leader
+                self._land(key, flight, e)
+                raise
+            self._land(key, flight)
+            return flight.result
+        with flight.cond:
+            while not flight.done:
+                flight.cond.wait()
+        if flight.error is not None:
+            raise flight.error
+        return copy.deepcopy(flight.result)
+
+    def stream(self, key, generator_fn):
+        """Like call() for a generator: followers replay the leader's chunks as they arrive."""
+        if not self.enabled:
+            yield from generator_fn()
+            return
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                for chunk in generator_fn():
+                    with flight.cond:
+                        flight.chunks.append(chunk)
+                        flight.cond.notify_all()
+                    yield chunk
+            except GeneratorExit:
+                # The leading caller stopped reading; followers cannot get the rest of the stream
+                self._land(key, flight, requests.exceptions.ChunkedEncodingError("Shared stream was abandoned by its leading request"))
+                raise
+            except BaseException as e:
+                self._land(key, flight, e)
+                raise
+            self._land(key, flight)
+            return
+        position = 0
+        while True:
+            with flight.cond:
+                while position >= len(flight.chunks) and not flight.done:
+                    flight.cond.wait()
+                chunks = flight.chunks[position:]
+                finished = flight.done
+            for chunk in chunks:
+                yield copy.deepcopy(chunk)
+            position += len(chunks)
+            if finished and position >= len(flight.chunks):
+                if flight.error is not None:
+                    raise flight.error
+                return
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(enabled=self.enabled, in_flight=len(self._flights))
+        return stats
+
+
+_rate_limiter = None
+_request_coalescer = None
+_traffic_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Returns the process-wide limiter (GEMINI_RATE_LIMIT_RPM, _BURST and _MAX_WAIT)."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _traffic_lock:
+            if _rate_limiter is None:
+                _rate_limiter = TokenBucketLimiter()
+    return _rate_limiter
+
+def get_request_coalescer():
+    """Returns the process-wide coalescer (GEMINI_COALESCE_REQUESTS)."""
+    global _request_coalescer
+    if _request_coalescer is None:
+        with _traffic_lock:
+            if _request_coalescer is None:
+                _request_coalescer = RequestCoalescer()
+    return _request_coalescer
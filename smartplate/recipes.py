@@ -0,0 +1,330 @@
+"""
+Library of previously generated recipes, shared by all users of the server, used to fill meal
+slots without asking the model again. Every meal of a generated plan is added (add_plan);
+fill() then looks for recipes whose ingredients are available in the identified groceries.
+Ingredients are normalized to nutrition-table food names (smartplate.nutrition) and held in an
+inverted index; a recipe's score is the IDF-weighted share of its ingredients among the
+groceries, so rare ingredients count more than salt or oil, with Jaccard overlap as a
+tie-break. Both are computed for all recipes at once with NumPy. A recipe is only offered
+when it suits the profile: dietary preferences are checked against ingredient categories
+(meat, fish, dairy, ...) found in the ingredients as written, and profiles with health conditions
+or allergies only reuse recipes generated for the same profile.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from smartplate.instrumentation import get_instrumentation
+from smartplate.nutrition import get_nutrition_index, parse_ingredient
+from smartplate.records import parse_calories
+from smartplate.storage import DB_PATH, STORAGE_BACKEND
+
+# --- Configuration (overridable through environment variables) ---
+RECIPES_DB_PATH = os.environ.get(
+    "SMARTPLATE_RECIPES_DB", ":memory:" if STORAGE_BACKEND == "memory" else os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "recipes.db")
+)
+MIN_MATCH = float(os.environ.get("SMARTPLATE_RECIPE_MIN_MATCH", "0.8")) # IDF-weighted share of a recipe's ingredients that must be in the groceries
+CALORIE_TOLERANCE = float(os.environ.get("SMARTPLATE_RECIPE_CALORIE_TOLERANCE", "0.5")) # Allowed gap from the per-meal calorie target
+MAX_RECIPES = int(os.environ.get("SMARTPLATE_RECIPE_LIBRARY_MAX", "5000")) # Oldest recipes are dropped beyond this
+
+JACCARD_WEIGHT = 0.1 # Ranking = match share + JACCARD_WEIGHT * Jaccard overlap
+LIBRARY_NOTES = "Every meal of this day was reused from the recipe library."
+STAPLES = ("salt", "black pepper", "olive oil", "vegetable oil", "water") # Assumed to be in every kitchen
+
+# Ingredient categories, as bits, matched against the words of ingredient names as written (before any
+# nutrition-table mapping, which files "chicken broth" under "vegetable broth")
+MEAT, FISH, DAIRY, EGG, GLUTEN, NUTS, HONEY = (1 << bit for bit in range(7))
+CATEGORY_WORDS = {
+    MEAT: {"chicken", "beef", "pork", "turkey", "lamb", "bacon", "ham", "sausage", "sausages", "steak", "sirloin", "duck",
+           "veal", "prosciutto", "salami", "pepperoni", "chorizo", "meat", "meatballs", "mince", "pancetta", "venison", "bison",
+           "goose", "rabbit", "lard", "suet", "tallow", "gelatin", "gelatine"},
+    FISH: {"salmon", "tuna", "cod", "tilapia", "shrimp", "prawns", "sardines", "fish", "crab", "anchovies", "mackerel",
+           "trout", "halibut", "scallops", "mussels", "seafood", "anchovy", "worcestershire"},
+    DAIRY: {"milk", "cheese", "cheddar", "feta", "mozzarella", "parmesan", "yogurt", "butter", "cream", "whey", "ghee", "ricotta",
+            "paneer", "buttermilk", "kefir"},
+    EGG: {"egg", "eggs", "mayonnaise", "mayo"},
+    GLUTEN: {"bread", "pasta", "spaghetti", "penne", "flour", "tortilla", "tortillas", "wrap", "pita", "bagel", "couscous",
+             "wheat", "barley", "rye", "noodles", "cereal", "toast", "muffin", "soy", "tamari", "seitan", "croutons"},
+    NUTS: {"almond", "almonds", "walnut", "walnuts", "peanut", "peanuts", "cashew", "cashews", "pecans", "pistachios",
+           "hazelnuts", "nut", "nuts"},
+    HONEY: {"honey"}
+}
+PLANT_PREFIXES = {"almond", "oat", "soy", "coconut", "rice", "cashew", "peanut", "plant", "vegan", "corn"} # "almond milk", "corn tortilla", ...
+# Preference wording -> categories it excludes
+PREFERENCE_RULES = (
+    ("vegan", MEAT | FISH | DAIRY | EGG | HONEY), ("vegetarian", MEAT | FISH), ("pescatarian", MEAT), ("pescetarian", MEAT),
+    ("gluten", GLUTEN), ("celiac", GLUTEN), ("coeliac", GLUTEN), ("dairy", DAIRY), ("lactose", DAIRY),
+    ("nut", NUTS), ("egg", EGG)
+)
+PREFERENCE_FILLER = {"free", "no", "none", "diet", "and", "avoid", "without", "n", "a"}
+# Allergies and intolerances are never treated as understood: the word lists are not complete enough to trust with them
+ALLERGY_WORDS = re.compile(r"allerg|intoleran|celiac|coeliac|anaphyla")
+
+
+def ingredient_categories(terms):
+    """Category bits for ingredient names as written (see ingredient_names)."""
+    flags = 0
+    for term in terms:
+        words = term.split()
+        for position, word in enumerate(words):
+            for category, category_words in CATEGORY_WORDS.items():
+                if word in category_words and not (category in (DAIRY, GLUTEN) and position and words[position - 1] in PLANT_PREFIXES):
+                    if category == GLUTEN and word == "soy" and (position + 1 >= len(words) or words[position + 1] != "sauce"):
+                        continue # Only soy sauce carries wheat
+                    flags |= category
+    return flags
+
+def preference_exclusions(dietary_preferences):
+    """
+    (excluded category bits, whether the preferences were fully understood). Preferences naming an
+    allergy or intolerance are never fully understood, so they only reuse recipes from the same profile.
+    """
+    text = (dietary_preferences or "").lower()
+    allergy = ALLERGY_WORDS.search(text) is not None
+    excluded = 0
+    for keyword, categories in PREFERENCE_RULES:
+        if re.search(rf"\b{keyword}", text):
+            excluded |= categories
+            text = re.sub(rf"\b{keyword}\w*", " ", text)
+    return excluded, not allergy and all(word in PREFERENCE_FILLER for word in re.findall(r"[a-z]+", text))
+
+def _profile_key(text):
+    return ",".join(sorted(part.strip() for part in (text or "").lower().split(",") if part.strip() and part.strip() != "none"))
+
+def meal_type_key(meal_type):
+    # "Snack 1" and "Snack 2" share recipes
+    return re.sub(r"[^a-z]+", " ", (meal_type or "").lower()).strip() or "meal"
+
+def ingredient_names(items):
+    """Ingredient strings as normalized names, without amounts but before any nutrition-table mapping."""
+    return [parse_ingredient(str(item))[0] for item in items]
+
+def normalize_terms(items):
+    """Ingredient strings as a sorted tuple of food names (nutrition-table names where they match)."""
+    index = get_nutrition_index()
+    terms = set()
+    for name in ingredient_names(items):
+        food = index.match(name)
+        if food >= 0:
+            terms.add(index.names[food])
+        elif name:
+            terms.add(name)
+    return tuple(sorted(terms))
+
+
+class RecipeLibrary:
+    def __init__(self, db_path=RECIPES_DB_PATH, max_recipes=MAX_RECIPES):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self.max_recipes = max_recipes
+        self._recipes = {} # recipe_id -> dict(meal_type, terms, categories, diet_key, conditions_key, calories, meal); oldest first
+        self._index = None # Rebuilt lazily after the library changes
+        self._stats = {"fills": 0, "slots": 0, "hits": 0, "fill_seconds": 0.0, "generated_meals": 0, "generation_seconds": 0.0}
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS recipes ("
+                " recipe_id TEXT PRIMARY KEY, meal_type TEXT NOT NULL, diet_key TEXT NOT NULL, conditions_key TEXT NOT NULL,"
+                " meal TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            rows = self._conn.execute(
+                "SELECT recipe_id, meal_type, diet_key, conditions_key, meal FROM recipes ORDER BY created_at DESC LIMIT ?", (max_recipes,)
+            ).fetchall()
+        for recipe_id, meal_type, diet_key, conditions_key, meal in reversed(rows):
+            self._remember(recipe_id, meal_type, diet_key, conditions_key, json.loads(meal))
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def _remember(self, recipe_id, meal_type, diet_key, conditions_key, meal):
+        ingredients = meal.get("ingredients") or ()
+        self._recipes[recipe_id] = {
+            "meal_type": meal_type, "terms": normalize_terms(ingredients), "categories": ingredient_categories(ingredient_names(ingredients)), "diet_key": diet_key,
+            "conditions_key": conditions_key, "calories": parse_calories(meal.get("estimated_calories")) or None, "meal": meal
+        }
+
+    # --- Learning ---
+    def add_plan(self, plan, profile):
+        """Adds every well-formed meal of a model day plan ({'meal_plan': [...]}) generated for profile. Returns how many were new."""
+        diet_key = _profile_key(profile.get("dietary_preferences"))
+        conditions_key = _profile_key(profile.get("health_conditions"))
+        added = []
+        for meal in plan.get("meal_plan") or ():
+            if not isinstance(meal, dict) or not meal.get("dish_name") or not isinstance(meal.get("ingredients"), list) or not meal["ingredients"]:
+                continue
+            meal_type = meal_type_key(meal.get("meal_type"))
+            terms = normalize_terms(meal["ingredients"])
+            recipe_id = hashlib.sha256(json.dumps([meal_type, meal["dish_name"].casefold(), terms, diet_key, conditions_key]).encode("utf-8")).hexdigest()
+            added.append((recipe_id, meal_type, diet_key, conditions_key, meal))
+        with self._lock:
+            added = [row for row in added if row[0] not in self._recipes]
+            if not added:
+                return 0
+            now = time.time()
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO recipes (recipe_id, meal_type, diet_key, conditions_key, meal, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(recipe_id, meal_type, diet_key, conditions_key, json.dumps(meal), now) for recipe_id, meal_type, diet_key, conditions_key, meal in added]
+            )
+            for row in added:
+                self._remember(*row)
+            evicted = list(self._recipes)[:max(0, len(self._recipes) - self.max_recipes)]
+            for recipe_id in evicted:
+                del self._recipes[recipe_id]
+            self._conn.executemany("DELETE FROM recipes WHERE recipe_id = ?", [(recipe_id,) for recipe_id in evicted])
+            self._conn.execute("COMMIT")
+            self._index = None
+        return len(added)
+
+    # --- Retrieval ---
+    def _build_index(self):
+        # Inverted index term -> recipe positions, IDF per term and per-recipe totals, as arrays
+        recipes = list(self._recipes.values())
+        vocabulary, postings = {}, []
+        for position, recipe in enumerate(recipes):
+            for term in recipe["terms"]:
+                column = vocabulary.setdefault(term, len(vocabulary))
+                if column == len(postings):
+                    postings.append([])
+                postings[column].append(position)
+        postings = [np.array(rows, dtype=np.intp) for rows in postings]
+        df = np.array([len(rows) for rows in postings], dtype=np.float64)
+        idf = np.log((1 + len(recipes)) / (1 + df)) + 1.0 # Smoothed, always positive
+        weights = np.zeros(len(recipes))
+        for column, rows in enumerate(postings):
+            np.add.at(weights, rows, idf[column])
+        meal_types = {}
+        diet_keys = {}
+        return {
+            "recipes": recipes, "vocabulary": vocabulary, "postings": postings, "idf": idf, "weights": weights,
+            "sizes": np.array([len(recipe["terms"]) for recipe in recipes], dtype=np.float64),
+            "meal_types": meal_types, "meal_type_ids": np.array([meal_types.setdefault(r["meal_type"], len(meal_types)) for r in recipes], dtype=np.intp),
+            "diet_keys": diet_keys, "diet_ids": np.array([diet_keys.setdefault((r["diet_key"], r["conditions_key"]), len(diet_keys)) for r in recipes], dtype=np.intp),
+            "conditions": np.array([bool(r["conditions_key"]) for r in recipes], dtype=bool),
+            "categories": np.array([r["categories"] for r in recipes], dtype=np.int64),
+            "calories": np.array([r["calories"] if r["calories"] else np.nan for r in recipes], dtype=np.float64),
+            "names": np.array([hash(r["meal"]["dish_name"].casefold()) for r in recipes], dtype=np.int64)
+        }
+
+    def scores(self, index, grocery_terms):
+        """(match share, Jaccard overlap) of every recipe with a set of grocery food names."""
+        rows = [index["postings"][index["vocabulary"][term]] for term in grocery_terms if term in index["vocabulary"]]
+        columns = [index["vocabulary"][term] for term in grocery_terms if term in index["vocabulary"]]
+        n = len(index["recipes"])
+        if not rows:
+            return np.zeros(n), np.zeros(n)
+        hits = np.concatenate(rows)
+        matched_weight = np.bincount(hits, weights=np.repeat(index["idf"][columns], [len(r) for r in rows]), minlength=n)
+        matched_count = np.bincount(hits, minlength=n)
+        share = matched_weight / np.maximum(index["weights"], 1e-9)
+        jaccard = matched_count / np.maximum(index["sizes"] + len(grocery_terms) - matched_count, 1)
+        return share, jaccard
+
+    def fill(self, day_strs, profile, meal_types, groceries):
+        """
+        Picks library meals for as many (day, meal type) slots as match well, never repeating a dish
+        within the call. Returns {day: {meal_type: model-format meal dict}}; slots left out need generating.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self._index is None:
+                self._index = self._build_index()
+            index = self._index
+        filled = {}
+        hits = 0
+        if index["recipes"]:
+            grocery_terms = set(normalize_terms(item for item in groceries.split(",") if item.strip())) | set(STAPLES)
+            share, jaccard = self.scores(index, grocery_terms)
+            excluded, understood = preference_exclusions(profile.get("dietary_preferences"))
+            conditions_key = _profile_key(profile.get("health_conditions"))
+            # Recipes made for exactly this profile, or, when the preferences are fully understood and there are
+            # no health conditions, any recipe without an excluded ingredient category and not made for a condition
+            same_profile = index["diet_keys"].get((_profile_key(profile.get("dietary_preferences")), conditions_key), -1)
+            eligible = index["diet_ids"] == same_profile
+            if understood and not conditions_key:
+                eligible |= ((index["categories"] & excluded) == 0) & ~index["conditions"]
+            target = float(profile.get("calorie_goal") or 0) / max(1, len(meal_types))
+            if target > 0:
+                eligible &= np.abs(np.nan_to_num(index["calories"], nan=np.inf) - target) <= CALORIE_TOLERANCE * target
+            eligible &= share >= MIN_MATCH
+            ranking = np.where(eligible, share + JACCARD_WEIGHT * jaccard, -np.inf)
+            used_names = np.zeros(len(index["recipes"]), dtype=bool)
+            for day_str in day_strs:
+                for meal_type in meal_types:
+                    type_id = index["meal_types"].get(meal_type_key(meal_type), -1)
+                    candidates = np.where((index["meal_type_ids"] == type_id) & ~used_names, ranking, -np.inf)
+                    best = int(candidates.argmax())
+                    if not np.isfinite(candidates[best]):
+                        continue
+                    used_names |= index["names"] == index["names"][best]
+                    filled.setdefault(day_str, {})[meal_type] = dict(index["recipes"][best]["meal"], meal_type=meal_type)
+                    hits += 1
+        seconds = time.perf_counter() - started
+        slots = len(day_strs) * len(meal_types)
+        with self._lock:
+            self._stats["fills"] += 1
+            self._stats["slots"] += slots
+            self._stats["hits"] += hits
+            self._stats["fill_seconds"] += seconds
+        instrumentation = get_instrumentation()
+        instrumentation.record("recipes.fill", seconds, slots=slots, hits=hits, recipes=len(index["recipes"]))
+        instrumentation.increment("recipe_library_slots", hits, result="hit")
+        instrumentation.increment("recipe_library_slots", slots - hits, result="miss")
+        return filled
+
+    def record_generation(self, meals, seconds):
+        """Notes how long the model took for a number of meals, to estimate the time library hits save."""
+        with self._lock:
+            self._stats["generated_meals"] += meals
+            self._stats["generation_seconds"] += seconds
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["recipes"] = len(self._recipes)
+        stats["hit_rate"] = stats["hits"] / stats["slots"] if stats["slots"] else 0.0
+        stats["avg_fill_ms"] = stats["fill_seconds"] / stats["fills"] * 1000 if stats["fills"] else 0.0
+        seconds_per_meal = stats["generation_seconds"] / stats["generated_meals"] if stats["generated_meals"] else math.nan
+        stats["seconds_per_generated_meal"] = seconds_per_meal
+        stats["estimated_seconds_saved"] = stats["hits"] * seconds_per_meal - stats["fill_seconds"] if stats["generated_meals"] else math.nan
+        return stats
+
+
+def merge_library_meals(plan, library_meals, meal_types):
+    """
+    A day plan with library meals in their slots and the model's meals (generated for the other
+    slots) in the rest, in meal_types order; the day total covers both. plan may be None for a
+    day filled entirely from the library. The inputs are not modified.
+    """
+    plan = plan or {"meal_plan": [], "daily_total_calories": "0 kcal", "daily_notes": LIBRARY_NOTES}
+    generated = iter([meal for meal in plan.get("meal_plan") or () if isinstance(meal, dict)])
+    meals = []
+    for meal_type in meal_types:
+        meal = library_meals.get(meal_type) or next(generated, None)
+        if meal is not None:
+            meals.append(meal)
+    meals.extend(generated)
+    total = parse_calories(plan.get("daily_total_calories")) + sum(parse_calories(meal.get("estimated_calories")) for meal in library_meals.values())
+    return dict(plan, meal_plan=meals, daily_total_calories=f"{total} kcal")
+
+
+_recipe_library = None
+_recipe_library_lock = threading.Lock()
+
+def get_recipe_library():
+    """Returns the process-wide library (SMARTPLATE_RECIPES_DB)."""
+    global _recipe_library
+    if _recipe_library is None:
+        with _recipe_library_lock:
+            if _recipe_library is None:
+                _recipe_library = RecipeLibrary()
+    return _recipe_library
@@ -0,0 +1,240 @@
+"""
+Typed, compact records for daily logs and meal plans.
+Model output and legacy log dicts are parsed once at ingest (from_dict): calorie strings such as
+"350 kcal" become ints, metric values become numbers, and repeated short strings (meal types,
+ingredients) are interned so every session shares one copy. Storage keeps the positional compact
+form (to_compact / from_stored), which drops the repeated key names of the old nested dicts;
+rows written in the old dict format are still read.
+"""
+import json
+import re
+import sys
+
+COMPACT_VERSION = 1
+# DayLog metric attributes, in compact order; names match storage.METRIC_FIELDS and the old dict keys
+LOG_METRICS = ("logged_calories", "logged_sugar", "logged_carbs", "logged_exercise", "logged_steps", "logged_water")
+
+
+_CALORIE_NUMBER = r"\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?"
+_CALORIE_VALUE = re.compile(rf"({_CALORIE_NUMBER})(?:\s*(?:-|–|to)\s*({_CALORIE_NUMBER}))?")
+
+def parse_calories(estimated_cal_str):
+    # First number in an estimated_calories string, or the middle of a range
+    # (e.g., "500 kcal" -> 500, "350-400 kcal" -> 375, "about 1,200 kcal" -> 1200)
+    match = _CALORIE_VALUE.search(estimated_cal_str) if isinstance(estimated_cal_str, str) else None
+    if match is None:
+        return 0 # Default to 0 if parsing fails
+    low = float(match.group(1).replace(",", ""))
+    high = float(match.group(2).replace(",", "")) if match.group(2) else low
+    return round((low + high) / 2)
+
+def _calories(value):
+    """(kcal as int, original text if it isn't just '<kcal> kcal') from a model or legacy value."""
+    if isinstance(value, bool) or value is None:
+        return None, None
+    if isinstance(value, (int, float)):
+        return int(value), None
+    text = str(value).strip()
+    calories = parse_calories(text)
+    return calories, (None if text == f"{calories} kcal" else text)
+
+def _number(value):
+    # Metric values as int/float, keeping the type they were entered with (number inputs need it); anything else is None
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).strip()
+    for number_type in (int, float):
+        try:
+            return number_type(text)
+        except ValueError:
+            pass
+    return None
+
+def _intern(text):
+    return sys.intern(text) if isinstance(text, str) else text
+
+def _trim(values):
+    # Trailing empty fields are left out of compact lists
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+class MealEntry:
+    """
+    One meal: a planned meal (meal_type, ingredients, instructions) or one logged from a photo (timestamp).
+    computed_calories, carbs and protein come from the nutrition table (smartplate.nutrition), and
+    flagged marks model calories that are far from them. source identifies where a logged meal came
+    from (e.g. a batch item), so it is not logged twice.
+    """
+    __slots__ = ("meal_type", "name", "calories", "calories_text", "ingredients", "instructions", "timestamp",
+                 "computed_calories", "carbs", "protein", "flagged", "source")
+
+    def __init__(self, name, calories=None, calories_text=None, meal_type=None, ingredients=(), instructions=None, timestamp=None,
+                 computed_calories=None, carbs=None, protein=None, flagged=False, source=None):
+        self.meal_type = _intern(meal_type)
+        self.name = name
+        self.calories = calories
+        self.calories_text = calories_text # Only kept when the model wrote more than '<kcal> kcal', e.g. a range
+        self.ingredients = tuple(_intern(item) for item in ingredients)
+        self.instructions = instructions
+        self.timestamp = timestamp
+        self.computed_calories = computed_calories
+        self.carbs = carbs # Grams
+        self.protein = protein # Grams
+        self.flagged = bool(flagged)
+        self.source = source
+
+    @property
+    def calories_label(self):
+        if self.calories_text:
+            return self.calories_text
+        return f"{self.calories} kcal" if self.calories is not None else "N/A"
+
+    @classmethod
+    def from_plan_dict(cls, meal):
+        """A meal from a model plan ({'meal_type', 'dish_name', 'estimated_calories', ...})."""
+        calories, calories_text = _calories(meal.get("estimated_calories"))
+        ingredients = meal.get("ingredients") or ()
+        return cls(
+            meal.get("dish_name", "N/A"), calories, calories_text, meal_type=meal.get("meal_type", "Meal"),
+            ingredients=[str(item) for item in ingredients] if isinstance(ingredients, list) else (),
+            instructions=meal.get("instructions")
+        )
+
+    @classmethod
+    def from_photo_dict(cls, meal):
+        """A meals_logged_from_photo entry ({'description', 'calories', 'timestamp'} and optionally 'carbs', 'flagged', 'source')."""
+        calories, calories_text = _calories(meal.get("calories"))
+        return cls(meal.get("description", "N/A"), calories, calories_text, timestamp=meal.get("timestamp"),
+                   carbs=_number(meal.get("carbs")), flagged=meal.get("flagged", False), source=meal.get("source"))
+
+    def to_compact(self):
+        return _trim([self.name, self.calories, self.calories_text, self.meal_type,
+                      list(self.ingredients) or None, self.instructions, self.timestamp,
+                      self.computed_calories, self.carbs, self.protein, self.flagged or None, self.source])
+
+    @classmethod
+    def from_compact(cls, values):
+        values = list(values) + [None] * (12 - len(values))
+        return cls(values[0], values[1], values[2], values[3], values[4] or (), values[5], values[6],
+                   values[7], values[8], values[9], values[10], values[11])
+
+
+class DayPlan:
+    """One day of a generated meal plan. flagged marks a model day total far from the nutrition table's."""
+    __slots__ = ("date", "total_calories", "total_calories_text", "meals", "notes", "flagged")
+
+    def __init__(self, date, total_calories=None, total_calories_text=None, meals=(), notes=None, flagged=False):
+        self.date = date
+        self.total_calories = total_calories
+        self.total_calories_text = total_calories_text
+        self.meals = tuple(meals)
+        self.notes = notes
+        self.flagged = bool(flagged)
+
+    @property
+    def total_calories_label(self):
+        if self.total_calories_text:
+            return self.total_calories_text
+        return f"{self.total_calories} kcal" if self.total_calories is not None else "N/A"
+
+    def _computed_total(self, attribute):
+        values = [getattr(meal, attribute) for meal in self.meals if getattr(meal, attribute) is not None]
+        return sum(values) if values else None
+
+    @property
+    def computed_calories(self):
+        return self._computed_total("computed_calories")
+
+    @property
+    def carbs(self):
+        return self._computed_total("carbs")
+
+    @property
+    def protein(self):
+        return self._computed_total("protein")
+
+    @classmethod
+    def from_dict(cls, day_str, plan):
+        """Parses a model day plan ({'date', 'daily_total_calories', 'meal_plan', 'daily_notes'})."""
+        total_calories, total_calories_text = _calories(plan.get("daily_total_calories"))
+        meals = [MealEntry.from_plan_dict(meal) for meal in plan.get("meal_plan") or () if isinstance(meal, dict)]
+        return cls(day_str, total_calories, total_calories_text, meals, plan.get("daily_notes") or None)
+
+    def to_compact(self):
+        return _trim([self.date, self.total_calories, self.total_calories_text,
+                      [meal.to_compact() for meal in self.meals], self.notes, self.flagged or None])
+
+    @classmethod
+    def from_compact(cls, values):
+        values = list(values) + [None] * (6 - len(values))
+        return cls(values[0], values[1], values[2], [MealEntry.from_compact(meal) for meal in values[3] or ()], values[4], values[5])
+
+
+class DayLog:
+    """Everything logged for one user and date: metrics, the day's plan and meals logged from photos."""
+    __slots__ = ("date",) + LOG_METRICS + ("meal_plan", "meals_logged_from_photo", "extra")
+
+    def __init__(self, date, meal_plan=None, meals_logged_from_photo=None, extra=None, **metrics):
+        self.date = date
+        for name in LOG_METRICS:
+            setattr(self, name, _number(metrics.pop(name, None)))
+        if metrics:
+            raise TypeError(f"Unknown metrics: {sorted(metrics)}")
+        self.meal_plan = meal_plan
+        self.meals_logged_from_photo = meals_logged_from_photo if meals_logged_from_photo is not None else []
+        self.extra = extra or None # Keys from older dict logs that have no attribute, kept so nothing is lost
+
+    @classmethod
+    def from_dict(cls, day_str, log):
+        """Parses a log in the original nested-dict format."""
+        log = dict(log)
+        metrics = {name: log.pop(name, None) for name in LOG_METRICS}
+        plan = log.pop("meal_plan", None)
+        photo_meals = log.pop("meals_logged_from_photo", None) or []
+        return cls(
+            day_str,
+            meal_plan=DayPlan.from_dict(day_str, plan) if isinstance(plan, dict) else None,
+            meals_logged_from_photo=[MealEntry.from_photo_dict(meal) for meal in photo_meals if isinstance(meal, dict)],
+            extra=log, **metrics
+        )
+
+    @classmethod
+    def coerce(cls, day_str, log):
+        """A DayLog from a DayLog or a legacy dict (e.g. from older callers and seed scripts)."""
+        return log if isinstance(log, cls) else cls.from_dict(day_str, log or {})
+
+    def to_compact(self):
+        compact = {"v": COMPACT_VERSION}
+        metrics = _trim([getattr(self, name) for name in LOG_METRICS])
+        if metrics:
+            compact["m"] = metrics
+        if self.meal_plan is not None:
+            compact["p"] = self.meal_plan.to_compact()
+        if self.meals_logged_from_photo:
+            compact["f"] = [meal.to_compact() for meal in self.meals_logged_from_photo]
+        if self.extra:
+            compact["x"] = self.extra
+        return compact
+
+    def dumps(self):
+        """The compact form as JSON text, for storage."""
+        return json.dumps(self.to_compact(), separators=(",", ":"))
+
+    @classmethod
+    def from_stored(cls, day_str, data):
+        """Reads a stored log: compact JSON (text or decoded) or a row from before the compact format."""
+        if isinstance(data, str):
+            data = json.loads(data)
+        if data.get("v") != COMPACT_VERSION:
+            return cls.from_dict(day_str, data)
+        metrics = list(data.get("m", ())) + [None] * (len(LOG_METRICS) - len(data.get("m", ())))
+        return cls(
+            day_str,
+            meal_plan=DayPlan.from_compact(data["p"]) if "p" in data else None,
+            meals_logged_from_photo=[MealEntry.from_compact(meal) for meal in data.get("f", ())],
+            extra=data.get("x"), **dict(zip(LOG_METRICS, metrics))
+        )
@@ -0,0 +1,92 @@
+"""
+Process-wide memo for page content that is costly to rebuild on every Streamlit rerun.
+A day's meal plan is rendered to one markdown string when it is generated and looked up by a hash
+of the plan afterwards, so the progress page emits one element per day instead of several per
+meal; chart figures are keyed by the user's log version (see StorageBackend.log_version), so they
+are only rebuilt after a log changes.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from smartplate.instrumentation import get_instrumentation
+
+RENDER_CACHE_ENTRIES = int(os.environ.get("SMARTPLATE_RENDER_CACHE_ENTRIES", "512")) # Least recently used entries are dropped beyond this
+
+
+class RenderCache:
+    """A thread-safe LRU of built values, with hit/miss counts per kind."""
+
+    def __init__(self, max_entries=RENDER_CACHE_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_or_build(self, kind, key, build):
+        """The cached value for (kind, key), or build()'s result, which is stored. build runs outside the lock."""
+        cache_key = (kind, key)
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                value = self._entries[cache_key]
+                hit = True
+            else:
+                hit = False
+        get_instrumentation().increment("render_cache", kind=kind, result="hit" if hit else "miss")
+        if hit:
+            return value
+        value = build()
+        with self._lock:
+            self._entries[cache_key] = value
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def plan_hash(day_plan):
+    """Content hash of a DayPlan, from its compact form."""
+    return hashlib.sha256(json.dumps(day_plan.to_compact(), separators=(",", ":")).encode("utf-8")).hexdigest()
+
+def _render_day_plan(day_plan):
+    blocks = [f"**Total Estimated Calories for Day:** {day_plan.total_calories_label}"]
+    if day_plan.computed_calories is not None:
+        blocks.append(f"*From the nutrition table: ~{day_plan.computed_calories} kcal, {day_plan.carbs} g carbs, {day_plan.protein} g protein*")
+    if day_plan.flagged:
+        blocks.append("⚠️ **The AI's daily total is far from what the listed ingredients add up to.**")
+    for meal in day_plan.meals:
+        blocks.append("---")
+        blocks.append(f"#### {meal.meal_type or 'Meal'}: {meal.name}")
+        blocks.append(f"**🔥 Estimated Calories:** {meal.calories_label}")
+        if meal.computed_calories is not None:
+            blocks.append(f"*From the nutrition table: ~{meal.computed_calories} kcal, {meal.carbs} g carbs, {meal.protein} g protein*"
+                          + (" ⚠️ far from the AI estimate" if meal.flagged else ""))
+        blocks.append("**Ingredients:**\n" + "\n".join(f"- {ingredient}" for ingredient in meal.ingredients))
+        blocks.append("**Instructions:**")
+        blocks.append(meal.instructions or "N/A")
+    if day_plan.notes:
+        blocks.append("---")
+        blocks.append(f"**Notes:** {day_plan.notes}")
+    return "\n\n".join(blocks)
+
+def day_plan_markdown(day_plan, render_cache=None):
+    """The markdown for one day's plan (totals, each meal's recipe, notes), rendered once per distinct plan."""
+    return (render_cache or get_render_cache()).get_or_build("plan_markdown", plan_hash(day_plan), lambda: _render_day_plan(day_plan))
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+def get_render_cache():
+    """Returns the process-wide cache (SMARTPLATE_RENDER_CACHE_ENTRIES)."""
+    global _render_cache
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                _render_cache = RenderCache()
+    return _render_cache
@@ -0,0 +1,239 @@
+"""
+Content-addressed cache for Gemini results.
+Keys are a hash of the image bytes plus the normalized prompt/profile fields, so the same photo
+or the same plan request from any session maps to the same entry. Entries live in a memory LRU
+tier backed by a disk tier; both tiers are size-bounded and every entry carries a TTL.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from smartplate.instrumentation import get_instrumentation
+
+# --- Configuration (overridable through environment variables) ---
+CACHE_DIR = os.environ.get("SMARTPLATE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "smartplate", "responses"))
+MEMORY_MAX_BYTES = int(os.environ.get("SMARTPLATE_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+DISK_MAX_BYTES = int(os.environ.get("SMARTPLATE_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+TTL_SECONDS = float(os.environ.get("SMARTPLATE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def _normalize(value):
+    # Case and whitespace differences in free-text fields should not produce different keys
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+def make_cache_key(kind, fields, image_bytes=None):
+    """
+    Builds a key like 'day_plan:<sha256>' from the request kind, the prompt/profile fields
+    and (optionally) the raw image bytes.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(_normalize(fields), sort_keys=True, separators=(",", ":")).encode("utf-8"))
+    if image_bytes is not None:
+        digest.update(b"\x00image\x00")
+        digest.update(hashlib.sha256(image_bytes).digest())
+    return f"{kind}:{digest.hexdigest()}"
+
+
+class ResponseCache:
+    """
+    The lock only guards the memory tier, the counters and the disk tier's size index; file reads,
+    writes and removals happen outside it, so one session's disk I/O never holds up another's lookup.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_max_bytes=MEMORY_MAX_BYTES,
+                 disk_max_bytes=DISK_MAX_BYTES, ttl_seconds=TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._memory = OrderedDict() # key -> (expires_at, serialized value), oldest first
+        self._memory_bytes = 0
+        self._disk_files = None # path -> size, least recently written first; scanned once, on the first disk write
+        self._disk_bytes = 0
+        self._disk_scan_lock = threading.Lock() # Only one thread scans the directory
+        self.hits = 0
+        self.misses = 0
+
+    # --- Memory tier (callers hold self._lock) ---
+    def _memory_put(self, key, expires_at, serialized):
+        if len(serialized) > self.memory_max_bytes:
+            return
+        self._memory_drop(key)
+        self._memory[key] = (expires_at, serialized)
+        self._memory_bytes += len(serialized)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _memory_drop(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+
+    # --- Disk tier (called without self._lock) ---
+    def _path(self, key):
+        kind, _, digest = key.partition(":")
+        return os.path.join(self.cache_dir, kind, f"{digest}.json")
+
+    def _scan_disk(self):
+        # The size index starts from what earlier runs left, oldest first; later writes keep it current
+        if self._disk_files is not None:
+            return
+        with self._disk_scan_lock:
+            if self._disk_files is not None:
+                return
+            found = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".json"):
+                        path = os.path.join(root, name)
+                        try:
+                            found.append((os.path.getmtime(path), os.path.getsize(path), path))
+                        except OSError:
+                            pass
+            with self._lock:
+                self._disk_files = OrderedDict((path, size) for _, size, path in sorted(found))
+                self._disk_bytes = sum(self._disk_files.values())
+
+    def _disk_read(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry["expires_at"], entry["value"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_write(self, key, expires_at, serialized):
+        if self.disk_max_bytes <= 0:
+            return
+        self._scan_disk()
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        body = json.dumps({"expires_at": expires_at, "value": serialized}).encode("utf-8")
+        # Write to a temp file and rename so readers never see a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        evicted = []
+        with self._lock:
+            self._disk_bytes += len(body) - self._disk_files.pop(path, 0)
+            self._disk_files[path] = len(body)
+            if self._disk_bytes > self.disk_max_bytes:
+                # Drop least recently written files until the tier is back under 90% of its budget
+                target = self.disk_max_bytes * 0.9
+                while self._disk_bytes > target and self._disk_files:
+                    old_path, size = self._disk_files.popitem(last=False)
+                    self._disk_bytes -= size
+                    evicted.append(old_path)
+        for old_path in evicted:
+            self._remove_file(old_path)
+
+    def _disk_remove(self, key):
+        path = self._path(key)
+        with self._lock:
+            if self._disk_files is not None:
+                self._disk_bytes -= self._disk_files.pop(path, 0)
+        self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # --- Public API ---
+    def get(self, key):
+        """Returns a fresh copy of the cached value for key, or None on a miss or expired entry."""
+        now = time.time()
+        kind = key.partition(":")[0]
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                tier = "memory"
+            elif entry is not None:
+                self._memory_drop(key)
+                entry = None
+        if entry is None:
+            entry = self._disk_read(key)
+            if entry is not None and entry[0] <= now:
+                self._disk_remove(key)
+                entry = None
+            with self._lock:
+                if entry is not None:
+                    self._memory_put(key, entry[0], entry[1]) # Promote to the memory tier
+                    self.hits += 1
+                    tier = "disk"
+                else:
+                    self.misses += 1
+        if entry is None:
+            get_instrumentation().increment("cache_requests", kind=kind, result="miss", tier="none")
+            return None
+        get_instrumentation().increment("cache_requests", kind=kind, result="hit", tier=tier)
+        return json.loads(entry[1])
+
+    def contains(self, key):
+        """Whether get(key) would hit, without counting a lookup or promoting a disk entry to memory."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                return True
+        entry = self._disk_read(key)
+        return entry is not None and entry[0] > now
+
+    def set(self, key, value, ttl_seconds=None):
+        """Stores a JSON-serializable value under key in both tiers."""
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        serialized = json.dumps(value)
+        with self._lock:
+            self._memory_put(key, expires_at, serialized)
+        try:
+            self._disk_write(key, expires_at, serialized)
+        except OSError:
+            pass # The disk tier is best-effort; the memory tier still serves this process
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory_drop(key)
+        self._disk_remove(key)
+
+    def clear(self, kind=None):
+        """Drops every entry, or only the entries of one kind (e.g. 'groceries')."""
+        prefix = f"{kind}:" if kind else ""
+        directory = os.path.join(self.cache_dir, kind) if kind else self.cache_dir
+        with self._lock:
+            for key in [k for k in self._memory if k.startswith(prefix)]:
+                self._memory_drop(key)
+            if self._disk_files is not None:
+                for path in [p for p in self._disk_files if p.startswith(os.path.join(directory, ""))]:
+                    self._disk_bytes -= self._disk_files.pop(path)
+        for root, _, files in os.walk(directory):
+            for name in files:
+                self._remove_file(os.path.join(root, name))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Returns the process-wide cache shared by all sessions."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,246 @@
+"""
+Rolling statistics over each user's logged metrics, kept current as logs are written so the
+guidance prompt and the progress page get weeks of context without reading the history.
+For every metric and each window in ROLLING_WINDOWS (the N days ending at as_of, the latest
+day with any metric logged) the state keeps running sums: logged days, their total, and the
+sums a least-squares slope needs, plus min, max and, for calories, the days near the goal.
+A write adds its new values and subtracts the ones they replace or that slide out of a window,
+so it reads only those few days' rows, never the history. The exceptions read one window's
+rows: min and max are recomputed when the current extreme leaves a window or is overwritten,
+and clearing the metrics of the latest logged day (the windows then end earlier) rebuilds all.
+The storage backends keep the state next to the logs (see storage.py) and update it in the
+same transaction.
+"""
+import json
+import os
+from datetime import date, timedelta
+
+from smartplate.records import LOG_METRICS
+
+# --- Configuration (overridable through environment variables) ---
+ROLLING_WINDOWS = tuple(sorted(int(days) for days in os.environ.get("SMARTPLATE_ROLLING_WINDOWS", "7,30,90").split(",")))
+ADHERENCE_TOLERANCE = float(os.environ.get("SMARTPLATE_ADHERENCE_TOLERANCE", "0.1")) # A day adheres when calories are within this share of the goal
+
+ADHERENCE_METRIC = "logged_calories"
+METRIC_LABELS = {
+    "logged_calories": ("Calories", "kcal"),
+    "logged_sugar": ("Blood sugar", "mg/dL"),
+    "logged_carbs": ("Carbs", "g"),
+    "logged_exercise": ("Exercise", "min"),
+    "logged_steps": ("Steps", "steps"),
+    "logged_water": ("Water", "L"),
+}
+
+
+def metric_values(day_log):
+    """A DayLog's metrics as a tuple in LOG_METRICS order, as floats or None."""
+    return tuple(float(value) if value is not None else None for value in (getattr(day_log, name) for name in LOG_METRICS))
+
+def window_dates(as_of, days):
+    """The ISO dates of the days-long window ending at as_of, oldest first."""
+    end = date.fromisoformat(as_of)
+    return [(end - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+
+def calorie_goal(profile):
+    """The profile's calorie goal as a float, or None without a profile or goal."""
+    goal = (profile or {}).get("calorie_goal")
+    try:
+        return float(goal) if goal else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _Window:
+    """Running sums over one metric in one window; t is a day's offset from as_of (0 for as_of, negative before)."""
+    __slots__ = ("count", "total", "t_total", "tt_total", "ty_total", "low", "high", "adherent")
+
+    def __init__(self, values=None):
+        self.count, self.total, self.t_total, self.tt_total, self.ty_total, self.low, self.high, self.adherent = values or (0, 0.0, 0.0, 0.0, 0.0, None, None, 0)
+
+    def to_list(self):
+        return [self.count, self.total, self.t_total, self.tt_total, self.ty_total, self.low, self.high, self.adherent]
+
+    def add(self, t, value, adheres):
+        self.count += 1
+        self.total += value
+        self.t_total += t
+        self.tt_total += t * t
+        self.ty_total += t * value
+        self.adherent += adheres
+        self.low = value if self.low is None else min(self.low, value)
+        self.high = value if self.high is None else max(self.high, value)
+
+    def remove(self, t, value, adheres):
+        """Takes a value out; returns True when it was the min or max, which then need a rescan."""
+        self.count -= 1
+        if not self.count:
+            self.__init__() # Also clears the rounding error the sums have built up
+            return False
+        self.total -= value
+        self.t_total -= t
+        self.tt_total -= t * t
+        self.ty_total -= t * value
+        self.adherent -= adheres
+        return value == self.low or value == self.high
+
+    def shift(self, days):
+        # as_of moved forward by days, so every stored offset t becomes t - days
+        self.tt_total += days * days * self.count - 2 * days * self.t_total
+        self.ty_total -= days * self.total
+        self.t_total -= days * self.count
+
+    def summary(self, adherence):
+        if not self.count:
+            return None
+        slope = None
+        spread = self.count * self.tt_total - self.t_total ** 2
+        if self.count > 1 and spread > 1e-9:
+            slope = (self.count * self.ty_total - self.t_total * self.total) / spread
+        return {
+            "days": self.count, "mean": self.total / self.count, "min": self.low, "max": self.high, "slope": slope,
+            "adherence": self.adherent / self.count if adherence else None,
+        }
+
+
+class RollingStats:
+    """One user's windows: {metric: {days: _Window}} ending at as_of, with the calorie goal adherence was counted against."""
+
+    def __init__(self, as_of=None, goal=None):
+        self.as_of = as_of
+        self.goal = goal
+        self.windows = {metric: {days: _Window() for days in ROLLING_WINDOWS} for metric in LOG_METRICS}
+
+    def dumps(self):
+        return json.dumps({
+            "as_of": self.as_of, "goal": self.goal,
+            "windows": {metric: {str(days): window.to_list() for days, window in windows.items()} for metric, windows in self.windows.items()},
+        }, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, data):
+        """The stored state, or None when it was kept for other windows or metrics and needs rebuilding."""
+        data = json.loads(data)
+        windows = data.get("windows", {})
+        if set(windows) != set(LOG_METRICS) or any(set(map(int, kept)) != set(ROLLING_WINDOWS) for kept in windows.values()):
+            return None
+        stats = cls(data["as_of"], data["goal"])
+        for metric, kept in windows.items():
+            for days, values in kept.items():
+                stats.windows[metric][int(days)] = _Window(values)
+        return stats
+
+    @classmethod
+    def from_rows(cls, as_of, rows, goal):
+        """Builds the state from {date: metric values} covering at least the longest window ending at as_of."""
+        stats = cls(as_of, goal)
+        if as_of is not None:
+            for day_str, values in rows.items():
+                stats._add_day(day_str, values)
+        return stats
+
+    def _offset(self, day_str):
+        return (date.fromisoformat(day_str) - date.fromisoformat(self.as_of)).days
+
+    def _adheres(self, metric, value):
+        return metric == ADHERENCE_METRIC and self.goal is not None and abs(value - self.goal) <= ADHERENCE_TOLERANCE * self.goal
+
+    def _add_day(self, day_str, values):
+        t = self._offset(day_str)
+        for metric, value in zip(LOG_METRICS, values or ()):
+            if value is None:
+                continue
+            for days, window in self.windows[metric].items():
+                if -days < t <= 0:
+                    window.add(t, value, self._adheres(metric, value))
+
+    def _remove_day(self, day_str, values, stale, only_days=None):
+        t = self._offset(day_str)
+        for metric, value in zip(LOG_METRICS, values or ()):
+            if value is None:
+                continue
+            for days, window in self.windows[metric].items():
+                if -days < t <= 0 and (only_days is None or days == only_days):
+                    if window.remove(t, value, self._adheres(metric, value)):
+                        stale.add((metric, days))
+
+    def apply(self, changes, read_days, latest_logged):
+        """
+        Updates the windows for written days. changes maps each written date to (old values or None,
+        new values), both metric tuples; read_days(dates) returns {date: values} for the stored days
+        among dates and latest_logged() the latest date with a metric, both as they are after the write.
+        """
+        logged = [day_str for day_str, (_, new) in changes.items() if any(value is not None for value in new)]
+        as_of = max(logged + ([self.as_of] if self.as_of is not None else []), default=None)
+        if as_of is None:
+            return
+        if as_of == self.as_of and as_of in changes and as_of not in logged:
+            # The latest logged day was cleared, so the windows now end at an earlier day
+            as_of = latest_logged()
+            rebuilt = RollingStats.from_rows(as_of, read_days(window_dates(as_of, ROLLING_WINDOWS[-1])) if as_of is not None else {}, self.goal)
+            self.as_of, self.windows = rebuilt.as_of, rebuilt.windows
+            return
+        stale = set()
+        if self.as_of is None:
+            self.as_of = as_of
+        elif as_of > self.as_of:
+            moved = (date.fromisoformat(as_of) - date.fromisoformat(self.as_of)).days
+            # Days that slide out are subtracted with the values the windows counted, i.e. before this write
+            leaving = {}
+            for days in ROLLING_WINDOWS:
+                if moved < days:
+                    leaving[days] = window_dates(self.as_of, days)[:moved]
+            stored = read_days(sorted({day_str for dates in leaving.values() for day_str in dates}))
+            for metric in LOG_METRICS:
+                for days, window in self.windows[metric].items():
+                    if days not in leaving:
+                        self.windows[metric][days] = _Window() # Every counted day is older than the new window
+            for days, dates in leaving.items():
+                for day_str in dates:
+                    values = changes[day_str][0] if day_str in changes else stored.get(day_str)
+                    self._remove_day(day_str, values, stale, only_days=days)
+            for windows in self.windows.values():
+                for window in windows.values():
+                    window.shift(moved)
+            self.as_of = as_of
+        for day_str, (old, new) in changes.items():
+            self._remove_day(day_str, old, stale)
+            self._add_day(day_str, new)
+        if stale:
+            longest = max(days for _, days in stale)
+            rows = read_days(window_dates(self.as_of, longest))
+            for metric, days in stale:
+                window = self.windows[metric][days]
+                column = LOG_METRICS.index(metric)
+                values = [rows[day_str][column] for day_str in window_dates(self.as_of, days) if day_str in rows and rows[day_str][column] is not None]
+                window.low, window.high = (min(values), max(values)) if values else (None, None)
+
+    def summary(self):
+        """
+        {metric: {days: {'days', 'mean', 'min', 'max', 'slope', 'adherence'}}} for metrics logged in any window;
+        'days' counts logged days, 'slope' is the least-squares change per day and 'adherence' the share
+        of logged days within ADHERENCE_TOLERANCE of the calorie goal (calories only).
+        Windows without a logged day are left out.
+        """
+        result = {}
+        for metric, windows in self.windows.items():
+            kept = {days: window.summary(metric == ADHERENCE_METRIC and self.goal is not None) for days, window in windows.items()}
+            kept = {days: values for days, values in kept.items() if values is not None}
+            if kept:
+                result[metric] = kept
+        return result
+
+    def describe(self):
+        """One line per logged metric summarizing every window, e.g. for the guidance prompt."""
+        lines = []
+        for metric, windows in self.summary().items():
+            label, unit = METRIC_LABELS[metric]
+            parts = []
+            for days, values in windows.items():
+                part = f"{days}-day avg {values['mean']:,.1f} {unit} over {values['days']} logged days (range {values['min']:,.1f}-{values['max']:,.1f}"
+                if values["slope"] is not None:
+                    part += f", trend {values['slope']:+,.2f} {unit}/day"
+                if values["adherence"] is not None:
+                    part += f", {values['adherence']:.0%} of days within {ADHERENCE_TOLERANCE:.0%} of goal"
+                parts.append(part + ")")
+            lines.append(f"{label}: " + "; ".join(parts))
+        return lines
@@ -0,0 +1,454 @@
+"""
+Persistent storage for user profiles and daily logs.
+Logs are keyed by (user_id, ISO date) so pages can read just the date window they render, and
+are handled as smartplate.records.DayLog objects, stored in their compact serialized form.
+Each user's rolling statistics (smartplate.rolling_stats) are stored alongside and updated in
+the same write, reading only the days a write adds, replaces or slides out of a window.
+SQLite is the default backend; InMemoryStorage keeps the same interface for tests and demos.
+"""
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from smartplate.instrumentation import get_instrumentation
+from smartplate.records import LOG_METRICS, DayLog
+from smartplate.rolling_stats import ROLLING_WINDOWS, RollingStats, calorie_goal, metric_values, window_dates
+
+# --- Configuration (overridable through environment variables) ---
+STORAGE_BACKEND = os.environ.get("SMARTPLATE_STORAGE", "sqlite") # "sqlite" or "memory"
+DB_PATH = os.environ.get("SMARTPLATE_DB_PATH", os.path.join(os.path.expanduser("~"), ".smartplate", "smartplate.db"))
+
+# Numeric daily metrics that are also kept column-wise for fast range scans and charting
+METRIC_FIELDS = LOG_METRICS
+
+
+class _DayLocks:
+    """Per-(user_id, date) locks for read-modify-write updates, created on demand and dropped once unused."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {} # (user_id, date) -> [lock, holders and waiters]
+
+    @contextmanager
+    def hold(self, user_id, log_dates):
+        keys = sorted({(user_id, log_date) for log_date in log_dates}) # One global order, so overlapping updates cannot deadlock
+        with self._lock:
+            entries = [self._locks.setdefault(key, [threading.Lock(), 0]) for key in keys]
+            for entry in entries:
+                entry[1] += 1
+        for entry in entries:
+            entry[0].acquire()
+        try:
+            yield
+        finally:
+            for entry in reversed(entries):
+                entry[0].release()
+            with self._lock:
+                for key, entry in zip(keys, entries):
+                    entry[1] -= 1
+                    if not entry[1]:
+                        del self._locks[key]
+
+
+def _metric_value(day_log, field):
+    value = getattr(day_log, field)
+    return float(value) if value is not None else None
+
+def _current_rolling_stats(data, goal, read_days, latest_logged):
+    """
+    (RollingStats, rebuilt): the stored state, or one rebuilt from the longest window's rows when
+    there is none yet (e.g. logs written before rolling statistics), it was kept for other
+    windows, or the calorie goal its adherence was counted against has changed.
+    """
+    stats = RollingStats.loads(data) if data else None
+    if stats is not None and stats.goal == goal:
+        return stats, False
+    as_of = stats.as_of if stats is not None else latest_logged()
+    rows = read_days(window_dates(as_of, ROLLING_WINDOWS[-1])) if as_of is not None else {}
+    return RollingStats.from_rows(as_of, rows, goal), True
+
+
+class StorageBackend:
+    """Interface shared by all backends. Dates are ISO 'YYYY-MM-DD' strings; ranges are inclusive."""
+
+    def load_profile(self, user_id):
+        raise NotImplementedError
+
+    def save_profile(self, user_id, profile):
+        raise NotImplementedError
+
+    def load_daily_logs(self, user_id, start_date, end_date):
+        """Returns {date: DayLog} for every stored day in [start_date, end_date]."""
+        raise NotImplementedError
+
+    def upsert_daily_logs(self, user_id, logs):
+        """Inserts or replaces several {date: DayLog} entries in one batch (plain log dicts are parsed first)."""
+        raise NotImplementedError
+
+    def log_version(self, user_id):
+        """A counter that changes whenever any of the user's logs is written, for caching what is derived from them."""
+        raise NotImplementedError
+
+    def load_rolling_stats(self, user_id):
+        """The user's RollingStats (7/30/90-day windows by default), current as of the last log write."""
+        raise NotImplementedError
+
+    def load_metrics(self, user_id, start_date, end_date, fields=METRIC_FIELDS):
+        """
+        Returns the numeric metrics in [start_date, end_date] column-wise:
+        {'date': [...], field: [value or None, ...]} with one row per stored day, in date order.
+        """
+        logs = self.load_daily_logs(user_id, start_date, end_date)
+        columns = {"date": list(logs)}
+        for field in fields:
+            columns[field] = [_metric_value(log_data, field) for log_data in logs.values()]
+        return columns
+
+    def load_daily_log(self, user_id, log_date):
+        return self.load_daily_logs(user_id, log_date, log_date).get(log_date) or DayLog(log_date)
+
+    def save_daily_log(self, user_id, log_date, log_data):
+        self.upsert_daily_logs(user_id, {log_date: log_data})
+
+    def update_daily_logs(self, user_id, log_dates, update):
+        """
+        Atomic read-modify-write of several days: loads {date: DayLog} for log_dates (empty DayLogs for
+        days not stored yet), calls update(logs), which changes them in place and returns the dates it
+        changed (None for all), and saves those. Returns logs. update must not call back into the storage.
+        This default serializes updates per (user_id, date) within the process; SQLiteStorage also
+        covers other processes sharing the database file.
+        """
+        with self._day_locks.hold(user_id, log_dates):
+            logs = self.load_daily_logs(user_id, min(log_dates), max(log_dates)) if log_dates else {}
+            logs = {log_date: logs.get(log_date) or DayLog(log_date) for log_date in log_dates}
+            changed = update(logs)
+            self.upsert_daily_logs(user_id, {log_date: logs[log_date] for log_date in (logs if changed is None else changed)})
+        return logs
+
+    def update_daily_log(self, user_id, log_date, update):
+        """Loads the day's DayLog, applies update(day_log) to it and saves it, atomically; returns it."""
+        def update_day(logs):
+            update(logs[log_date])
+            return [log_date]
+        return self.update_daily_logs(user_id, [log_date], update_day)[log_date]
+
+
+class InMemoryStorage(StorageBackend):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day_locks = _DayLocks()
+        self._profiles = {}
+        self._logs = {} # user_id -> {date: serialized log}
+        self._dates = {} # user_id -> sorted list of dates, for range lookups
+        self._versions = {} # user_id -> log_version
+        self._rolling = {} # user_id -> serialized RollingStats
+
+    def load_profile(self, user_id):
+        with self._lock:
+            data = self._profiles.get(user_id)
+        return json.loads(data) if data is not None else None
+
+    def save_profile(self, user_id, profile):
+        with self._lock:
+            self._profiles[user_id] = json.dumps(profile)
+
+    def load_daily_logs(self, user_id, start_date, end_date):
+        with self._lock:
+            dates = self._dates.get(user_id, [])
+            logs = self._logs.get(user_id, {})
+            lo = bisect.bisect_left(dates, start_date)
+            hi = bisect.bisect_right(dates, end_date)
+            stored = [(d, logs[d]) for d in dates[lo:hi]]
+        # Stored serialized so callers can mutate what they get back without touching the store
+        return {d: DayLog.from_stored(d, data) for d, data in stored}
+
+    def upsert_daily_logs(self, user_id, logs):
+        day_logs = [DayLog.coerce(log_date, log_data) for log_date, log_data in logs.items()]
+        with self._lock:
+            stats, _ = self._rolling_stats(user_id)
+            old_values = self._metric_days(user_id, [day_log.date for day_log in day_logs])
+            user_logs = self._logs.setdefault(user_id, {})
+            dates = self._dates.setdefault(user_id, [])
+            for day_log in day_logs:
+                if day_log.date not in user_logs:
+                    bisect.insort(dates, day_log.date)
+                user_logs[day_log.date] = day_log.dumps()
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            stats.apply(
+                {day_log.date: (old_values.get(day_log.date), metric_values(day_log)) for day_log in day_logs},
+                lambda days: self._metric_days(user_id, days), lambda: self._latest_logged(user_id)
+            )
+            self._rolling[user_id] = stats.dumps()
+
+    def log_version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def load_rolling_stats(self, user_id):
+        with self._lock:
+            stats, rebuilt = self._rolling_stats(user_id)
+            if rebuilt:
+                self._rolling[user_id] = stats.dumps()
+        return stats
+
+    # The helpers below expect the caller to hold self._lock
+    def _metric_days(self, user_id, days):
+        logs = self._logs.get(user_id, {})
+        return {d: metric_values(DayLog.from_stored(d, logs[d])) for d in days if d in logs}
+
+    def _latest_logged(self, user_id):
+        logs = self._logs.get(user_id, {})
+        for d in reversed(self._dates.get(user_id, [])):
+            if any(value is not None for value in metric_values(DayLog.from_stored(d, logs[d]))):
+                return d
+        return None
+
+    def _rolling_stats(self, user_id):
+        profile = self._profiles.get(user_id)
+        return _current_rolling_stats(
+            self._rolling.get(user_id), calorie_goal(json.loads(profile) if profile else None),
+            lambda days: self._metric_days(user_id, days), lambda: self._latest_logged(user_id)
+        )
+
+
+class SQLiteStorage(StorageBackend):
+    def __init__(self, db_path=DB_PATH):
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # One connection shared by all sessions/threads, serialized by a lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_profiles ("
+                " user_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # The (user_id, log_date) primary key doubles as the index for per-user date-range reads
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily_logs ("
+                " user_id TEXT NOT NULL, log_date TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (user_id, log_date)) WITHOUT ROWID"
+            )
+            # Bumped in the same transaction as every log write, so all processes sharing the file see it
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS log_versions (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            # One serialized RollingStats per user, written in the same transaction as the logs it summarizes
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rolling_stats (user_id TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID"
+            )
+            # Metrics are duplicated into typed columns so charts can scan them without decoding JSON
+            existing_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(daily_logs)")}
+            for field in METRIC_FIELDS:
+                if field not in existing_columns:
+                    self._conn.execute(f"ALTER TABLE daily_logs ADD COLUMN {field} REAL")
+                    self._conn.execute(f"UPDATE daily_logs SET {field} = json_extract(data, '$.{field}')")
+
+    def load_profile(self, user_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM user_profiles WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_profile(self, user_id, profile):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO user_profiles (user_id, data, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (user_id, json.dumps(profile), time.time())
+            )
+
+    def load_daily_logs(self, user_id, start_date, end_date):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT log_date, data FROM daily_logs WHERE user_id = ? AND log_date BETWEEN ? AND ? ORDER BY log_date",
+                (user_id, start_date, end_date)
+            ).fetchall()
+        return {log_date: DayLog.from_stored(log_date, data) for log_date, data in rows}
+
+    def log_version(self, user_id):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM log_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def load_rolling_stats(self, user_id):
+        with self._lock:
+            stats, rebuilt = self._rolling_stats(user_id)
+            if rebuilt:
+                self._store_rolling_stats(user_id, stats)
+        return stats
+
+    # The helpers below expect the caller to hold self._lock
+    def _metric_days(self, user_id, days):
+        values = {}
+        for start in range(0, len(days), 500): # Stays under SQLite's bound-parameter limit for long batches
+            chunk = days[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT log_date, {', '.join(METRIC_FIELDS)} FROM daily_logs"
+                f" WHERE user_id = ? AND log_date IN ({', '.join('?' * len(chunk))})",
+                (user_id, *chunk)
+            ).fetchall()
+            values.update((row[0], tuple(row[1:])) for row in rows)
+        return values
+
+    def _latest_logged(self, user_id):
+        row = self._conn.execute(
+            "SELECT MAX(log_date) FROM daily_logs WHERE user_id = ? AND ("
+            + " OR ".join(f"{field} IS NOT NULL" for field in METRIC_FIELDS) + ")",
+            (user_id,)
+        ).fetchone()
+        return row[0]
+
+    def _rolling_stats(self, user_id):
+        profile = self._conn.execute("SELECT data FROM user_profiles WHERE user_id = ?", (user_id,)).fetchone()
+        stored = self._conn.execute("SELECT data FROM rolling_stats WHERE user_id = ?", (user_id,)).fetchone()
+        return _current_rolling_stats(
+            stored[0] if stored else None, calorie_goal(json.loads(profile[0]) if profile else None),
+            lambda days: self._metric_days(user_id, days), lambda: self._latest_logged(user_id)
+        )
+
+    def _store_rolling_stats(self, user_id, stats):
+        self._conn.execute(
+            "INSERT INTO rolling_stats (user_id, data) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+            (user_id, stats.dumps())
+        )
+
+    def load_metrics(self, user_id, start_date, end_date, fields=METRIC_FIELDS):
+        unknown = set(fields) - set(METRIC_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown metric fields: {sorted(unknown)}")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT log_date, {', '.join(fields)} FROM daily_logs"
+                " WHERE user_id = ? AND log_date BETWEEN ? AND ? ORDER BY log_date",
+                (user_id, start_date, end_date)
+            ).fetchall()
+        columns = list(zip(*rows)) if rows else [()] * (len(fields) + 1)
+        return {name: list(values) for name, values in zip(("date",) + tuple(fields), columns)}
+
+    def upsert_daily_logs(self, user_id, logs):
+        day_logs = [DayLog.coerce(log_date, log_data) for log_date, log_data in logs.items()]
+        with self._lock:
+            # One transaction for the whole batch, e.g. all seven days of a weekly plan; IMMEDIATE takes the
+            # write lock before the rolling statistics are read, so another process cannot update them in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_logs(user_id, day_logs)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_daily_logs(self, user_id, log_dates, update):
+        # Read, update and write in one IMMEDIATE transaction: no writer in this or any other process
+        # sharing the file can change these days in between
+        log_dates = list(log_dates)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stored = {}
+                for start in range(0, len(log_dates), 500): # Stays under SQLite's bound-parameter limit
+                    chunk = log_dates[start:start + 500]
+                    stored.update(self._conn.execute(
+                        f"SELECT log_date, data FROM daily_logs WHERE user_id = ? AND log_date IN ({', '.join('?' * len(chunk))})",
+                        (user_id, *chunk)
+                    ).fetchall())
+                logs = {
+                    log_date: DayLog.from_stored(log_date, stored[log_date]) if log_date in stored else DayLog(log_date)
+                    for log_date in log_dates
+                }
+                changed = update(logs)
+                day_logs = [logs[log_date] for log_date in (logs if changed is None else changed)]
+                if day_logs:
+                    self._write_logs(user_id, day_logs)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return logs
+
+    def _write_logs(self, user_id, day_logs):
+        """Writes the logs, bumps the log version and updates the rolling statistics; expects an open transaction."""
+        now = time.time()
+        rows = [
+            (user_id, day_log.date, day_log.dumps(), now) + tuple(_metric_value(day_log, field) for field in METRIC_FIELDS)
+            for day_log in day_logs
+        ]
+        metric_columns = ", ".join(METRIC_FIELDS)
+        metric_updates = ", ".join(f"{field} = excluded.{field}" for field in METRIC_FIELDS)
+        stats, _ = self._rolling_stats(user_id)
+        old_values = self._metric_days(user_id, [day_log.date for day_log in day_logs])
+        self._conn.executemany(
+            f"INSERT INTO daily_logs (user_id, log_date, data, updated_at, {metric_columns})"
+            f" VALUES (?, ?, ?, ?, {', '.join('?' * len(METRIC_FIELDS))})"
+            f" ON CONFLICT(user_id, log_date) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, {metric_updates}",
+            rows
+        )
+        self._conn.execute(
+            "INSERT INTO log_versions (user_id, version) VALUES (?, 1)"
+            " ON CONFLICT(user_id) DO UPDATE SET version = version + 1",
+            (user_id,)
+        )
+        changes = {day_log.date: (old_values.get(day_log.date), metric_values(day_log)) for day_log in day_logs}
+        stats.apply(changes, lambda days: self._metric_days(user_id, days), lambda: self._latest_logged(user_id))
+        self._store_rolling_stats(user_id, stats)
+
+class InstrumentedStorage(StorageBackend):
+    """Wraps a backend so every call is recorded as a 'storage.<method>' span with the rows it touched."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def load_profile(self, user_id):
+        with get_instrumentation().span("storage.load_profile"):
+            return self.backend.load_profile(user_id)
+
+    def save_profile(self, user_id, profile):
+        with get_instrumentation().span("storage.save_profile"):
+            self.backend.save_profile(user_id, profile)
+
+    def load_daily_logs(self, user_id, start_date, end_date):
+        with get_instrumentation().span("storage.load_daily_logs") as span:
+            logs = self.backend.load_daily_logs(user_id, start_date, end_date)
+            span.set(rows=len(logs))
+        return logs
+
+    def upsert_daily_logs(self, user_id, logs):
+        with get_instrumentation().span("storage.upsert_daily_logs", rows=len(logs)):
+            self.backend.upsert_daily_logs(user_id, logs)
+
+    def update_daily_logs(self, user_id, log_dates, update):
+        with get_instrumentation().span("storage.update_daily_logs", rows=len(log_dates)):
+            return self.backend.update_daily_logs(user_id, log_dates, update)
+
+    def log_version(self, user_id):
+        with get_instrumentation().span("storage.log_version"):
+            return self.backend.log_version(user_id)
+
+    def load_rolling_stats(self, user_id):
+        with get_instrumentation().span("storage.load_rolling_stats"):
+            return self.backend.load_rolling_stats(user_id)
+
+    def load_metrics(self, user_id, start_date, end_date, fields=METRIC_FIELDS):
+        with get_instrumentation().span("storage.load_metrics") as span:
+            columns = self.backend.load_metrics(user_id, start_date, end_date, fields)
+            span.set(rows=len(columns["date"]))
+        return columns
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Returns the process-wide backend selected by SMARTPLATE_STORAGE."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = InstrumentedStorage(InMemoryStorage() if STORAGE_BACKEND == "memory" else SQLiteStorage())
+    return _storage
@@ -0,0 +1,61 @@
+"""
+Incremental parsing of streamed meal plan JSON.
+The model streams a day plan as {"date": ..., "meal_plan": [{...}, {...}], ...} in arbitrary
+chunks; MealPlanStreamParser hands back each meal object as soon as its closing brace arrives.
+"""
+import json
+
+
+class MealPlanStreamParser:
+    def __init__(self, array_key="meal_plan"):
+        self.array_key = array_key
+        self._pos = 0 # Absolute offset of the next character to scan
+        self._text = ""
+        self._depth = 0 # Nesting depth counting both {} and []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._last_string = None # Most recent complete string literal (a candidate key)
+        self._current_key = None # Key of the value being parsed at depth 1
+        self._array_depth = None # Depth inside the meal array once it opens
+        self._object_start = None # Offset of the '{' of the meal currently being read
+
+    def feed(self, chunk):
+        """Consumes the next chunk of text and returns the list of meals completed by it."""
+        self._text += chunk
+        completed = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:i]
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and self._current_key == self.array_key:
+                    self._array_depth = self._depth + 1
+                elif ch == "{" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._object_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._object_start is not None and self._depth == self._array_depth:
+                    try:
+                        completed.append(json.loads(text[self._object_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass # A malformed meal is skipped; the full-text parse at the end still sees it
+                    self._object_start = None
+                elif ch == "]" and self._array_depth is not None and self._depth == self._array_depth - 1:
+                    self._array_depth = None
+        self._pos = len(text)
+        return completed
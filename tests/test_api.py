@@ -0,0 +1,116 @@
+import http.client
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from smartplate import jobs, photo_index, response_cache, storage
+from smartplate.api import API_MAX_BODY_BYTES, start_api_server
+from smartplate.gemini_client import GeminiClient
+from smartplate.mock_gemini import start_mock_server
+
+
+def jpeg_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class ApiTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Throwaway process-wide storage, caches and job queue instead of the ones under the home directory
+        cache_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cache_dir.cleanup)
+        for module, name, value in (
+            (storage, "_storage", storage.InstrumentedStorage(storage.InMemoryStorage())),
+            (response_cache, "_cache", response_cache.ResponseCache(cache_dir=cache_dir.name)),
+            (photo_index, "_photo_index", photo_index.PhotoIndex(db_path=":memory:")),
+            (jobs, "_job_queue", jobs.JobQueue(":memory:", workers=1)),
+        ):
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+        cls.mock = start_mock_server(seed=0)
+        cls.addClassCleanup(cls.mock.server_close)
+        cls.addClassCleanup(cls.mock.shutdown)
+        cls.server = start_api_server(GeminiClient(cls.mock.api_url()), token="secret")
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.port = cls.server.server_address[1]
+
+    def request(self, method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        self.addCleanup(connection.close)
+        connection.request(method, path, body=body, headers=dict({"Authorization": "Bearer secret"}, **(headers or {})))
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def raw_request(self, head, body=b""):
+        # Headers http.client would refuse to send
+        with socket.create_connection(("127.0.0.1", self.port), timeout=5) as connection:
+            connection.sendall(head.encode("latin-1") + b"\r\n\r\n" + body)
+            response = b""
+            while b"\r\n\r\n" not in response:
+                chunk = connection.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+        return int(response.split(b" ", 2)[1])
+
+    def test_health_needs_no_token(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        self.addCleanup(connection.close)
+        connection.request("GET", "/v1/health")
+        self.assertEqual(connection.getresponse().status, 200)
+
+    def test_wrong_token_is_rejected(self):
+        status, body = self.request("POST", "/v1/guidance", body=b"{}", headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(status, 401)
+
+    def test_invalid_content_length_is_a_bad_request(self):
+        for value in ("-1", "abc", "1e3", "12, 12"):
+            with self.subTest(value=value):
+                status = self.raw_request(f"POST /v1/groceries HTTP/1.1\r\nHost: x\r\nAuthorization: Bearer secret\r\nContent-Length: {value}", b"hello")
+                self.assertEqual(status, 400)
+
+    def test_oversized_body_is_refused_without_reading_it(self):
+        status = self.raw_request(
+            f"POST /v1/groceries HTTP/1.1\r\nHost: x\r\nAuthorization: Bearer secret\r\nContent-Type: image/jpeg\r\nContent-Length: {API_MAX_BODY_BYTES + 1}"
+        )
+        self.assertEqual(status, 413)
+
+    def test_unread_body_does_not_leak_into_the_next_request(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        self.addCleanup(connection.close)
+        connection.request("POST", "/v1/nowhere", body=b'{"a": 1}', headers={"Authorization": "Bearer secret"})
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 404)
+        self.assertTrue(response.will_close)
+
+    def test_meal_photo_is_estimated_and_logged(self):
+        status, body = self.request(
+            "POST", "/v1/meals?user_id=u1&date=2026-02-01&log=1", body=jpeg_bytes((200, 120, 40)), headers={"Content-Type": "image/jpeg"}
+        )
+        self.assertEqual(status, 200, body)
+        self.assertIsNone(body["error"])
+        self.assertGreater(body["calories"], 0)
+        day_log = storage.get_storage().load_daily_log("u1", "2026-02-01")
+        self.assertEqual(len(day_log.meals_logged_from_photo), 1)
+
+    def test_wrong_image_type_is_refused(self):
+        status, body = self.request("POST", "/v1/meals?user_id=u1", body=b"GIF89a", headers={"Content-Type": "image/gif"})
+        self.assertEqual(status, 415)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from smartplate import photo_index, response_cache, storage
+from smartplate.batch import completed_ids, read_manifest, run_batch
+from smartplate.gemini_client import GeminiClient
+from smartplate.meal_plans import PER_DAY_MODE
+from smartplate.mock_gemini import start_mock_server
+
+
+def options(**overrides):
+    defaults = dict(concurrency=4, force_refresh=False, plan_days=0, meal_types=["Lunch"], mode=PER_DAY_MODE,
+                    no_library=False, no_log=False)
+    return argparse.Namespace(**dict(defaults, **overrides))
+
+
+class BatchResumeTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.mock = start_mock_server(seed=0)
+        cls.addClassCleanup(cls.mock.server_close)
+        cls.addClassCleanup(cls.mock.shutdown)
+        cls.client = GeminiClient(cls.mock.api_url())
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # Throwaway process-wide storage and caches instead of the ones under the home directory
+        self.storage = storage.InstrumentedStorage(storage.InMemoryStorage())
+        for module, name, value in (
+            (storage, "_storage", self.storage),
+            (response_cache, "_cache", response_cache.ResponseCache(cache_dir=os.path.join(self.directory, "cache"))),
+            (photo_index, "_photo_index", photo_index.PhotoIndex(db_path=":memory:")),
+        ):
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for i in range(3):
+            Image.new("RGB", (64, 64), (i * 80, 120, 60)).save(os.path.join(self.directory, f"meal{i}.jpg"))
+        self.manifest = os.path.join(self.directory, "manifest.csv")
+        self.output = os.path.join(self.directory, "results.jsonl")
+
+    def write_manifest(self, rows):
+        with open(self.manifest, "w", encoding="utf-8") as f:
+            f.write("path,kind,user_id,date,time\n" + "".join(f"{row}\n" for row in rows))
+        return read_manifest(self.manifest, "meal", "batch_user", "2026-01-05")
+
+    def run_quietly(self, items):
+        return run_batch(self.client, items, self.output, options(), log=lambda message: None)
+
+    def records(self):
+        with open(self.output, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_bad_dates_and_times_fail_only_their_rows(self):
+        items = self.write_manifest([
+            "meal0.jpg,meal,u,2026/01/05,", "meal1.jpg,meal,u,2026-01-05,25:00", "meal2.jpg,meal,u,2026-01-05,08:30"
+        ])
+        self.assertEqual(self.run_quietly(items), {"ok": 1, "error": 2, "skipped": 0})
+        errors = {record["id"]: record["error"] for record in self.records() if record["status"] == "error"}
+        self.assertIn("date must be YYYY-MM-DD", errors["meal0.jpg"])
+        self.assertIn("time must be HH:MM", errors["meal1.jpg"])
+
+    def test_rerun_skips_done_items_and_retries_failed_ones(self):
+        items = self.write_manifest(["meal0.jpg,meal,u,2026-01-05,", "missing.jpg,meal,u,2026-01-05,"])
+        self.assertEqual(self.run_quietly(items), {"ok": 1, "error": 1, "skipped": 0})
+        self.assertEqual(self.run_quietly(items), {"ok": 0, "error": 1, "skipped": 1})
+        self.assertEqual(completed_ids(self.output), {"meal0.jpg"})
+
+    def test_torn_last_line_is_ignored(self):
+        items = self.write_manifest(["meal0.jpg,meal,u,2026-01-05,"])
+        self.run_quietly(items)
+        with open(self.output, "a", encoding="utf-8") as f:
+            f.write('{"id": "meal1.jpg", "status": "o') # Killed mid-write
+        self.assertEqual(completed_ids(self.output), {"meal0.jpg"})
+
+    def test_meal_logged_before_its_line_was_lost_is_not_logged_twice(self):
+        items = self.write_manifest(["meal0.jpg,meal,u,2026-01-05,12:00", "meal1.jpg,meal,u,2026-01-05,19:00"])
+        self.run_quietly(items)
+        logged = self.storage.load_daily_log("u", "2026-01-05")
+        self.assertEqual(len(logged.meals_logged_from_photo), 2)
+        # As if the process died after logging meal1 but before its ok line was written
+        kept = [record for record in self.records() if record["id"] != "meal1.jpg"]
+        with open(self.output, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in kept)
+        self.assertEqual(self.run_quietly(items), {"ok": 1, "error": 0, "skipped": 1})
+        relogged = self.storage.load_daily_log("u", "2026-01-05")
+        self.assertEqual(len(relogged.meals_logged_from_photo), 2)
+        self.assertEqual(relogged.logged_calories, logged.logged_calories)
+
+
+if __name__ == "__main__":
+    unittest.main()
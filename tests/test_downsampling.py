@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from smartplate.downsampling import downsample_bars, downsample_line, lttb_indices
+
+
+class LttbTests(unittest.TestCase):
+    def test_keeps_the_ends_and_extremes(self):
+        rng = np.random.default_rng(3)
+        for n, threshold in ((1000, 50), (10_000, 400), (365, 7), (100, 99)):
+            with self.subTest(n=n, threshold=threshold):
+                y = rng.normal(120, 15, n)
+                x = np.arange(n)
+                indices = lttb_indices(x, y, threshold)
+                self.assertEqual(len(indices), threshold)
+                self.assertTrue(np.all(np.diff(indices) > 0))
+                self.assertEqual((indices[0], indices[-1]), (0, n - 1))
+                self.assertIn(int(np.argmax(y)), indices)
+                self.assertIn(int(np.argmin(y)), indices)
+
+    def test_single_spike_survives(self):
+        y = np.full(5000, 100.0)
+        y[1234] = 400.0 # One reading far above a flat line
+        y[4321] = 20.0
+        indices = lttb_indices(np.arange(5000), y, 100)
+        self.assertIn(1234, indices)
+        self.assertIn(4321, indices)
+
+    def test_short_series_are_unchanged(self):
+        self.assertEqual(lttb_indices(np.arange(10), np.arange(10.0), 10).tolist(), list(range(10)))
+        self.assertEqual(lttb_indices(np.arange(10), np.arange(10.0), 2).tolist(), list(range(10)))
+
+    def test_dates_and_missing_values(self):
+        frame = pd.DataFrame({"Date": pd.date_range("2020-01-01", periods=2000), "Sugar": np.linspace(80, 160, 2000)})
+        frame.loc[::7, "Sugar"] = np.nan
+        reduced = downsample_line(frame, "Sugar", max_points=200)
+        self.assertEqual(len(reduced), 200)
+        self.assertFalse(reduced["Sugar"].isna().any())
+        self.assertEqual(reduced["Sugar"].max(), frame["Sugar"].max())
+
+
+class BarTests(unittest.TestCase):
+    def test_bars_average_equal_runs(self):
+        frame = pd.DataFrame({"Date": pd.date_range("2020-01-01", periods=1000), "Steps": np.arange(1000.0)})
+        averaged, size = downsample_bars(frame, max_points=400)
+        self.assertEqual(size, 3)
+        self.assertLessEqual(len(averaged), 400)
+        self.assertEqual(averaged["Steps"].iloc[0], 1.0)
+        self.assertEqual(averaged["Date"].iloc[1], frame["Date"].iloc[3])
+        self.assertIs(downsample_bars(frame, max_points=1000)[0], frame)
+
+
+if __name__ == "__main__":
+    unittest.main()
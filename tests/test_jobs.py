@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartplate.jobs import JobQueue
+
+
+class JobRecoveryTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "jobs.db")
+        self.runs = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def handler(self, job, reporter):
+        # Does the items of params["items"] a previous run did not finish
+        self.runs.append((job["job_id"], sorted(job["results"])))
+        for key in job["params"].get("items", ["a"]):
+            if key not in job["results"]:
+                time.sleep(job["params"].get("sleep", 0))
+                reporter.item_done(key, result={"key": key})
+
+    def insert_job(self, job_id, status, owner=None, leased_until=None):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "INSERT INTO jobs (job_id, kind, user_id, status, params, created_at, owner, leased_until)"
+            " VALUES (?, 'test', 'u', ?, '{\"items\": [\"a\", \"b\"]}', ?, ?, ?)",
+            (job_id, status, time.time(), owner, leased_until)
+        )
+        conn.commit()
+        conn.close()
+
+    def queue(self, lease_seconds=30):
+        return JobQueue(self.db_path, workers=2, lease_seconds=lease_seconds)
+
+    def test_queued_job_from_an_earlier_process_runs(self):
+        self.queue() # Creates the schema
+        self.insert_job("queued-job", "queued")
+        job_queue = self.queue()
+        job_queue.register_handler("test", self.handler)
+        job = job_queue.wait("queued-job", timeout=10)
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(sorted(job["results"]), ["a", "b"])
+
+    def test_expired_lease_is_taken_over_and_resumed(self):
+        first = self.queue()
+        self.insert_job("orphan", "running", owner="dead-process", leased_until=time.time() - 1)
+        first._record_item("orphan", "a", {"key": "a"}, None, False) # Finished before its process died
+        job_queue = self.queue()
+        job_queue.register_handler("test", self.handler)
+        job = job_queue.wait("orphan", timeout=10)
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(self.runs, [("orphan", ["a"])]) # Only the missing item was redone
+
+    def test_live_lease_is_left_to_its_owner(self):
+        self.queue()
+        self.insert_job("held", "running", owner="live-process", leased_until=time.time() + 60)
+        job_queue = self.queue()
+        job_queue.register_handler("test", self.handler)
+        time.sleep(0.3)
+        self.assertEqual(job_queue.get("held")["status"], "running")
+        self.assertEqual(self.runs, [])
+
+    def test_lease_expiring_while_its_owner_is_alive_is_taken_over(self):
+        owner = self.queue(lease_seconds=0.6)
+        self.insert_job("stalled", "running", owner=owner.owner, leased_until=time.time() - 1) # Its heartbeat stopped
+        job_queue = self.queue(lease_seconds=0.6)
+        job_queue.register_handler("test", self.handler)
+        self.assertEqual(job_queue.wait("stalled", timeout=10)["status"], "done")
+        owner._finish("stalled", "failed", "late") # The stalled worker's outcome must not overwrite the takeover's
+        self.assertEqual(job_queue.get("stalled")["status"], "done")
+
+    def test_two_queues_run_a_job_once(self):
+        queues = [self.queue(lease_seconds=0.6) for _ in range(2)]
+        for job_queue in queues:
+            job_queue.register_handler("test", self.handler)
+        job_id = queues[0].submit("test", "u", {"items": ["a"], "sleep": 1.0}) # Outlives several lease periods
+        self.assertEqual(queues[0].wait(job_id, timeout=10)["status"], "done")
+        time.sleep(0.5)
+        self.assertEqual([run[0] for run in self.runs], [job_id])
+
+    def test_failed_items_are_retried(self):
+        job_queue = self.queue()
+        attempts = []
+
+        def flaky(job, reporter):
+            attempts.append(sorted(job["results"]))
+            reporter.item_done("a", result=1)
+            reporter.item_done("b", error=None if len(attempts) > 1 else "boom")
+        job_queue.register_handler("test", flaky)
+        job_id = job_queue.submit("test", "u", {})
+        self.assertEqual(job_queue.wait(job_id, timeout=10)["results"]["b"]["status"], "failed")
+        self.assertTrue(job_queue.retry_failed(job_id))
+        job = job_queue.wait(job_id, timeout=10)
+        self.assertEqual(job["results"]["b"]["status"], "done")
+        self.assertEqual(attempts, [[], ["a"]])
+
+    def test_database_from_before_leases_is_upgraded(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE jobs (job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, user_id TEXT NOT NULL, status TEXT NOT NULL,"
+            " params TEXT NOT NULL, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        conn.execute("INSERT INTO jobs VALUES ('legacy', 'test', 'u', 'running', '{}', NULL, 1, NULL, NULL)")
+        conn.commit()
+        conn.close()
+        job_queue = self.queue()
+        job_queue.register_handler("test", self.handler)
+        self.assertEqual(job_queue.wait("legacy", timeout=10)["status"], "done")
+
+
+class JobReporterThreadTests(unittest.TestCase):
+    def test_items_reported_from_several_threads_are_all_kept(self):
+        with tempfile.TemporaryDirectory() as directory:
+            job_queue = JobQueue(os.path.join(directory, "jobs.db"), workers=1)
+
+            def handler(job, reporter):
+                threads = [threading.Thread(target=reporter.item_done, args=(str(i),), kwargs={"result": i}) for i in range(20)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            job_queue.register_handler("test", handler)
+            job_id = job_queue.submit("test", "u", {})
+            self.assertEqual(len(job_queue.wait(job_id, timeout=10)["results"]), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
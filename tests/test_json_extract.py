@@ -0,0 +1,74 @@
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartplate.json_extract import JsonObjectScanner, extract_json_from_string, iter_json_objects
+
+PLAN = {"date": "2026-01-01", "meal_plan": [{"meal_type": "Lunch", "dish_name": "Soup {with} \"quotes\"", "estimated_calories": "500 kcal"}]}
+TEXTS = {
+    "fenced": "Here is your plan:\n```json\n" + json.dumps(PLAN, indent=2) + "\n```\nEnjoy!",
+    "two objects": 'a {"x": 1} b {"y": "}{\\"" } c',
+    "stray braces": "use {braces} like {this} and { \"a\": 2}",
+    "stray start": 'use {"x" here and { "a": 2}',
+    "empty object": "x { } y",
+    "malformed then good": '{"a": tru} then {"b": [1, {"c": "}"}]}',
+    "escapes": '{"k": "a\\\\"} {"z": "\\u007d"}',
+    "nested": json.dumps({"days": [PLAN, PLAN]}),
+    "truncated": json.dumps({"days": [PLAN, PLAN]})[:-40],
+    "no object": "Sorry, I cannot help with that.",
+}
+
+
+def feed_in_chunks(text, cuts):
+    scanner = JsonObjectScanner()
+    found = []
+    previous = 0
+    for cut in list(cuts) + [len(text)]:
+        found += scanner.feed(text[previous:cut])
+        previous = cut
+    return found, scanner
+
+
+class JsonExtractTests(unittest.TestCase):
+    def test_extracts_the_first_object(self):
+        self.assertEqual(extract_json_from_string(TEXTS["fenced"]), PLAN)
+        self.assertEqual(extract_json_from_string(TEXTS["stray braces"]), {"a": 2})
+        self.assertEqual(extract_json_from_string(TEXTS["malformed then good"]), {"b": [1, {"c": "}"}]})
+        self.assertEqual(extract_json_from_string("[1, 2]"), [1, 2])
+        self.assertIsNone(extract_json_from_string(TEXTS["no object"]))
+        self.assertIsNone(extract_json_from_string(TEXTS["truncated"]))
+
+    def test_chunked_scan_matches_whole_scan(self):
+        rng = random.Random(5)
+        for name, text in TEXTS.items():
+            whole = list(iter_json_objects(text))
+            splits = [range(1, len(text))] # One character at a time
+            splits += [sorted(rng.sample(range(1, len(text)), min(len(text) - 1, count))) for count in (1, 2, 5, 20) for _ in range(10)]
+            for cuts in splits:
+                with self.subTest(name=name, cuts=list(cuts)[:5]):
+                    self.assertEqual(feed_in_chunks(text, cuts)[0], whole)
+
+    def test_escaped_quotes_at_chunk_ends(self):
+        text = '{"a": "x\\"y\\\\", "b": "q\\"}"}' * 3
+        expected = list(iter_json_objects(text))
+        self.assertEqual(len(expected), 3)
+        for cut in range(1, len(text)):
+            self.assertEqual(feed_in_chunks(text, [cut])[0], expected, cut)
+
+    def test_pending_holds_an_unfinished_object(self):
+        found, scanner = feed_in_chunks(TEXTS["truncated"], [50])
+        self.assertEqual(found, [])
+        self.assertEqual(scanner.pending, TEXTS["truncated"])
+
+    def test_long_stray_prose_stays_linear(self):
+        # Many unclosed braces used to make each candidate rescan the rest of the text
+        text = "{ " * 20000 + json.dumps(PLAN)
+        self.assertEqual(extract_json_from_string(text), PLAN)
+
+
+if __name__ == "__main__":
+    unittest.main()
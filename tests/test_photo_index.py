@@ -0,0 +1,53 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartplate.photo_index import HASH_BITS, HammingIndex
+
+
+def brute_force(values, query, max_distance):
+    if max_distance < 0:
+        return []
+    return sorted((bin(value ^ query).count("1"), row) for row, value in enumerate(values) if bin(value ^ query).count("1") <= max_distance)
+
+def near(rng, value, bits):
+    for bit in rng.sample(range(HASH_BITS), bits):
+        value ^= 1 << bit
+    return value
+
+
+class HammingIndexTests(unittest.TestCase):
+    def check_against_brute_force(self, index, values, rng):
+        for _ in range(200):
+            # Queries close to stored values (so there are matches at every distance) and unrelated ones
+            query = near(rng, rng.choice(values), rng.randint(0, 14)) if rng.random() < 0.8 else rng.getrandbits(HASH_BITS)
+            for max_distance in (-1, 0, 3, 4, 8, 12, 16):
+                self.assertEqual(index.search(query, max_distance), brute_force(values, query, max_distance), (query, max_distance))
+
+    def test_search_matches_brute_force(self):
+        rng = random.Random(1)
+        values = [rng.getrandbits(HASH_BITS) for _ in range(300)]
+        values += [near(rng, rng.choice(values), rng.randint(0, 10)) for _ in range(300)] # Clusters of near-duplicates
+        values += values[:20] # Exact duplicates get their own rows
+        self.check_against_brute_force(HammingIndex(values), values, rng)
+
+    def test_pending_and_merged_values_are_both_searched(self):
+        rng = random.Random(2)
+        index = HammingIndex()
+        index.MERGE_AT = 64
+        values = []
+        for _ in range(200): # Three merges, with values left pending after the last
+            values.append(near(rng, values[-1], rng.randint(0, 12)) if values and rng.random() < 0.5 else rng.getrandbits(HASH_BITS))
+            self.assertEqual(index.add(values[-1]), len(values) - 1)
+        self.assertEqual(len(index), len(values))
+        self.check_against_brute_force(index, values, rng)
+
+    def test_empty_index(self):
+        self.assertEqual(HammingIndex().search(12345, 8), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
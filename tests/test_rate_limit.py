@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from smartplate.rate_limit import RateLimitTimeout, RequestCoalescer, TokenBucketLimiter
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TokenBucketLimiterTests(unittest.TestCase):
+    def test_users_are_served_in_rotation(self):
+        limiter = TokenBucketLimiter(requests_per_minute=1200, burst=1) # A token every 50 ms
+        limiter.acquire("warmup") # Empties the bucket, so everyone below queues
+        order = []
+        lock = threading.Lock()
+
+        def request(user):
+            limiter.acquire(user)
+            with lock:
+                order.append(user)
+        threads = [threading.Thread(target=request, args=("heavy",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.02) # The light user's two requests arrive behind all eight
+        threads += [threading.Thread(target=request, args=("light",)) for _ in range(2)]
+        for thread in threads[8:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Served heavy, light, heavy, light, ... rather than after every heavy request
+        self.assertEqual(order.count("light"), 2)
+        self.assertLessEqual(order.index("light"), 2)
+        self.assertLessEqual(len(order) - 1 - order[::-1].index("light"), 4)
+        self.assertEqual(limiter.stats()["queue_depth"], 0)
+
+    def test_waiting_too_long_times_out_and_leaves_the_queue(self):
+        limiter = TokenBucketLimiter(requests_per_minute=6, burst=1, max_wait_seconds=0.2)
+        limiter.acquire("u")
+        started = time.monotonic()
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire("u")
+        self.assertLess(time.monotonic() - started, 1.0)
+        stats = limiter.stats()
+        self.assertEqual((stats["timeouts"], stats["queue_depth"], stats["queued_by_user"]), (1, 0, {}))
+        self.assertIsInstance(RateLimitTimeout("x"), requests.exceptions.RequestException) # Handled as a network error
+
+    def test_granted_waiters_return_promptly(self):
+        limiter = TokenBucketLimiter(requests_per_minute=600, burst=4) # A token every 100 ms
+        for _ in range(4):
+            limiter.acquire("warmup")
+        waited = []
+        run_threads([lambda user=user: waited.append(limiter.acquire(user)) for user in ("a", "b", "c", "d")])
+        # Four tokens refill over 400 ms; nobody should wait much past their own token
+        self.assertLess(max(waited), 0.6)
+        self.assertEqual(limiter.stats()["granted"], 8)
+
+    def test_disabled_limiter_never_waits(self):
+        limiter = TokenBucketLimiter(requests_per_minute=0)
+        self.assertEqual([limiter.acquire("u") for _ in range(100)], [0.0] * 100)
+
+
+class RequestCoalescerTests(unittest.TestCase):
+    def test_concurrent_identical_calls_share_one_result(self):
+        coalescer = RequestCoalescer(enabled=True)
+        calls = []
+        release = threading.Event()
+
+        def upstream():
+            calls.append(1)
+            release.wait(5)
+            return {"text": "shared"}
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(coalescer.call("key", upstream))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"text": "shared"}] * 5)
+        results[0]["text"] = "changed" # Every caller gets its own copy
+        self.assertEqual(results[1]["text"], "shared")
+
+    def test_leader_error_reaches_every_follower(self):
+        coalescer = RequestCoalescer(enabled=True)
+        release = threading.Event()
+
+        def upstream():
+            release.wait(5)
+            raise requests.exceptions.HTTPError("503 Server Error")
+        errors = []
+
+        def call():
+            try:
+                coalescer.call("key", upstream)
+            except requests.exceptions.HTTPError as e:
+                errors.append(str(e))
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, ["503 Server Error"] * 4)
+        self.assertEqual(coalescer.stats()["in_flight"], 0)
+        self.assertEqual(coalescer.call("key", lambda: "fresh"), "fresh") # The failed flight is not reused
+
+    def test_followers_of_an_abandoned_stream_get_an_error(self):
+        coalescer = RequestCoalescer(enabled=True)
+
+        def upstream():
+            yield "a"
+            yield "b"
+        leader = coalescer.stream("key", upstream)
+        self.assertEqual(next(leader), "a")
+        received, errors = [], []
+
+        def follow():
+            try:
+                for chunk in coalescer.stream("key", upstream):
+                    received.append(chunk)
+            except requests.exceptions.ChunkedEncodingError as e:
+                errors.append(e)
+        follower = threading.Thread(target=follow)
+        follower.start()
+        time.sleep(0.1)
+        leader.close() # The leading caller stops reading
+        follower.join(5)
+        self.assertEqual(received, ["a"])
+        self.assertEqual(len(errors), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartplate.recipes import MEAT, RecipeLibrary, ingredient_categories, ingredient_names, preference_exclusions
+
+
+def soup(broth):
+    return {
+        "meal_type": "Lunch", "dish_name": f"Lentil Soup with {broth.title()}", "estimated_calories": "500 kcal",
+        "ingredients": ["1 cup lentils", "2 carrots", "1 onion", f"4 cups {broth}"],
+    }
+
+PROFILE = {"calorie_goal": 2000, "dietary_preferences": "", "health_conditions": ""}
+GROCERIES = "lentils, carrots, onion, chicken broth, beef stock, vegetable broth"
+
+
+class RecipeDietTests(unittest.TestCase):
+    def fill(self, broth, dietary_preferences):
+        library = RecipeLibrary(db_path=":memory:")
+        library.add_plan({"meal_plan": [soup(broth)]}, PROFILE)
+        profile = dict(PROFILE, dietary_preferences=dietary_preferences)
+        return library.fill(["2026-01-01"], profile, ["Breakfast", "Lunch", "Dinner", "Snack 1"], GROCERIES)
+
+    def test_chicken_broth_is_not_served_to_vegetarians(self):
+        self.assertTrue(ingredient_categories(ingredient_names(["4 cups chicken broth"])) & MEAT)
+        self.assertEqual(self.fill("chicken broth", "vegetarian"), {})
+
+    def test_beef_stock_is_not_served_to_vegetarians(self):
+        self.assertTrue(ingredient_categories(ingredient_names(["2 cups beef stock"])) & MEAT)
+        self.assertEqual(self.fill("beef stock", "vegetarian"), {})
+
+    def test_vegetable_broth_is_served_to_vegetarians(self):
+        self.assertIn("2026-01-01", self.fill("vegetable broth", "vegetarian"))
+
+    def test_allergies_only_reuse_the_same_profile(self):
+        self.assertFalse(preference_exclusions("nut allergy")[1])
+        self.assertEqual(self.fill("vegetable broth", "nut allergy"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
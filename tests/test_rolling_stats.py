@@ -0,0 +1,91 @@
+import os
+import random
+import sys
+import unittest
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smartplate.records import LOG_METRICS
+from smartplate.rolling_stats import ROLLING_WINDOWS, RollingStats, window_dates
+from smartplate.storage import InMemoryStorage
+
+
+def random_values(rng):
+    # Some metrics missing, some days with nothing logged at all (e.g. a saved plan)
+    if rng.random() < 0.15:
+        return (None,) * len(LOG_METRICS)
+    return tuple(rng.choice([None, round(rng.uniform(0, 3000), 1)]) for _ in LOG_METRICS)
+
+def latest_logged(rows):
+    return max((day_str for day_str, values in rows.items() if any(value is not None for value in values)), default=None)
+
+
+class RollingStatsTests(unittest.TestCase):
+    def assertSummariesEqual(self, got, want):
+        self.assertEqual(got.keys(), want.keys())
+        for metric in want:
+            self.assertEqual(got[metric].keys(), want[metric].keys(), metric)
+            for days in want[metric]:
+                for name, expected in want[metric][days].items():
+                    actual = got[metric][days][name]
+                    if expected is None or actual is None:
+                        self.assertEqual(actual, expected, (metric, days, name))
+                    else:
+                        self.assertAlmostEqual(actual, expected, delta=1e-6 * max(1.0, abs(expected)), msg=(metric, days, name))
+
+    def check_random_writes(self, seed, goal):
+        rng = random.Random(seed)
+        rows = {}
+        stats = RollingStats(goal=goal)
+        start = date(2026, 1, 1)
+        for step in range(400):
+            # Mostly days around the moving end of the log, some far back, and the occasional jump forward
+            r = rng.random()
+            if r < 0.05:
+                start += timedelta(days=rng.choice([10, ROLLING_WINDOWS[-1] + 5]))
+            offset = step // 3 + (rng.randint(-ROLLING_WINDOWS[-1] - 20, 0) if r < 0.25 else rng.randint(-4, 2))
+            changes = {}
+            for i in range(rng.choice([1, 1, 1, 3, 7])):
+                day_str = (start + timedelta(days=offset + i)).isoformat()
+                new = (None,) * len(LOG_METRICS) if rng.random() < 0.08 else random_values(rng)
+                changes[day_str] = (rows.get(day_str), new)
+            rows.update({day_str: new for day_str, (_, new) in changes.items()})
+            stats.apply(
+                changes, lambda dates: {day_str: rows[day_str] for day_str in dates if day_str in rows},
+                lambda: latest_logged(rows)
+            )
+            as_of = latest_logged(rows)
+            self.assertEqual(stats.as_of, as_of)
+            window = window_dates(as_of, ROLLING_WINDOWS[-1]) if as_of is not None else []
+            rebuilt = RollingStats.from_rows(as_of, {day_str: rows[day_str] for day_str in window if day_str in rows}, goal)
+            self.assertSummariesEqual(stats.summary(), rebuilt.summary())
+
+    def test_apply_matches_from_rows_on_random_writes(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.check_random_writes(seed, goal=2000.0)
+
+    def test_apply_matches_from_rows_without_goal(self):
+        self.check_random_writes(99, goal=None)
+
+    def test_state_survives_a_round_trip(self):
+        stats = RollingStats.from_rows("2026-03-10", {"2026-03-09": (1900.0,) + (None,) * (len(LOG_METRICS) - 1)}, 2000.0)
+        self.assertEqual(RollingStats.loads(stats.dumps()).summary(), stats.summary())
+
+    def test_storage_keeps_the_stats_current(self):
+        rng = random.Random(7)
+        storage = InMemoryStorage()
+        storage.save_profile("u", {"calorie_goal": 2000})
+        for step in range(60):
+            day_str = (date(2026, 1, 1) + timedelta(days=step + rng.randint(-20, 0))).isoformat()
+            storage.upsert_daily_logs("u", {day_str: {"logged_calories": rng.randint(1500, 2500), "logged_steps": rng.randint(0, 20000)}})
+        logs = storage.load_daily_logs("u", "0000-01-01", "9999-12-31")
+        as_of = max(logs)
+        rows = {day_str: tuple(getattr(log, name) for name in LOG_METRICS) for day_str, log in logs.items()}
+        rebuilt = RollingStats.from_rows(as_of, {day_str: rows[day_str] for day_str in window_dates(as_of, ROLLING_WINDOWS[-1]) if day_str in rows}, 2000.0)
+        self.assertSummariesEqual(storage.load_rolling_stats("u").summary(), rebuilt.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()